@@ -0,0 +1,162 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Sequence, Iterator
+
+# Prometheus text exposition format served by the /metrics endpoint
+CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+# Latency buckets (seconds) spanning sub-millisecond prompt writes to multi-minute validations
+DEFAULT_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+DEFAULT_BYTES_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(10))  # 1 KiB .. 256 MiB
+
+
+def _escape_label_value(value: str) -> str:
+    # Exposition format: backslash, double quote and line feed are escaped in label values
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _escape_help(text: str) -> str:
+    # HELP lines escape backslash and line feed only
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...]) -> str:
+    if not labelnames:
+        return ''
+    pairs = ','.join(f'{k}="{_escape_label_value(str(v))}"' for k, v in zip(labelnames, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels, e.g. Counter('jobs_total', 'Jobs run', ['status']).
+    """
+    kind = 'counter'
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[k]) for k in self.labelnames)
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError('Counters can only increase')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {v}' for k, v in items]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels; exposes _bucket, _sum and _count series.
+    """
+    kind = 'histogram'
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+    _key = Counter._key
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][i] += 1
+            series[1] += value
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames + ("le",), key + (le,))} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class StageTimer:
+    """
+    Accumulates wall-clock seconds per named stage of a request.
+    """
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._t0 = time.perf_counter()
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+
+class MetricsRegistry:
+    """
+    Holds metrics and renders them in the Prometheus text format.
+    """
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} already registered')
+            self._metrics[metric.name] = metric
+        return metric
+    def get(self, name: str):
+        return self._metrics.get(name)
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_SECONDS_BUCKETS,
+    registry: MetricsRegistry = REGISTRY
+) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = (), registry: MetricsRegistry = REGISTRY) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
@@ -0,0 +1,255 @@
+import os
+import re
+import gzip
+import shutil
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple, List
+from src.data.signed_cache import CACHE_ROOT, private_cache_dir
+from src.data.tabular_io import OUTPUT_FORMATS, resolve_output_format
+
+try:
+    import zstandard
+except ImportError:  # optional: without it only gzip variants are produced
+    zstandard = None
+
+OUTPUT_ROOT = os.getenv('SYNTH_OUTPUT_DIR', os.path.join(CACHE_ROOT, 'synthetic_outputs'))
+OUTPUT_TTL_S = float(os.getenv('SYNTH_OUTPUT_TTL_S', 24 * 3600))
+TENANT_QUOTA_BYTES = int(os.getenv('SYNTH_TENANT_QUOTA_BYTES', 5 * 1024 ** 3))
+# Formats whose bytes are not already compressed and benefit from .gz/.zst variants
+PRECOMPRESS_FORMATS = ('csv', 'arrow')
+# Content-Encoding token -> file suffix, in server preference order
+ENCODINGS = {'zstd': '.zst', 'gzip': '.gz'}
+TENANT_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+# Written into a job directory (holding the output file name) once its output is complete
+COMMIT_MARKER = '.committed'
+# Uncommitted job directories untouched this long are leftovers of crashed jobs; younger ones may be
+# in progress in another worker process sharing the root
+STALE_PARTIAL_S = float(os.getenv('SYNTH_STALE_PARTIAL_S', 3600))
+# How often TTL eviction re-reads the whole root for jobs committed by other worker processes
+RESCAN_INTERVAL_S = float(os.getenv('SYNTH_OUTPUT_RESCAN_S', 60))
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """
+    Parse an Accept-Encoding header into {coding: q}; codings with q=0 are dropped.
+    """
+    accepted = {}
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted[token] = q
+    return accepted
+
+
+class OutputStore:
+    """
+    Job-scoped storage for generated synthetic files: <root>/<tenant>/<job_id>/synthetic.<ext>.
+    Tracks size and last access per job, expires jobs after a TTL, evicts a tenant's least recently
+    used jobs when it exceeds its byte quota, and keeps precompressed .gz/.zst variants for download.
+    The directory tree is the source of truth shared by worker processes: a job is committed once its
+    COMMIT_MARKER exists, belongs to the tenant it is filed under, and its marker's mtime is its last
+    access. The in-memory registry is a cache of it, refreshed on misses, quota checks and periodically.
+    Directories are created private (0700) to the service user.
+    """
+    def __init__(
+        self,
+        root: str = OUTPUT_ROOT,
+        ttl_s: float = OUTPUT_TTL_S,
+        tenant_quota_bytes: int = TENANT_QUOTA_BYTES,
+        precompress_min_bytes: int = 1024
+    ):
+        self.root = os.path.abspath(root)
+        self.ttl_s = ttl_s
+        self.tenant_quota_bytes = tenant_quota_bytes
+        self.precompress_min_bytes = precompress_min_bytes
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        private_cache_dir(self.root)
+        self._rescan()
+    def _load_job(self, tenant: str, job_id: str, sweep: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        A committed job's registry entry read from disk, or None. With sweep, an uncommitted job directory
+        untouched for STALE_PARTIAL_S (a crashed job's partial write) is removed.
+        """
+        job_dir = os.path.join(self.root, tenant, job_id)
+        try:
+            with open(os.path.join(job_dir, COMMIT_MARKER)) as f:
+                name = f.read().strip()
+            marker_st = os.stat(os.path.join(job_dir, COMMIT_MARKER))
+            path = os.path.join(job_dir, name)
+            if name not in {'synthetic' + ext for ext, _ in OUTPUT_FORMATS.values()}:
+                raise FileNotFoundError(path)
+            st = os.stat(path)
+            size = self._dir_size(job_dir)
+        except FileNotFoundError:
+            if sweep and job_id not in self._jobs and os.path.isdir(job_dir) and time.time() - os.stat(job_dir).st_mtime > STALE_PARTIAL_S:
+                logging.info('Removing uncommitted synthetic output job %s/%s', tenant, job_id)
+                shutil.rmtree(job_dir, ignore_errors=True)
+            return None
+        return {
+            'tenant': tenant, 'dir': job_dir, 'path': path, 'committed': True,
+            'created': st.st_mtime, 'last_access': marker_st.st_mtime, 'size': size,
+        }
+    def _rescan(self, tenant: Optional[str] = None) -> None:
+        # Register committed jobs written by other (or previous) worker processes so TTL and quotas apply to
+        # them, forget jobs another worker removed, and sweep stale uncommitted ones
+        tenants = [tenant] if tenant else os.listdir(self.root)
+        for t in tenants:
+            tenant_dir = os.path.join(self.root, t)
+            if not os.path.isdir(tenant_dir):
+                continue
+            for job_id in os.listdir(tenant_dir):
+                if job_id in self._jobs or not os.path.isdir(os.path.join(tenant_dir, job_id)):
+                    continue
+                job = self._load_job(t, job_id, sweep=True)
+                if job is not None:
+                    with self._lock:
+                        self._jobs.setdefault(job_id, job)
+        with self._lock:
+            gone = [j for j, job in self._jobs.items() if job['committed'] and (tenant is None or job['tenant'] == tenant) and not os.path.isfile(job['path'])]
+            for job_id in gone:
+                del self._jobs[job_id]
+            if tenant is None:
+                self._last_rescan = time.monotonic()
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+    def allocate(self, tenant: str, output_format: str = 'csv') -> Tuple[str, str]:
+        """
+        Reserve a unique job directory and return (job_id, output file path).
+        """
+        if not TENANT_ID_RE.match(tenant):
+            raise ValueError(f'Invalid tenant id: {tenant!r}')
+        self.evict_expired()
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(private_cache_dir(os.path.join(self.root, tenant)), job_id)
+        os.mkdir(job_dir, 0o700)
+        path = os.path.join(job_dir, 'synthetic' + OUTPUT_FORMATS[resolve_output_format(output_format)][0])
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                'tenant': tenant, 'dir': job_dir, 'path': path, 'committed': False,
+                'created': now, 'last_access': now, 'size': 0,
+            }
+        return job_id, path
+    def commit(self, job_id: str) -> Dict[str, Any]:
+        """
+        Mark a job's output complete: write compressed variants, record its size and enforce the tenant quota.
+        """
+        job = self._jobs[job_id]
+        path = job['path']
+        if resolve_output_format(path=path) in PRECOMPRESS_FORMATS and os.path.getsize(path) >= self.precompress_min_bytes:
+            self._precompress(path)
+        # Last, after every variant is in place: only marked jobs survive a restart
+        marker = os.path.join(job['dir'], COMMIT_MARKER)
+        with open(marker + '.tmp', 'w') as f:
+            f.write(os.path.basename(path))
+        os.replace(marker + '.tmp', marker)
+        with self._lock:
+            job['committed'] = True
+            job['size'] = self._dir_size(job['dir'])
+            job['last_access'] = time.time()
+        self._enforce_quota(job['tenant'], keep=job_id)
+        return dict(job, job_id=job_id)
+    @staticmethod
+    def _precompress(path: str) -> None:
+        tmp = path + '.gz.tmp'
+        with open(path, 'rb') as src, gzip.open(tmp, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp, path + '.gz')
+        if zstandard is not None:
+            tmp = path + '.zst.tmp'
+            with open(path, 'rb') as src, open(tmp, 'wb') as dst:
+                zstandard.ZstdCompressor(level=10, threads=-1).copy_stream(src, dst)
+            os.replace(tmp, path + '.zst')
+    def resolve(self, job_id: str, tenant: str, accept_encoding: Optional[str] = None) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Return (file to send, content-encoding or None) for a committed, unexpired job of `tenant`, or None
+        (also for another tenant's job, so its existence is not revealed).
+        The best precompressed variant accepted by the client is chosen; access refreshes LRU order.
+        A job unknown to this process (committed by another worker) is looked up on disk.
+        """
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and JOB_ID_RE.match(job_id) and TENANT_ID_RE.match(tenant):
+            job = self._load_job(tenant, job_id)
+            if job is not None:
+                with self._lock:
+                    job = self._jobs.setdefault(job_id, job)
+        with self._lock:
+            if job is None or not job['committed'] or job['tenant'] != tenant:
+                return None
+            if not os.path.isfile(job['path']):
+                # Removed by another worker
+                self._jobs.pop(job_id, None)
+                return None
+            expired = now - job['created'] > self.ttl_s
+            if not expired:
+                job['last_access'] = now
+        if expired:
+            self.remove(job_id)
+            return None
+        try:
+            # Shared last-access time for LRU eviction in every worker
+            os.utime(os.path.join(job['dir'], COMMIT_MARKER), (now, now))
+        except OSError:
+            pass
+        accepted = parse_accept_encoding(accept_encoding)
+        ranked = sorted(ENCODINGS, key=lambda enc: -accepted.get(enc, accepted.get('*', 0.0)))
+        for enc in ranked:
+            if accepted.get(enc, accepted.get('*', 0.0)) > 0 and os.path.isfile(job['path'] + ENCODINGS[enc]):
+                return job['path'] + ENCODINGS[enc], enc
+        return job['path'], None
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            shutil.rmtree(job['dir'], ignore_errors=True)
+    def evict_expired(self, now: Optional[float] = None) -> List[str]:
+        if time.monotonic() - self._last_rescan > RESCAN_INTERVAL_S:
+            self._rescan()
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [j for j, job in self._jobs.items() if now - job['created'] > self.ttl_s]
+        for job_id in expired:
+            self.remove(job_id)
+        if expired:
+            logging.info('Evicted %d expired synthetic output jobs', len(expired))
+        return expired
+    def usage(self, tenant: str) -> int:
+        self._rescan(tenant)
+        with self._lock:
+            return sum(job['size'] for job in self._jobs.values() if job['tenant'] == tenant)
+    def _enforce_quota(self, tenant: str, keep: Optional[str] = None) -> List[str]:
+        evicted = []
+        self._rescan(tenant)
+        with self._lock:
+            candidates = sorted(
+                (job['last_access'], j, job['size']) for j, job in self._jobs.items()
+                if job['tenant'] == tenant and job['committed'] and j != keep
+            )
+            used = sum(job['size'] for job in self._jobs.values() if job['tenant'] == tenant)
+        for _, job_id, size in candidates:
+            if used <= self.tenant_quota_bytes:
+                break
+            used -= size
+            self.remove(job_id)
+            evicted.append(job_id)
+        if evicted:
+            logging.info('Tenant %s over quota; evicted LRU jobs %s', tenant, evicted)
+        return evicted
@@ -1,14 +1,23 @@
 import os
 import json
+import hashlib
 import logging
+import threading
 import time
-from typing import Dict, Any, Optional
-from fastapi import FastAPI, HTTPException, Depends, status
+from concurrent.futures import Future
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Any, Optional, Callable, Tuple
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, status
 from fastapi.security.api_key import APIKeyHeader
 from pydantic import BaseModel, Field, validator
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, Response, PlainTextResponse
 from starlette.middleware.cors import CORSMiddleware
+from src.data.tabular_io import OUTPUT_FORMATS, resolve_output_format, read_tabular_file
 from src.models.synthetic_healthcare_data_pipeline import sample_synthetic_data, minimum_viable_quality_checks
+from src.api.output_store import OutputStore, TENANT_ID_RE
+from src.prompts.clinical_note_generation import NoteGenerationEngine, backend_from_env, note_backend_kind
+from src.prompts.note_cache import NoteCache, NOTE_CACHE_PATH
+from src.api.metrics import REGISTRY, CONTENT_TYPE_LATEST, DEFAULT_BYTES_BUCKETS, StageTimer, counter, histogram
 
 # --- Authentication Setup ---
 API_KEY = os.getenv('HEALTH_API_KEY', 'dev-secret')
@@ -23,6 +32,16 @@ def get_api_key(key: Optional[str] = Depends(api_key_header)) -> str:
         detail='Invalid or missing API Key',
     )
 
+# --- Tenancy & Output Storage ---
+DEFAULT_TENANT = 'default'
+output_store = OutputStore()
+
+def get_tenant(x_tenant_id: Optional[str] = Header(None, alias='X-TENANT-ID')) -> str:
+    tenant = x_tenant_id or DEFAULT_TENANT
+    if not TENANT_ID_RE.match(tenant):
+        raise HTTPException(status_code=400, detail='Invalid X-TENANT-ID header')
+    return tenant
+
 # --- Logging Setup ---
 LOGDIR = os.getenv('SYNTH_API_LOGDIR', 'logs')
 os.makedirs(LOGDIR, exist_ok=True)
@@ -51,53 +70,229 @@ class SyntheticDataBatchRequest(BaseModel):
     num_records: int = Field(..., ge=1, le=10000)
     model_config_path: str = Field(..., description='JSON config for generative model, includes data_path, latent_dim, batch_size, etc.')
     trained_model_path: str = Field(..., description='Path to trained generative model weights')
-    output_csv_path: Optional[str] = Field(None, description='Write generated CSV here; if not supplied, create a file in /tmp')
+    output_format: str = Field('csv', description='Output file format: csv, parquet (zstd) or arrow (Feather v2).')
+    output_csv_path: Optional[str] = Field(None, description='Write generated data here; if not supplied, a job-scoped file is allocated in the managed output store')
     real_data_csv_path: Optional[str] = Field(None, description='Path to real/ground-truth data CSV for quality & privacy check')
     validation_thresholds: Optional[Dict[str, float]] = Field(None, description='Quality/privacy thresholds e.g. {"feature_mse": 1.0, "silhouette": 0.1, "mirisk": 0.05}')
     prompt_template: Optional[str] = Field(None, description='If clinical notes required, prompt template for LLM-based generation.')
     prompt_vars: Optional[Dict[str, Any]] = Field(None)
+    generate_notes: bool = Field(False, description='Generate one clinical note per synthetic record (JSONL) from prompt_template; needs a configured NOTE_BACKEND.')
+    seed: Optional[int] = Field(None, description='Sampling seed; identical requests with the same seed return identical data.')
     @validator('model_config_path', 'trained_model_path')
     def must_exist(cls, v):
         if not os.path.isfile(v):
             raise ValueError(f'File {v} does not exist')
         return v
-    @validator('output_csv_path', always=True)
-    def default_output(cls, v, values):
-        if v:
-            return v
-        base = f'synthetic_{int(time.time())}_{os.getpid()}.csv'
-        return os.path.join('/tmp', base)
+    @validator('generate_notes')
+    def notes_need_template(cls, v, values):
+        if v and not values.get('prompt_template'):
+            raise ValueError('generate_notes requires prompt_template')
+        return v
+    @validator('output_format')
+    def supported_format(cls, v):
+        return resolve_output_format(v)
+    @validator('output_csv_path')
+    def extension_matches_format(cls, v, values):
+        # Validation and download read the format (and media type) back from the extension
+        if v is not None and 'output_format' in values and resolve_output_format(path=v) != values['output_format']:
+            expected = OUTPUT_FORMATS[values['output_format']][0]
+            raise ValueError(f"output_csv_path {v!r} does not match output_format '{values['output_format']}' (expected a {expected} file)")
+        return v
 
 # --- API Output Schema ---
 class SyntheticDataBatchResponse(BaseModel):
     synthetic_data_file: str
+    job_id: Optional[str] = None
     validation_report: Optional[Dict[str, Any]]
     download_url: str
     generation_time_seconds: float
     detail: str
+    coalesced: bool = False
+    stage_timings: Dict[str, float] = Field(default_factory=dict, description='Seconds per stage: prompt_persist, model_load, sampling, write, validation, note_generation, register')
+    notes_file: Optional[str] = None
+    notes_report: Optional[Dict[str, Any]] = None
+    bytes_written: int = 0
 
 # --- Prompt Engineering Support ---
 class PromptFormat(BaseModel):
     prompt_template: str
     prompt_vars: Dict[str, Any]
 
+# --- Clinical Note Generation ---
+# Shared across requests: re-running a batch (or overlapping batches) reuses notes for identical prompts.
+# Opened on first use, not at import, at NOTE_CACHE_PATH (read from the environment at that point)
+_note_cache: Optional[NoteCache] = None
+_note_cache_lock = threading.Lock()
+
+def get_note_cache() -> NoteCache:
+    global _note_cache
+    with _note_cache_lock:
+        if _note_cache is None:
+            _note_cache = NoteCache(os.getenv('NOTE_CACHE_PATH', NOTE_CACHE_PATH))
+        return _note_cache
+
+def generate_clinical_notes(
+    synth_file: str,
+    prompt_template: str,
+    prompt_vars: Optional[Dict[str, Any]],
+    notes_path: str
+) -> Dict[str, Any]:
+    """
+    Render prompt_template once per synthetic record (the tabular row, as JSON, is supplied as {record})
+    and generate notes through the configured backend (NOTE_BACKEND), writing them to notes_path as JSONL.
+    Any notes already at notes_path belong to an earlier job and are replaced, never resumed.
+    """
+    df = read_tabular_file(synth_file)
+    records = ({'id': i, 'record': row} for i, row in enumerate(df.to_dict('records')))
+    engine = NoteGenerationEngine(
+        backend_from_env(), templates=[prompt_template], default_params=prompt_vars, cache=get_note_cache(), payload_field='record'
+    )
+    return engine.run(records, notes_path, resume=False)
+
 # --- Output Validation Criteria ---
+# Opt-in: validate against cached reference profiles (faster, but feature_mse/membership risk are defined
+# differently, so existing thresholds need retuning)
+QUALITY_USE_PROFILE = os.getenv('SYNTH_QUALITY_USE_PROFILE', '0') == '1'
+
 def check_synthetic_data_privacy(
     synth_file: str,
     real_file: Optional[str],
     thresholds: Optional[Dict[str, float]],
 ) -> Dict[str, Any]:
     if real_file and thresholds:
-        return minimum_viable_quality_checks(real_file, synth_file, thresholds)
+        return minimum_viable_quality_checks(real_file, synth_file, thresholds, use_profile=QUALITY_USE_PROFILE)
     return {'note': 'No ground-truth validation performed, only format compliance checked.'}
 
+# --- Stage Metrics ---
+STAGE_SECONDS = histogram('synthetic_generate_stage_seconds', 'Time spent per generation stage.', ['stage'])
+REQUEST_SECONDS = histogram('synthetic_generate_request_seconds', 'End-to-end generation time by outcome.', ['status'])
+BYTES_WRITTEN = histogram('synthetic_generate_bytes_written', 'Bytes written per generation (data, prompt and compressed variants).', buckets=DEFAULT_BYTES_BUCKETS)
+# Requests slower than this (or any stage over its entry in SYNTH_STAGE_SLO_S, a JSON object) are logged as exemplars
+SLOW_REQUEST_S = float(os.getenv('SYNTH_SLOW_REQUEST_S', 30))
+
+def parse_stage_slos(raw: Optional[str]) -> Dict[str, float]:
+    """
+    {stage: seconds} from a JSON object; a malformed value is logged and ignored rather than stopping the service.
+    """
+    try:
+        slos = json.loads(raw or '{}')
+        if not isinstance(slos, dict):
+            raise ValueError('expected a JSON object')
+        return {str(stage): float(seconds) for stage, seconds in slos.items()}
+    except (TypeError, ValueError) as e:
+        logging.warning('Ignoring invalid SYNTH_STAGE_SLO_S %r: %s', raw, e)
+        return {}
+
+STAGE_SLO_S: Dict[str, float] = parse_stage_slos(os.getenv('SYNTH_STAGE_SLO_S'))
+
+def _record_stage_metrics(timer: StageTimer, status_label: str, bytes_written: int, context: Dict[str, Any]) -> None:
+    total = timer.elapsed()
+    for stage, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    REQUEST_SECONDS.observe(total, status=status_label)
+    if status_label == 'success':
+        BYTES_WRITTEN.observe(bytes_written)
+    breached = {s: t for s, t in timer.stages.items() if s in STAGE_SLO_S and t > STAGE_SLO_S[s]}
+    if total > SLOW_REQUEST_S or breached:
+        logging.warning(
+            'Slow generation exemplar: total=%.3fs status=%s stages=%s slo_breaches=%s bytes=%d request=%s',
+            total, status_label, {s: round(t, 4) for s, t in timer.stages.items()}, sorted(breached), bytes_written, context
+        )
+
+# --- Request Coalescing ---
+SINGLEFLIGHT_CALLS = counter(
+    'synthetic_generate_singleflight_total',
+    'Generation requests by single-flight role: leader ran the work, follower attached to an in-flight call.',
+    ['role']
+)
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution: the first caller (leader) runs the
+    function, later callers block on the leader's Future and receive its result or exception.
+    Keys are forgotten once the call finishes, so results are never served after completion.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn once per in-flight key; returns (result, shared) where shared is True for followers.
+        """
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._calls[key] = fut
+        if not leader:
+            SINGLEFLIGHT_CALLS.inc(role='follower')
+            return fut.result(), True
+        SINGLEFLIGHT_CALLS.inc(role='leader')
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+generation_flight = SingleFlight()
+
+def _file_identity(path: Optional[str]) -> Optional[Tuple[str, int, int]]:
+    if not path or not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+def generation_key(req: SyntheticDataBatchRequest, tenant: str) -> str:
+    """
+    Canonical key for a generation request: every request field plus the tenant and the identity
+    (path, size, mtime) of the model, config and real-data files, so retrained weights never coalesce.
+    """
+    payload = req.dict()
+    payload['tenant'] = tenant
+    payload['files'] = [_file_identity(p) for p in (req.trained_model_path, req.model_config_path, req.real_data_csv_path)]
+    blob = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
 # --- API Implementation ---
 @app.post('/api/v1/generate', response_model=SyntheticDataBatchResponse, status_code=201, dependencies=[Depends(get_api_key)])
 def generate_synthetic_data(
-    req: SyntheticDataBatchRequest
+    req: SyntheticDataBatchRequest,
+    tenant: str = Depends(get_tenant)
 ) -> SyntheticDataBatchResponse:
-    t0 = time.time()
+    # Identical concurrent requests share one sampling/validation run, its output file and its report
+    resp_obj, shared = generation_flight.do(generation_key(req, tenant), lambda: _run_generation(req, tenant))
+    if shared:
+        logging.info('Coalesced generation request onto in-flight job: %s', resp_obj.synthetic_data_file)
+        return resp_obj.copy(update={'coalesced': True})
+    return resp_obj
+
+def _run_generation(req: SyntheticDataBatchRequest, tenant: str) -> SyntheticDataBatchResponse:
+    timer = StageTimer()
+    job_id = None
+    output_path = req.output_csv_path
+    written = []
+    bytes_written = 0
+    status_label = 'error'
+    context = {'tenant': tenant, 'num_records': req.num_records, 'model': req.trained_model_path, 'format': req.output_format}
     try:
+        if req.generate_notes:
+            # Refuse before sampling rather than after: notes need a real backend configured on the server
+            try:
+                note_backend_kind()
+            except ValueError as e:
+                raise HTTPException(status_code=503, detail=f'Clinical note generation is not available: {e}')
+        if output_path is None:
+            job_id, output_path = output_store.allocate(tenant, req.output_format)
         logging.info('Received batch generation request: num_records=%s model=%s', req.num_records, req.trained_model_path)
         # Step 1: (prompt engineering) Compose and save prompts if needed (LLM scenario)
         if req.prompt_template and req.prompt_vars:
@@ -105,61 +300,156 @@ def generate_synthetic_data(
                 prompt_template=req.prompt_template,
                 prompt_vars=req.prompt_vars
             )
-            prompt_f = os.path.splitext(req.output_csv_path)[0] + '_prompt.json'
-            with open(prompt_f, 'w') as f:
-                json.dump({'template': prompt_instance.prompt_template, 'vars': prompt_instance.prompt_vars}, f)
+            prompt_f = os.path.splitext(output_path)[0] + '_prompt.json'
+            with timer.stage('prompt_persist'):
+                with open(prompt_f, 'w') as f:
+                    json.dump({'template': prompt_instance.prompt_template, 'vars': prompt_instance.prompt_vars}, f)
+            written.append(prompt_f)
             logging.info('Saved prompt instance to %s', prompt_f)
-        # Step 2: Trigger synthetic sample generation
+        # Step 2: Trigger synthetic sample generation (reports model_load / sampling / write spans)
+        sample_timings: Dict[str, float] = {}
+        t_sample = time.perf_counter()
         sample_synthetic_data(
             model_path=req.trained_model_path,
             config_path=req.model_config_path,
             num_samples=req.num_records,
-            output_path=req.output_csv_path
+            output_path=output_path,
+            output_format=req.output_format,
+            seed=req.seed,
+            timings=sample_timings
         )
-        logging.info('Synthetic data generated: %s', req.output_csv_path)
+        if not sample_timings:
+            sample_timings['sampling'] = time.perf_counter() - t_sample
+        for stage, seconds in sample_timings.items():
+            timer.add(stage, seconds)
+        written.append(output_path)
+        logging.info('Synthetic data generated: %s', output_path)
         # Step 3: Validate output privacy/utility criteria
-        val_report = check_synthetic_data_privacy(
-            synth_file=req.output_csv_path,
-            real_file=req.real_data_csv_path,
-            thresholds=req.validation_thresholds
-        )
+        with timer.stage('validation'):
+            val_report = check_synthetic_data_privacy(
+                synth_file=output_path,
+                real_file=req.real_data_csv_path,
+                thresholds=req.validation_thresholds
+            )
         passed = val_report.get('passed', True)
         if not passed:
             logging.error('Output failed privacy/utility thresholds: %s', val_report)
             raise HTTPException(status_code=422, detail=f'Synthetic data did not pass privacy/utility checks: {val_report}')
-        # Step 4: Log generation metadata
-        t1 = time.time()
+        # Step 3b: Generate clinical notes for the accepted records when requested
+        notes_file, notes_report = None, None
+        if req.generate_notes:
+            notes_file = os.path.splitext(output_path)[0] + '_notes.jsonl'
+            with timer.stage('note_generation'):
+                notes_report = generate_clinical_notes(output_path, req.prompt_template, req.prompt_vars, notes_file)
+            written.append(notes_file)
+        # Step 4: Register output (compressed variants, quota) and log generation metadata
+        with timer.stage('register'):
+            if job_id:
+                bytes_written = output_store.commit(job_id)['size']
+                download_url = f'/api/v1/download?job={job_id}'
+            else:
+                bytes_written = sum(os.path.getsize(p) for p in written if os.path.isfile(p))
+                download_url = f'/api/v1/download?file={output_path}'
+        status_label = 'success'
         resp_obj = SyntheticDataBatchResponse(
-            synthetic_data_file=req.output_csv_path,
+            synthetic_data_file=output_path,
+            job_id=job_id,
             validation_report=val_report,
-            download_url=f'/api/v1/download?file={req.output_csv_path}',
-            generation_time_seconds=t1 - t0,
-            detail='Synthetic data generated successfully.'
+            download_url=download_url,
+            generation_time_seconds=timer.elapsed(),
+            detail='Synthetic data generated successfully.',
+            stage_timings=timer.stages,
+            bytes_written=bytes_written,
+            notes_file=notes_file,
+            notes_report=notes_report
         )
-        logging.info('Batch success. Output: %s, metrics: %s', req.output_csv_path, val_report)
+        logging.info('Batch success. Output: %s, stages: %s, metrics: %s', output_path, timer.stages, val_report)
         return resp_obj
+    except HTTPException as e:
+        status_label = 'rejected' if e.status_code == 422 else 'error'
+        if job_id:
+            output_store.remove(job_id)
+        raise
     except Exception as e:
+        if job_id:
+            output_store.remove(job_id)
         logging.exception('Synthetic data generation failed: %s', str(e))
         raise HTTPException(status_code=500, detail=f'Failed to generate batch: {str(e)}')
+    finally:
+        _record_stage_metrics(timer, status_label, bytes_written, context)
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """
+    Evaluate If-None-Match / If-Modified-Since preconditions (RFC 9110 13.1); If-None-Match takes precedence.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _file_response(request: Request, path: str, filename: str, encoding: Optional[str] = None) -> Response:
+    media_type = OUTPUT_FORMATS[resolve_output_format(path=filename)][1]
+    # Strong validator from size + mtime: lets clients resume (If-Range) or revalidate cached copies
+    st = os.stat(path)
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers = {'ETag': etag, 'Last-Modified': formatdate(st.st_mtime, usegmt=True), 'Accept-Ranges': 'bytes'}
+    if encoding:
+        headers.update({'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+    # FileResponse serves single/multi-part Range requests, honours If-Range against these headers, and
+    # hands the path to the server (http.response.pathsend -> sendfile) when the ASGI server supports it
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=st)
 
 @app.get('/api/v1/download')
-def download_synthetic_file(file: str, key: str = Depends(get_api_key)):
+def download_synthetic_file(
+    request: Request,
+    file: Optional[str] = None,
+    job: Optional[str] = None,
+    key: str = Depends(get_api_key),
+    tenant: str = Depends(get_tenant)
+):
+    if job:
+        # Managed outputs are looked up in the store registry; no filesystem path is taken from the client,
+        # and a job is only served to the tenant that created it
+        resolved = output_store.resolve(job, tenant, request.headers.get('accept-encoding'))
+        if resolved is None:
+            raise HTTPException(status_code=404, detail='Job output not found or expired')
+        path, encoding = resolved
+        filename = os.path.basename(path[:-len('.gz')] if encoding == 'gzip' else path[:-len('.zst')] if encoding else path)
+        return _file_response(request, path, filename, encoding)
+    if not file:
+        raise HTTPException(status_code=400, detail="Either 'job' or 'file' must be provided")
     # Security improvement: restrict downloads to valid directories (e.g., /tmp or LOGDIR), and prevent path traversal
-    allowed_dirs = ['/tmp', os.path.abspath(LOGDIR)]
+    allowed_dirs = ['/tmp', os.path.abspath(LOGDIR), output_store.root]
     abs_path = os.path.abspath(file)
     if not os.path.isfile(abs_path):
         raise HTTPException(status_code=404, detail='File not found')
+    # Managed outputs by path are subject to the same tenant scoping as job downloads
+    if abs_path.startswith(output_store.root + os.sep) and not abs_path.startswith(os.path.join(output_store.root, tenant) + os.sep):
+        raise HTTPException(status_code=404, detail='File not found')
     # Ensure the requested file is inside an allowed output directory
     if not any(abs_path.startswith(os.path.abspath(d) + os.sep) or abs_path == os.path.abspath(d) for d in allowed_dirs):
         logging.warning('Attempted file download outside allowed directories: %s', abs_path)
         raise HTTPException(status_code=403, detail='Download not permitted outside allowed output directories')
-    filename = os.path.basename(abs_path)
-    return FileResponse(abs_path, media_type='text/csv', filename=filename)
+    return _file_response(request, abs_path, os.path.basename(abs_path))
 
 @app.get('/api/v1/healthz')
 def readiness():
     return {'status': 'ready'}
 
+# Same API key as the other routes: labels and exemplar timings describe tenants' workloads
+@app.get('/metrics', dependencies=[Depends(get_api_key)])
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
 # ----------------------------
 # Notes on Fixes & Security:
 #  - Removed all unused imports (List, Request, status from fastapi, validator from pydantic is needed, all others are used).
@@ -0,0 +1,236 @@
+import os
+import json
+import hashlib
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from src.data.signed_cache import CACHE_ROOT, private_cache_dir
+
+try:
+    import blake3
+except ImportError:  # optional: multi-threaded BLAKE3 over a memory map
+    blake3 = None
+try:
+    import xxhash
+except ImportError:  # optional: non-cryptographic XXH3-128
+    xxhash = None
+
+# Fastest installed algorithm unless HASH_ALGORITHM pins one ('blake3', 'xxh3_128' or 'blake2b')
+HASH_ALGORITHM = os.getenv('HASH_ALGORITHM', 'blake3' if blake3 else 'xxh3_128' if xxhash else 'blake2b')
+HASH_CHUNK_BYTES = int(os.getenv('HASH_CHUNK_BYTES', 16 << 20))
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', 4))
+# Persistent digest index, one JSON file per data directory, kept in the private cache rather than next
+# to the data (data directories may be read-only, shared or sensitive)
+HASH_INDEX_DIR = os.getenv('HASH_INDEX_DIR', os.path.join(CACHE_ROOT, 'content_hashes'))
+# File digests kept in process memory, most recently used last
+HASH_MEMO_ENTRIES = int(os.getenv('HASH_MEMO_ENTRIES', 4096))
+
+FileKey = Tuple[str, int, int, int]
+
+
+def available_algorithms() -> List[str]:
+    return [name for name, mod in (('blake3', blake3), ('xxh3_128', xxhash), ('blake2b', hashlib)) if mod is not None]
+
+
+def _file_key(path: str) -> FileKey:
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def hash_file(path: str, algorithm: str = HASH_ALGORITHM, chunk_bytes: int = HASH_CHUNK_BYTES) -> str:
+    """
+    Digest of a file's bytes as '<algorithm>:<hex>'. BLAKE3 hashes a memory map with all cores; the others
+    stream fixed-size chunks into one reused buffer (hashlib and xxhash release the GIL while hashing).
+    """
+    if algorithm == 'blake3':
+        if blake3 is None:
+            raise ImportError('blake3 is not installed')
+        hasher = blake3.blake3(max_threads=blake3.blake3.AUTO)
+        if os.path.getsize(path):
+            hasher.update_mmap(path)
+        return f'blake3:{hasher.hexdigest()}'
+    if algorithm == 'xxh3_128':
+        if xxhash is None:
+            raise ImportError('xxhash is not installed')
+        hasher = xxhash.xxh3_128()
+    elif algorithm == 'blake2b':
+        hasher = hashlib.blake2b(digest_size=20)
+    else:
+        raise ValueError(f'Unknown hash algorithm {algorithm!r}; available: {available_algorithms()}')
+    buf = bytearray(chunk_bytes)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return f'{algorithm}:{hasher.hexdigest()}'
+
+
+class HashingService:
+    """
+    Content hashes cached by (path, size, mtime, inode): an in-process memo, then a persistent JSON index
+    under index_dir keyed by absolute path (shared across runs and processes), then a full hash. An
+    unchanged file costs a stat and a lookup, whatever its size. Nothing is written next to the data.
+    hash_many() hashes cache misses in parallel threads.
+    """
+    def __init__(
+        self,
+        algorithm: str = HASH_ALGORITHM,
+        chunk_bytes: int = HASH_CHUNK_BYTES,
+        max_workers: int = HASH_WORKERS,
+        use_sidecar: bool = True,
+        memo_entries: int = HASH_MEMO_ENTRIES,
+        index_dir: Optional[str] = None
+    ):
+        if algorithm not in ('blake3', 'xxh3_128', 'blake2b'):
+            raise ValueError(f'Unknown hash algorithm {algorithm!r}; available: {available_algorithms()}')
+        self.algorithm = algorithm
+        self.chunk_bytes = chunk_bytes
+        self.max_workers = max_workers
+        self.use_sidecar = use_sidecar
+        self.index_dir = index_dir or HASH_INDEX_DIR
+        self.memo_entries = memo_entries
+        self.stats = {'memo_hits': 0, 'index_hits': 0, 'hashed': 0, 'bytes_hashed': 0, 'hash_seconds': 0.0}
+        self._memo: "OrderedDict[FileKey, str]" = OrderedDict()
+        self._lock = threading.Lock()
+    def index_path(self, path: str) -> str:
+        # One index per data directory, named by a digest of the directory's absolute path
+        directory = os.path.dirname(os.path.abspath(path))
+        return os.path.join(self.index_dir, hashlib.blake2b(directory.encode('utf-8'), digest_size=16).hexdigest() + '.json')
+    @staticmethod
+    def _read_index(index_path: str) -> Dict[str, Any]:
+        try:
+            with open(index_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning('Ignoring unreadable hash index %s: %s', index_path, e)
+            return {}
+    def _lookup(self, key: FileKey) -> Optional[str]:
+        with self._lock:
+            digest = self._memo.get(key)
+            if digest is not None:
+                self._memo.move_to_end(key)
+                self.stats['memo_hits'] += 1
+                return digest
+        if not self.use_sidecar:
+            return None
+        entry = self._read_index(self.index_path(key[0])).get(key[0])
+        if entry and (entry['size'], entry['mtime_ns'], entry['inode']) == key[1:] and self.algorithm in entry['digests']:
+            digest = entry['digests'][self.algorithm]
+            with self._lock:
+                self._remember({key: digest})
+                self.stats['index_hits'] += 1
+            return digest
+        return None
+    def _remember(self, entries: Dict[FileKey, str]) -> None:
+        # Caller holds the lock
+        for key, digest in entries.items():
+            self._memo[key] = digest
+            self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_entries:
+            self._memo.popitem(last=False)
+    def _record(self, entries: Dict[FileKey, str]) -> None:
+        with self._lock:
+            self._remember(entries)
+        if not self.use_sidecar:
+            return
+        by_index: Dict[str, Dict[FileKey, str]] = {}
+        for key, digest in entries.items():
+            by_index.setdefault(self.index_path(key[0]), {})[key] = digest
+        for index_path, updates in by_index.items():
+            with self._lock:
+                # Re-read and merge, keeping entries other processes wrote since our lookup
+                index = self._read_index(index_path)
+                for (path, size, mtime_ns, inode), digest in updates.items():
+                    old = index.get(path, {})
+                    same = (old.get('size'), old.get('mtime_ns'), old.get('inode')) == (size, mtime_ns, inode)
+                    digests = dict(old.get('digests', {})) if same else {}
+                    digests[self.algorithm] = digest
+                    index[path] = {'size': size, 'mtime_ns': mtime_ns, 'inode': inode, 'digests': digests}
+                try:
+                    fd, tmp = tempfile.mkstemp(dir=private_cache_dir(self.index_dir), suffix='.tmp')
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(index, f, indent=1, sort_keys=True)
+                    os.replace(tmp, index_path)
+                except OSError as e:  # unusable cache directory: the in-process memo still applies
+                    logging.warning('Could not update hash index %s: %s', index_path, e)
+    def _compute(self, key: FileKey) -> str:
+        t0 = time.perf_counter()
+        digest = hash_file(key[0], self.algorithm, self.chunk_bytes)
+        with self._lock:
+            self.stats['hashed'] += 1
+            self.stats['bytes_hashed'] += key[1]
+            self.stats['hash_seconds'] += time.perf_counter() - t0
+        return digest
+    def hash(self, path: str) -> str:
+        key = _file_key(path)
+        digest = self._lookup(key)
+        if digest is None:
+            digest = self._compute(key)
+            self._record({key: digest})
+        return digest
+    def hash_many(self, paths: Iterable[str]) -> Dict[str, str]:
+        """
+        path -> digest for many files; misses are hashed concurrently and recorded with one index write
+        per directory.
+        """
+        keys = {path: _file_key(path) for path in paths}
+        digests = {path: self._lookup(key) for path, key in keys.items()}
+        missing = [path for path, digest in digests.items() if digest is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(missing)))) as pool:
+                computed = dict(zip(missing, pool.map(lambda p: self._compute(keys[p]), missing)))
+            digests.update(computed)
+            self._record({keys[p]: d for p, d in computed.items()})
+        return digests
+
+
+_default_service: Optional[HashingService] = None
+
+
+def content_version(path: str) -> str:
+    """
+    Dataset version of a file: its cached content hash from the process-wide HashingService.
+    """
+    global _default_service
+    if _default_service is None:
+        _default_service = HashingService()
+    return _default_service.hash(path)
+
+
+def benchmark_hashing(size_mb: int = 512, workdir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    MB/second of each installed algorithm on a fresh file, and the latency of versioning it unchanged
+    (persistent index hit in a new service, as in a new pipeline run).
+    """
+    own_dir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='hash_bench_')
+    try:
+        path = os.path.join(workdir, 'data.bin')
+        block = os.urandom(1 << 20)
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(block)
+        report = {'size_mb': size_mb}
+        for algorithm in available_algorithms():
+            t0 = time.perf_counter()
+            hash_file(path, algorithm)
+            report[f'{algorithm}_mb_per_second'] = size_mb / (time.perf_counter() - t0)
+        index_dir = os.path.join(workdir, 'index')
+        HashingService(index_dir=index_dir).hash(path)
+        t0 = time.perf_counter()
+        HashingService(index_dir=index_dir).hash(path)
+        report['unchanged_lookup_ms'] = (time.perf_counter() - t0) * 1000
+        return report
+    finally:
+        if own_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -7,6 +7,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from pathlib import Path
+from src.data.phi_scrubbing import PHIScrubber, DEFAULT_PHI_PATTERNS, SCRUB_WORKERS
 
 class FHIRMapper:
     """
@@ -59,30 +60,40 @@ class FHIRMapper:
 class Deidentifier:
     """
     De-identifies sensitive patient information from structured and unstructured fields.
+    Free text is redacted by a single-pass PHIScrubber; custom pii_patterns are combined the same way.
     """
     def __init__(self, pii_patterns: List[str]=None):
         if pii_patterns is None:
-            self.pii_patterns = [
-                r'(?:\d{3}-\d{2}-\d{4}|\d{9})', # SSNs
-                r"(?:[A-Z][a-z]+,? [A-Z][a-z]+)", # Names
-                r"(?:\d{1,2}/\d{1,2}/\d{2,4})", # Dates
-                r"(?:\(?\d{3}\)?[\s-]?\d{3}-\d{4})", # Phones
-                r"\w+@\w+\.\w{2,}", # Emails
-            ]
+            self.pii_patterns = list(DEFAULT_PHI_PATTERNS.values())
+            self.scrubber = PHIScrubber()
         else:
             self.pii_patterns = pii_patterns
-        self.compiled_patterns = [re.compile(p, re.IGNORECASE) for p in self.pii_patterns]
+            # Custom patterns keep the previous case-insensitive matching
+            self.scrubber = PHIScrubber({f'pattern_{i}': f'(?i:{p})' for i, p in enumerate(pii_patterns)})
+        self.redaction_counts: Dict[str, int] = {}
     def scrub(self, text: str) -> str:
-        out = text
-        for pat in self.compiled_patterns:
-            out = pat.sub('<REDACTED>', out)
-        return out
+        return self.scrubber.scrub(text)
+    def scrub_series(self, notes: pd.Series, workers: int = SCRUB_WORKERS) -> pd.Series:
+        """
+        Scrub a whole column of notes (process pool for large inputs); per-category counts accumulate
+        in redaction_counts.
+        """
+        scrubbed, counts = self.scrubber.scrub_series(notes, workers=workers)
+        for category, n in counts.items():
+            self.redaction_counts[category] = self.redaction_counts.get(category, 0) + n
+        return scrubbed
     def deid_row(self, row: Dict[str, Any], unstructured_fields: List[str]) -> Dict[str, Any]:
         new_row = row.copy()
         for field in unstructured_fields:
             if field in new_row and isinstance(new_row[field], str):
                 new_row[field] = self.scrub(new_row[field])
         return new_row
+    def deid_frame(self, df: pd.DataFrame, unstructured_fields: List[str]) -> pd.DataFrame:
+        df = df.copy()
+        for field in unstructured_fields:
+            if field in df:
+                df[field] = self.scrub_series(df[field])
+        return df
     def structured_deid(self, df: pd.DataFrame, pii_fields: List[str]) -> pd.DataFrame:
         for field in pii_fields:
             if field in df:
@@ -114,6 +125,7 @@ class HealthcareDataPipeline:
         self.ehr_path = ehr_path
         self.notes_path = notes_path
         self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
         self.fhir_mapper = FHIRMapper()
         self.deidentifier = Deidentifier()
         self.quality_logger = DataQualityLogger(str(self.output_dir/"data_pipeline.log"))
@@ -128,7 +140,8 @@ class HealthcareDataPipeline:
         self.quality_logger.log_stat('raw_ehr_records', len(ehr_df))
         self.quality_logger.log_stat('raw_notes_records', len(notes_df))
         ehr_df = self.deidentifier.structured_deid(ehr_df, self.pii_fields)
-        notes_df = notes_df.apply(lambda row: self.deidentifier.deid_row(row, self.unstructured_fields), axis=1)
+        notes_df = self.deidentifier.deid_frame(notes_df, self.unstructured_fields)
+        self.quality_logger.log_stat('phi_redactions', self.deidentifier.redaction_counts)
         self.quality_logger.log_stat('ehr_after_deid', ehr_df.shape[0])
         self.quality_logger.log_stat('notes_after_deid', notes_df.shape[0])
         merged = self.merge_data(ehr_df, notes_df)
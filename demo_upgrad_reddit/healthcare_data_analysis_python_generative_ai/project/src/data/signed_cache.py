@@ -0,0 +1,87 @@
+import os
+import hmac
+import hashlib
+import logging
+import pickle
+import stat
+import threading
+from typing import Any, Optional
+
+# Per-user root for on-disk caches of fitted artifacts (reference profiles, classifier baselines)
+CACHE_ROOT = os.getenv(
+    'SYNTH_CACHE_DIR',
+    os.path.join(os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'synthetic_healthcare')
+)
+# HMAC key for cache entries; when unset a random key is generated once per cache directory
+CACHE_KEY_ENV = 'SYNTH_CACHE_KEY'
+KEY_FILE_NAME = '.signing_key'
+_MAC_BYTES = hashlib.sha256().digest_size
+
+
+def private_cache_dir(path: str) -> str:
+    """
+    Create `path` (mode 0700) if needed and check it is a directory owned by this user that nobody else
+    can write; a permissive mode on our own directory is tightened. Raises PermissionError otherwise.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f'Cache directory {path} is not a directory owned by the current user')
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+def _signing_key(directory: str) -> bytes:
+    env_key = os.getenv(CACHE_KEY_ENV)
+    if env_key:
+        return env_key.encode('utf-8')
+    key_path = os.path.join(directory, KEY_FILE_NAME)
+    try:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(key_path, 'rb') as f:
+            return f.read()
+    key = os.urandom(32)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def dump_signed(obj: Any, path: str) -> None:
+    """
+    Pickle `obj` to `path` (atomically, mode 0600) prefixed with an HMAC-SHA256 of the payload.
+    The directory must be a private_cache_dir.
+    """
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    mac = hmac.new(_signing_key(os.path.dirname(path)), payload, hashlib.sha256).digest()
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+        f.write(mac)
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def load_signed(path: str) -> Optional[Any]:
+    """
+    The object written by dump_signed, or None when the file is missing, unreadable or its signature does
+    not verify. Nothing is unpickled before the signature checks out.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        key = _signing_key(os.path.dirname(path))
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logging.warning('Ignoring unreadable cache entry %s: %s', path, e)
+        return None
+    mac, payload = data[:_MAC_BYTES], data[_MAC_BYTES:]
+    if len(mac) != _MAC_BYTES or not hmac.compare_digest(mac, hmac.new(key, payload, hashlib.sha256).digest()):
+        logging.warning('Ignoring cache entry with an invalid signature: %s', path)
+        return None
+    try:
+        return pickle.loads(payload)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        logging.warning('Ignoring unreadable cache entry %s: %s', path, e)
+        return None
@@ -0,0 +1,55 @@
+import os
+from typing import Optional
+import pandas as pd
+
+# Supported synthetic output formats: format name -> (file extension, download media type)
+OUTPUT_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+}
+OUTPUT_FORMAT_ALIASES = {'feather': 'arrow', 'pq': 'parquet', 'ipc': 'arrow'}
+
+
+def resolve_output_format(output_format: Optional[str] = None, path: Optional[str] = None) -> str:
+    """
+    Normalize an output format name, falling back to the file extension of `path` and then to CSV.
+    """
+    if output_format:
+        fmt = OUTPUT_FORMAT_ALIASES.get(output_format.lower(), output_format.lower())
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format '{output_format}'. Choose one of {sorted(OUTPUT_FORMATS)}.")
+        return fmt
+    if path:
+        ext = os.path.splitext(path)[1].lower().lstrip('.')
+        fmt = OUTPUT_FORMAT_ALIASES.get(ext, ext)
+        if fmt in OUTPUT_FORMATS:
+            return fmt
+    return 'csv'
+
+
+def write_tabular_file(df: pd.DataFrame, path: str, output_format: Optional[str] = None) -> str:
+    """
+    Write a DataFrame as CSV, zstd-compressed Parquet or Arrow IPC (Feather v2). Returns the format used.
+    """
+    fmt = resolve_output_format(output_format, path)
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False, compression='zstd')
+    elif fmt == 'arrow':
+        # Uncompressed IPC keeps the file memory-mappable for zero-copy reads downstream
+        df.reset_index(drop=True).to_feather(path, compression='uncompressed')
+    else:
+        df.to_csv(path, index=False)
+    return fmt
+
+
+def read_tabular_file(path: str, output_format: Optional[str] = None) -> pd.DataFrame:
+    """
+    Load a CSV, Parquet or Arrow/Feather file, inferring the format from the extension when not given.
+    """
+    fmt = resolve_output_format(output_format, path)
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    if fmt == 'arrow':
+        return pd.read_feather(path)
+    return pd.read_csv(path)
@@ -0,0 +1,143 @@
+import time
+from typing import Dict, Any, Optional, Union
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Default rounding applied before hashing / distance queries so float noise from CSV round-trips
+# does not hide verbatim copies of real records
+DEFAULT_DECIMALS = 6
+# DCR probes per report: nearest-neighbour queries dominate cost, and tail quantiles of a 20k random
+# sample are stable, while exact-copy detection still covers every row
+DEFAULT_DCR_SAMPLE = 20_000
+
+
+def quantize_records(df: pd.DataFrame, decimals: Optional[int] = DEFAULT_DECIMALS) -> pd.DataFrame:
+    """
+    Cast numeric columns to float64 and round them to `decimals` (None disables rounding).
+    Integer and float encodings of the same value therefore hash identically.
+    """
+    num_cols = df.select_dtypes(include='number').columns
+    if not len(num_cols):
+        return df
+    vals = df[num_cols].to_numpy(dtype=np.float64)
+    if decimals is not None:
+        vals = np.round(vals, decimals)
+    vals += 0.0  # folds -0.0 into 0.0
+    if len(num_cols) == df.shape[1]:
+        # All-numeric fast path: avoids per-column assignment into a copied frame
+        return pd.DataFrame(vals, columns=df.columns, copy=False)
+    out = df.copy()
+    out[num_cols] = vals
+    return out
+
+
+def record_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Vectorized 64-bit hash per row (column values only, index ignored).
+    """
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class RecordIndex:
+    """
+    Index over reference records for privacy probes: a sorted uint64 hash array for exact-copy
+    lookups and a KD-tree over (standardized) numeric columns for distance-to-closest-record (DCR).
+    """
+    def __init__(
+        self,
+        records: Union[pd.DataFrame, np.ndarray],
+        decimals: Optional[int] = DEFAULT_DECIMALS,
+        standardize: bool = True,
+        leafsize: int = 32
+    ):
+        df = pd.DataFrame(records)
+        self.columns = list(df.columns)
+        self.decimals = decimals
+        self.leafsize = leafsize
+        quantized = quantize_records(df, decimals)
+        self.hashes = np.unique(record_hashes(quantized))
+        self.num_cols = list(quantized.select_dtypes(include='number').columns)
+        num = quantized[self.num_cols].to_numpy(dtype=np.float64)
+        if standardize and len(num):
+            self.center = num.mean(axis=0)
+            scale = num.std(axis=0)
+            self.scale = np.where(scale > 0, scale, 1.0)
+        else:
+            self.center = np.zeros(num.shape[1])
+            self.scale = np.ones(num.shape[1])
+        self._points = (num - self.center) / self.scale
+        self._tree = None
+    def __len__(self) -> int:
+        return self._points.shape[0]
+    @property
+    def tree(self) -> cKDTree:
+        # Built lazily: exact-copy checks alone never pay for the tree
+        if self._tree is None:
+            self._tree = cKDTree(self._points, leafsize=self.leafsize, balanced_tree=False, compact_nodes=False)
+        return self._tree
+    def _align(self, probes: Union[pd.DataFrame, np.ndarray]) -> pd.DataFrame:
+        df = pd.DataFrame(probes)
+        if isinstance(probes, np.ndarray):
+            df.columns = self.columns
+        return quantize_records(df[self.columns], self.decimals)
+    def exact_matches(self, probes: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        """
+        Boolean mask: which probe rows occur verbatim (after quantization) among the reference records.
+        """
+        h = record_hashes(self._align(probes))
+        pos = np.searchsorted(self.hashes, h)
+        pos[pos == len(self.hashes)] = 0
+        return self.hashes[pos] == h if len(self.hashes) else np.zeros(len(h), dtype=bool)
+    def distance_to_closest(self, probes: Union[pd.DataFrame, np.ndarray], workers: int = -1, eps: float = 0.0) -> np.ndarray:
+        """
+        Euclidean distance (standardized units) from each probe row to its nearest reference record.
+        eps > 0 allows (1 + eps)-approximate neighbours for faster queries on wide tables.
+        """
+        num = self._align(probes)[self.num_cols].to_numpy(dtype=np.float64)
+        dist, _ = self.tree.query((num - self.center) / self.scale, k=1, eps=eps, workers=workers)
+        return dist
+
+
+def membership_inference_report(
+    real: pd.DataFrame,
+    synth: pd.DataFrame,
+    decimals: Optional[int] = DEFAULT_DECIMALS,
+    n_probe: Optional[int] = None,
+    dcr: bool = True,
+    dcr_sample: Optional[int] = DEFAULT_DCR_SAMPLE,
+    index: Optional[RecordIndex] = None,
+    workers: int = -1,
+    eps: float = 0.0,
+    seed: int = 17
+) -> Dict[str, Any]:
+    """
+    Membership inference risk of synthetic data against the real training records.
+    Every real row (or `n_probe` sampled rows) is checked for a verbatim copy in the synthetic data via
+    the hash index; DCR statistics come from the KD-tree on up to `dcr_sample` probes (None for all).
+    Pass a prebuilt `index` over `synth` to reuse it across calls.
+    """
+    t0 = time.perf_counter()
+    probes = real if n_probe is None or n_probe >= len(real) else real.sample(n_probe, random_state=seed)
+    index = index if index is not None else RecordIndex(synth[list(real.columns)], decimals)
+    exact = index.exact_matches(probes)
+    n = len(probes)
+    report = {
+        'n_probes': n,
+        'n_exact_matches': int(exact.sum()),
+        'exact_match_rate': float(exact.sum() / n) if n else 0.0,
+        'decimals': decimals,
+    }
+    if dcr and n and len(index.num_cols):
+        dcr_probes = probes if dcr_sample is None or dcr_sample >= n else probes.sample(dcr_sample, random_state=seed)
+        d = index.distance_to_closest(dcr_probes, workers=workers, eps=eps)
+        report['dcr'] = {
+            'n': int(len(d)),
+            'min': float(d.min()),
+            'p01': float(np.quantile(d, 0.01)),
+            'p05': float(np.quantile(d, 0.05)),
+            'median': float(np.median(d)),
+            'mean': float(d.mean()),
+        }
+    report['seconds'] = time.perf_counter() - t0
+    return report
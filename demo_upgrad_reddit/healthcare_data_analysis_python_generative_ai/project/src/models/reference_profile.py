@@ -0,0 +1,189 @@
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+import numpy as np
+import pandas as pd
+from src.data.file_hashing import content_version
+from src.data.signed_cache import CACHE_ROOT, private_cache_dir, dump_signed, load_signed
+from src.data.tabular_io import read_tabular_file
+from src.models.privacy_risk import RecordIndex, DEFAULT_DECIMALS, DEFAULT_DCR_SAMPLE
+from src.models.synthetic_healthcare_data_pipeline import silhouette_between, SILHOUETTE_TIME_BUDGET_S
+
+PROFILE_VERSION = 1
+PROFILE_DIR = os.getenv('REFERENCE_PROFILE_DIR', os.path.join(CACHE_ROOT, 'reference_profiles'))
+QUANTILE_GRID = np.linspace(0.0, 1.0, 101)
+# Integer columns with at most this many distinct values also get category frequencies
+MAX_CATEGORIES = 50
+# Real rows kept in the profile for the silhouette comparison
+SAMPLE_ROWS = 5000
+# Profiles kept in process memory, most recently used last
+_MEMORY_CACHE_SIZE = 8
+
+_memory_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def build_reference_profile(real_path: str, bins: int = 20, sample_rows: int = SAMPLE_ROWS, seed: int = 17) -> Dict[str, Any]:
+    """
+    Summarize a real dataset once: dtypes, histograms, quantiles, category frequencies, the correlation
+    matrix, a row sample for silhouette checks and a prebuilt RecordIndex for exact-copy/DCR probes.
+    """
+    t0 = time.perf_counter()
+    df = read_tabular_file(real_path)
+    num_cols = list(df.select_dtypes(include='number').columns)
+    numeric = {}
+    for col in num_cols:
+        vals = df[col].dropna().to_numpy(dtype=np.float64)
+        counts, edges = np.histogram(vals, bins=bins)
+        numeric[col] = {
+            'hist_edges': edges,
+            'hist_freq': counts / max(len(vals), 1),
+            'quantiles': np.quantile(vals, QUANTILE_GRID) if len(vals) else np.zeros(len(QUANTILE_GRID)),
+            'mean': float(vals.mean()) if len(vals) else 0.0,
+            'std': float(vals.std()) if len(vals) else 0.0,
+            'null_rate': float(df[col].isna().mean()),
+        }
+    categorical = {}
+    for col in df.columns:
+        if col not in num_cols or (pd.api.types.is_integer_dtype(df[col]) and df[col].nunique() <= MAX_CATEGORIES):
+            categorical[col] = df[col].astype(str).value_counts(normalize=True).to_dict()
+    sample = df[num_cols].sample(min(sample_rows, len(df)), random_state=seed).to_numpy(dtype=np.float64)
+    profile = {
+        'version': PROFILE_VERSION,
+        'content_hash': content_version(real_path),
+        'source_path': os.path.abspath(real_path),
+        'n_rows': int(len(df)),
+        'columns': list(df.columns),
+        'dtypes': {c: str(t) for c, t in df.dtypes.items()},
+        'numeric_columns': num_cols,
+        'numeric': numeric,
+        'categorical': categorical,
+        'correlation': df[num_cols].corr().to_numpy() if num_cols else np.zeros((0, 0)),
+        'sample': sample,
+        'index': RecordIndex(df[num_cols], DEFAULT_DECIMALS),
+    }
+    # Build the KD-tree now so it is saved with the profile rather than rebuilt per request
+    profile['index'].tree
+    logging.info('Built reference profile for %s (%d rows) in %.2fs', real_path, len(df), time.perf_counter() - t0)
+    return profile
+
+
+def load_reference_profile(real_path: str, profile_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Return the profile for `real_path`, keyed by content hash: in-memory LRU, then disk, then built and saved.
+    On disk, profiles live in a private (0700) directory and are HMAC-signed; an entry that fails the
+    signature check is rebuilt rather than loaded. If the directory is not private the disk cache is skipped.
+    """
+    profile_dir = profile_dir or PROFILE_DIR
+    digest = content_version(real_path)
+    with _lock:
+        if digest in _memory_cache:
+            _memory_cache.move_to_end(digest)
+            return _memory_cache[digest]
+    try:
+        path = os.path.join(private_cache_dir(profile_dir), f"{digest.replace(':', '-')}.v{PROFILE_VERSION}.pkl")
+    except OSError as e:
+        logging.warning('Not caching reference profiles on disk: %s', e)
+        path = None
+    profile = load_signed(path) if path else None
+    if profile is None:
+        profile = build_reference_profile(real_path)
+        if path:
+            dump_signed(profile, path)
+    with _lock:
+        _memory_cache[digest] = profile
+        _memory_cache.move_to_end(digest)
+        while len(_memory_cache) > _MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+    return profile
+
+
+def _marginal_metrics(profile: Dict[str, Any], synth: pd.DataFrame) -> Dict[str, Any]:
+    feature_mse, hist_tvd = {}, {}
+    for col, ref in profile['numeric'].items():
+        if col not in synth:
+            continue
+        vals = synth[col].dropna().to_numpy(dtype=np.float64)
+        if not len(vals):
+            continue
+        # Quantile-function MSE: distributional analogue of per-feature MSE for unpaired samples
+        feature_mse[col] = float(np.mean((np.quantile(vals, QUANTILE_GRID) - ref['quantiles']) ** 2))
+        edges = ref['hist_edges']
+        counts = np.histogram(np.clip(vals, edges[0], edges[-1]), bins=edges)[0]
+        hist_tvd[col] = float(0.5 * np.abs(counts / len(vals) - ref['hist_freq']).sum())
+    return {'feature_mse': feature_mse, 'histogram_tvd': hist_tvd}
+
+
+def _category_metrics(profile: Dict[str, Any], synth: pd.DataFrame) -> Dict[str, Any]:
+    tvd = {}
+    for col, ref_freq in profile['categorical'].items():
+        if col not in synth:
+            continue
+        vals = synth[col]
+        if pd.api.types.is_float_dtype(vals) and pd.api.types.is_integer_dtype(np.dtype(profile['dtypes'][col])):
+            vals = vals.round().astype('int64')
+        freq = vals.astype(str).value_counts(normalize=True).to_dict()
+        keys = set(ref_freq) | set(freq)
+        tvd[col] = float(0.5 * sum(abs(ref_freq.get(k, 0.0) - freq.get(k, 0.0)) for k in keys))
+    return {'category_tvd': tvd}
+
+
+def _correlation_metrics(profile: Dict[str, Any], synth: pd.DataFrame) -> Dict[str, Any]:
+    cols = profile['numeric_columns']
+    if len(cols) < 2:
+        return {'correlation_mae': 0.0}
+    diff = np.abs(np.nan_to_num(synth[cols].corr().to_numpy()) - np.nan_to_num(profile['correlation']))
+    return {'correlation_mae': float(diff[np.triu_indices(len(cols), k=1)].mean())}
+
+
+def _privacy_metrics(profile: Dict[str, Any], synth_num: pd.DataFrame) -> Dict[str, Any]:
+    index = profile['index']
+    exact = index.exact_matches(synth_num)
+    d = index.distance_to_closest(synth_num.sample(min(DEFAULT_DCR_SAMPLE, len(synth_num)), random_state=17))
+    return {
+        'n_probes': int(len(exact)),
+        'n_exact_matches': int(exact.sum()),
+        'exact_match_rate': float(exact.mean()) if len(exact) else 0.0,
+        'dcr': {
+            'min': float(d.min()) if len(d) else 0.0,
+            'p05': float(np.quantile(d, 0.05)) if len(d) else 0.0,
+            'median': float(np.median(d)) if len(d) else 0.0,
+        },
+    }
+
+
+def compare_to_reference_profile(
+    profile: Dict[str, Any],
+    synth: pd.DataFrame,
+    time_budget_s: Optional[float] = SILHOUETTE_TIME_BUDGET_S,
+    max_workers: int = 4,
+    seed: int = 17
+) -> Dict[str, Any]:
+    """
+    Score synthetic data against a reference profile. Marginal, category, correlation, silhouette and
+    privacy metrics are independent and run concurrently in a thread pool (NumPy/SciPy release the GIL).
+    Membership risk here is the share of synthetic rows that are verbatim copies of real records.
+    """
+    missing = [c for c in profile['numeric_columns'] if c not in synth]
+    if missing:
+        raise ValueError(f'Synthetic data is missing columns present in the reference profile: {missing}')
+    num = synth[profile['numeric_columns']]
+    cap = len(profile['sample'])
+    synth_sample = num.sample(min(cap, len(num)), random_state=seed).to_numpy(dtype=np.float64)
+    tasks = {
+        'marginals': lambda: _marginal_metrics(profile, synth),
+        'categories': lambda: _category_metrics(profile, synth),
+        'correlation': lambda: _correlation_metrics(profile, synth),
+        'silhouette': lambda: silhouette_between(profile['sample'], synth_sample, time_budget_s=time_budget_s),
+        'privacy': lambda: _privacy_metrics(profile, num),
+    }
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(fn) for name, fn in tasks.items()}
+        results = {name: fut.result() for name, fut in futures.items()}
+    results['seconds'] = time.perf_counter() - t0
+    return results
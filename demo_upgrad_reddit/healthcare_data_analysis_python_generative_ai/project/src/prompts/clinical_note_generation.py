@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple, Set, Callable
+from src.prompts.clinical_text_generation_prompts import ClinicalNotePromptTemplates, compile_template
+from src.prompts.note_cache import NoteCache, note_cache_key
+
+try:
+    import httpx
+except ImportError:  # only needed by OpenAICompatibleBackend
+    httpx = None
+
+DEFAULT_PARAMS = {
+    'document_type': 'encounter note',
+    'note_tone': 'formal',
+    'userType': 'clinician',
+    'section_formatting': 'SOAP',
+}
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class TextGenerationBackend(ABC):
+    """
+    Interface for note generators: turn a batch of prompts into one completion per prompt.
+    """
+    name = 'base'
+    @property
+    def identity(self) -> str:
+        # Part of the note cache key: outputs from different models must never be shared
+        return self.name
+    @abstractmethod
+    async def generate(self, prompts: List[str], **params: Any) -> List[str]:
+        ...
+    async def aclose(self) -> None:
+        pass
+
+
+class LocalStandInBackend(TextGenerationBackend):
+    """
+    Deterministic offline stand-in for an LLM: derives a short SOAP note from the prompt hash.
+    Useful for tests, pipeline dry-runs and throughput measurements of everything except the model.
+    """
+    name = 'local'
+    _COMPLAINTS = ['chest pain', 'shortness of breath', 'abdominal pain', 'headache', 'fever', 'fatigue']
+    _PLANS = ['continue current medications', 'order labs and follow up in 2 weeks', 'refer to specialist', 'admit for observation']
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+    async def generate(self, prompts: List[str], **params: Any) -> List[str]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        notes = []
+        for prompt in prompts:
+            h = int(hashlib.blake2b(prompt.encode('utf-8'), digest_size=8).hexdigest(), 16)
+            complaint = self._COMPLAINTS[h % len(self._COMPLAINTS)]
+            plan = self._PLANS[(h >> 8) % len(self._PLANS)]
+            notes.append(
+                f'S: Patient presents with {complaint}. O: Vitals within expected range. '
+                f'A: Findings consistent with {complaint}. P: {plan.capitalize()}.'
+            )
+        return notes
+
+
+class OpenAICompatibleBackend(TextGenerationBackend):
+    """
+    Batched calls to an OpenAI-compatible /v1/completions server (vLLM, TGI, llama.cpp server, ...).
+    A whole batch is sent as one request with a list of prompts.
+    """
+    name = 'openai'
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None, timeout_s: float = 120.0, max_tokens: int = 512):
+        if httpx is None:
+            raise ImportError('OpenAICompatibleBackend requires the httpx package')
+        headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+        self.model = model
+        self.max_tokens = max_tokens
+        self._client = httpx.AsyncClient(base_url=base_url.rstrip('/'), headers=headers, timeout=timeout_s)
+    @property
+    def identity(self) -> str:
+        return f'{self.name}:{self.model}:{self.max_tokens}'
+    async def generate(self, prompts: List[str], **params: Any) -> List[str]:
+        payload = {'model': self.model, 'prompt': prompts, 'max_tokens': params.pop('max_tokens', self.max_tokens), **params}
+        resp = await self._client.post('/v1/completions', json=payload)
+        resp.raise_for_status()
+        choices = sorted(resp.json()['choices'], key=lambda c: c['index'])
+        return [c['text'].strip() for c in choices]
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def note_backend_kind() -> str:
+    """
+    The configured NOTE_BACKEND, checked without building a client. There is no default: 'openai' needs
+    NOTE_BACKEND_URL, and the 'local' stand-in (hash-templated notes, not a model) is refused unless
+    NOTE_BACKEND_ALLOW_STAND_IN=1, which only tests and dry-runs should set. Raises ValueError otherwise.
+    """
+    kind = os.getenv('NOTE_BACKEND')
+    if not kind:
+        raise ValueError('NOTE_BACKEND is not configured')
+    if kind == 'local':
+        if os.getenv('NOTE_BACKEND_ALLOW_STAND_IN', '0') != '1':
+            raise ValueError('NOTE_BACKEND=local is a test stand-in; set NOTE_BACKEND_ALLOW_STAND_IN=1 to use it')
+    elif kind == 'openai':
+        if not os.getenv('NOTE_BACKEND_URL'):
+            raise ValueError('NOTE_BACKEND=openai requires NOTE_BACKEND_URL')
+    else:
+        raise ValueError(f'Unknown NOTE_BACKEND: {kind}')
+    return kind
+
+
+def backend_from_env() -> TextGenerationBackend:
+    """
+    NOTE_BACKEND=openai (with NOTE_BACKEND_URL, NOTE_BACKEND_MODEL, NOTE_BACKEND_API_KEY), or local for
+    tests; see note_backend_kind.
+    """
+    if note_backend_kind() == 'local':
+        return LocalStandInBackend()
+    return OpenAICompatibleBackend(
+        base_url=os.environ['NOTE_BACKEND_URL'],
+        model=os.getenv('NOTE_BACKEND_MODEL', 'default'),
+        api_key=os.getenv('NOTE_BACKEND_API_KEY')
+    )
+
+
+def load_completed_ids(output_path: str) -> Set[str]:
+    """
+    Read note ids already written to a JSONL output. A torn final line left by a crash is truncated away,
+    so the file itself is the resume checkpoint.
+    """
+    done: Set[str] = set()
+    if not os.path.isfile(output_path):
+        return done
+    good_end = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['note_id'])
+            except (ValueError, KeyError):
+                break
+            good_end += len(line)
+    if good_end < os.path.getsize(output_path):
+        logging.warning('Truncating partial note record at byte %d of %s', good_end, output_path)
+        with open(output_path, 'r+b') as f:
+            f.truncate(good_end)
+    return done
+
+
+class NoteGenerationEngine:
+    """
+    Renders prompts for many FHIR records and generates clinical notes through a TextGenerationBackend.
+    Prompts are grouped into batches; at most `max_concurrency` batches are in flight, failed batches are
+    retried with backoff, and completed notes are appended to JSONL as each batch finishes. Re-running
+    with the same output path skips notes already written (resume=True); note ids only name a record and
+    template, so pass resume=False when the records are not the ones the file was written for.
+    `payload_field` is the record key (and template placeholder) holding the structured data.
+    """
+    def __init__(
+        self,
+        backend: TextGenerationBackend,
+        templates: Optional[List[str]] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = 2,
+        retry_backoff_s: float = 0.5,
+        generation_params: Optional[Dict[str, Any]] = None,
+        default_params: Optional[Dict[str, Any]] = None,
+        cache: Optional[NoteCache] = None,
+        compactor: Optional[Callable[[Any], Tuple[str, Dict[str, Any]]]] = None,
+        payload_field: str = 'fhir_json'
+    ):
+        self.backend = backend
+        self.prompts = ClinicalNotePromptTemplates()
+        self.templates = templates if templates is not None else self.prompts.get_templates()
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff_s = retry_backoff_s
+        self.generation_params = generation_params or {}
+        self.default_params = {**DEFAULT_PARAMS, **(default_params or {})}
+        self.cache = cache
+        self.compactor = compactor
+        self.payload_field = payload_field
+        self.logger = logging.getLogger(__name__)
+        self.compiled = [compile_template(t) for t in self.templates]
+        for c in self.compiled:
+            unresolved = c.unresolved(set(self.default_params) | {payload_field})
+            if unresolved:
+                self.logger.warning('Template placeholders %s must be supplied per record: %r', unresolved, c.template)
+
+    def render_jobs(self, records: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """
+        Yield (note_id, prompt, meta) for every record x template. Each record needs its payload_field
+        ('fhir_json' by default; str or dict) and may carry an 'id' and template parameters overriding the engine's default_params.
+        With a compactor, the FHIR payload is compacted first and meta holds its before/after token counts.
+        """
+        for i, record in enumerate(records):
+            record_id = str(record.get('id', i))
+            fhir = record[self.payload_field]
+            params = {**self.default_params, **{k: v for k, v in record.items() if k not in ('id', self.payload_field)}}
+            meta: Dict[str, Any] = {}
+            if self.compactor is not None:
+                params[self.payload_field], stats = self.compactor(fhir)
+                meta = {'fhir_tokens_before': stats['tokens_before'], 'fhir_tokens_after': stats['tokens_after']}
+            else:
+                params[self.payload_field] = fhir if isinstance(fhir, str) else json.dumps(fhir, separators=(',', ':'))
+            for t, compiled in enumerate(self.compiled):
+                yield f'{record_id}:{t}', compiled.render(params), meta
+
+    def _batches(self, jobs: Iterator[Tuple[str, str, Dict[str, Any]]], skip: Set[str]) -> Iterator[List[Tuple[str, str, Dict[str, Any]]]]:
+        batch = []
+        for job in jobs:
+            if job[0] in skip:
+                continue
+            batch.append(job)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def _generate_batch(self, batch: List[Tuple[str, str, Dict[str, Any]]]) -> List[str]:
+        prompts = [p for _, p, _ in batch]
+        if self.cache is None:
+            return await self._call_backend(prompts)
+        # Only prompts without a cached (prompt, backend, params) result reach the backend
+        keys = [note_cache_key(p, self.backend.identity, self.generation_params) for p in prompts]
+        notes = self.cache.get_many(keys)
+        missing = [i for i, k in enumerate(keys) if k not in notes]
+        if missing:
+            fresh = await self._call_backend([prompts[i] for i in missing])
+            self.cache.put_many((keys[i], note) for i, note in zip(missing, fresh))
+            notes.update((keys[i], note) for i, note in zip(missing, fresh))
+        return [notes[k] for k in keys]
+
+    async def _call_backend(self, prompts: List[str]) -> List[str]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                notes = await self.backend.generate(prompts, **self.generation_params)
+                if len(notes) != len(prompts):
+                    raise ValueError(f'Backend returned {len(notes)} notes for {len(prompts)} prompts')
+                return notes
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                self.logger.warning('Note batch failed (attempt %d/%d): %s', attempt + 1, self.max_retries + 1, e)
+                await asyncio.sleep(self.retry_backoff_s * 2 ** attempt)
+
+    async def arun(self, records: Iterable[Dict[str, Any]], output_path: str, fsync: bool = False, resume: bool = True) -> Dict[str, Any]:
+        """
+        Generate notes for `records` into `output_path` (JSONL: note_id, prompt, note) and return a report
+        with counts, failed note ids and notes/second. With resume=False an existing file is replaced.
+        """
+        t0 = time.perf_counter()
+        hits_before = self.cache.hits if self.cache is not None else 0
+        if not resume and os.path.exists(output_path):
+            os.remove(output_path)
+        skip = load_completed_ids(output_path)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        counts = {'written': 0, 'failed': 0, 'fhir_tokens_before': 0, 'fhir_tokens_after': 0}
+        failed_ids: List[str] = []
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'a', encoding='utf-8') as out:
+            async def run_batch(batch):
+                try:
+                    notes = await self._generate_batch(batch)
+                except Exception as e:
+                    self.logger.error('Note batch of %d failed permanently: %s', len(batch), e)
+                    counts['failed'] += len(batch)
+                    failed_ids.extend(note_id for note_id, _, _ in batch)
+                    return
+                finally:
+                    semaphore.release()
+                # Single event-loop thread: batch writes never interleave
+                out.write(''.join(
+                    json.dumps({'note_id': note_id, 'prompt': prompt, 'note': note, **meta}) + '\n'
+                    for (note_id, prompt, meta), note in zip(batch, notes)
+                ))
+                for _, _, meta in batch:
+                    counts['fhir_tokens_before'] += meta.get('fhir_tokens_before', 0)
+                    counts['fhir_tokens_after'] += meta.get('fhir_tokens_after', 0)
+                out.flush()
+                if fsync:
+                    os.fsync(out.fileno())
+                counts['written'] += len(batch)
+            tasks = set()
+            # Acquire before creating each task so only max_concurrency batches (and prompts) exist at once
+            for batch in self._batches(self.render_jobs(records), skip):
+                await semaphore.acquire()
+                task = asyncio.ensure_future(run_batch(batch))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+        report = {
+            'output_path': output_path,
+            'backend': self.backend.name,
+            'n_written': counts['written'],
+            'n_skipped': len(skip),
+            'n_failed': counts['failed'],
+            'failed_note_ids': failed_ids,
+            'seconds': elapsed,
+            'notes_per_second': counts['written'] / elapsed if elapsed > 0 else 0.0,
+        }
+        if self.compactor is not None:
+            report['fhir_tokens_before'] = counts['fhir_tokens_before']
+            report['fhir_tokens_after'] = counts['fhir_tokens_after']
+        if self.cache is not None:
+            report['n_cached'] = self.cache.hits - hits_before
+            report['cache'] = self.cache.report()
+        self.logger.info('Note generation finished: %s', {k: v for k, v in report.items() if k != 'failed_note_ids'})
+        return report
+
+    def run(self, records: Iterable[Dict[str, Any]], output_path: str, fsync: bool = False, resume: bool = True) -> Dict[str, Any]:
+        """
+        Synchronous wrapper around arun for scripts and threadpool-run API handlers. Runs a fresh event
+        loop, so the backend (whose connections are bound to that loop) is closed afterwards.
+        """
+        async def run_and_close():
+            try:
+                return await self.arun(records, output_path, fsync, resume)
+            finally:
+                await self.backend.aclose()
+        return asyncio.run(run_and_close())
+
+
+def benchmark_note_generation(n_records: int = 2000, batch_size: int = 16, max_concurrency: int = 8, latency_s: float = 0.01, output_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Notes/second through the engine with the local stand-in backend and a fixed per-batch latency.
+    """
+    import tempfile
+    output_dir = output_dir or tempfile.mkdtemp()
+    records = ({'id': i, 'fhir_json': {'resourceType': 'Patient', 'age': 20 + i % 70, 'gender': 'female' if i % 2 else 'male'}} for i in range(n_records))
+    engine = NoteGenerationEngine(LocalStandInBackend(latency_s=latency_s), batch_size=batch_size, max_concurrency=max_concurrency)
+    return engine.run(records, os.path.join(output_dir, 'notes.jsonl'))
@@ -1,7 +1,94 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Tuple
+from functools import lru_cache
+from itertools import islice
 import re
+import time
 import logging
 
+PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+# Records rendered per template at a time by render_bulk
+RENDER_CHUNK_ROWS = 1024
+
+
+class CompiledTemplate:
+    """
+    A prompt template parsed once into literal segments and placeholder slots.
+    `segments` alternates literal text and slot markers (int index into `fields`); rendering goes through a
+    positional str.format string built from them, so each render is a single C-level format call.
+    """
+    def __init__(self, template: str):
+        parts = PLACEHOLDER_RE.split(template)
+        self.template = template
+        self.fields: Tuple[str, ...] = tuple(dict.fromkeys(parts[1::2]))
+        slot_of = {name: i for i, name in enumerate(self.fields)}
+        self.segments: List[Any] = []
+        for i, part in enumerate(parts):
+            if i % 2:
+                self.segments.append(slot_of[part])
+            elif part:
+                self.segments.append(part)
+        self._format = ''.join(
+            f'{{{seg}}}' if isinstance(seg, int) else seg.replace('{', '{{').replace('}', '}}')
+            for seg in self.segments
+        )
+    def unresolved(self, available: Iterable[str]) -> List[str]:
+        """
+        Placeholders that no parameter in `available` would fill.
+        """
+        available = set(available)
+        return [f for f in self.fields if f not in available]
+    def render_values(self, values: Tuple[str, ...]) -> str:
+        """
+        Render from string values ordered like `fields`.
+        """
+        return self._format.format(*values)
+    def render_column(self, values: Iterable[Any]) -> List[str]:
+        """
+        Render a template with at most one open placeholder (see partial) once per value.
+        """
+        if len(self.fields) > 1:
+            raise ValueError(f'render_column needs at most one open placeholder; {self.template!r} has {self.fields}')
+        if not self.fields:
+            text = self._format.format()
+            return [text for _ in values]
+        fmt = self._format.format
+        return [fmt(v) for v in values]
+    def render(self, params: Dict[str, Any]) -> str:
+        """
+        Render from a mapping; missing placeholders are left verbatim as '{name}'.
+        """
+        return self._format.format(*(str(params[f]) if f in params else f'{{{f}}}' for f in self.fields))
+    def partial(self, params: Dict[str, Any]) -> 'CompiledTemplate':
+        """
+        Bind the given parameters now and return a template over the remaining placeholders.
+        """
+        bound = CompiledTemplate.__new__(CompiledTemplate)
+        bound.template = self.template
+        bound.fields = tuple(f for f in self.fields if f not in params)
+        slot_of = {name: i for i, name in enumerate(bound.fields)}
+        segments: List[Any] = []
+        for seg in self.segments:
+            if isinstance(seg, int) and self.fields[seg] in params:
+                seg = str(params[self.fields[seg]])
+            elif isinstance(seg, int):
+                seg = slot_of[self.fields[seg]]
+            if isinstance(seg, str) and segments and isinstance(segments[-1], str):
+                segments[-1] += seg
+            elif seg != '':
+                segments.append(seg)
+        bound.segments = segments
+        bound._format = ''.join(
+            f'{{{seg}}}' if isinstance(seg, int) else seg.replace('{', '{{').replace('}', '}}')
+            for seg in segments
+        )
+        return bound
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> CompiledTemplate:
+    return CompiledTemplate(template)
+
+
 class ClinicalNotePromptTemplates:
     """
     Provides a library of prompt templates for LLM-driven synthetic clinical note generation from FHIR-structured data. Supports prompt parameterization for diversity, style, and privacy compliance.
@@ -23,6 +110,7 @@ class ClinicalNotePromptTemplates:
         ]
         # Configure logger for prompt template issues
         self.logger = logging.getLogger(__name__)
+        self.compiled_templates = [compile_template(t) for t in self.base_templates]
 
     def get_templates(self) -> List[str]:
         return self.base_templates
@@ -30,33 +118,66 @@ class ClinicalNotePromptTemplates:
     def render_prompt(self, template: str, data: Dict[str, Any], extra_params: Dict[str, str]) -> str:
         """
         Renders a prompt template with provided parameters. Warns if any placeholders remain unresolved in the template.
-        Fix: Now checks for unresolved placeholders and logs a warning if any exist.
+        The template is compiled (and cached) once; parameter values are never re-scanned for placeholders.
         """
-        prompt = template
+        compiled = compile_template(template)
         merged_params = {**data, **extra_params}
-        # Replace all provided parameters
-        for k, v in merged_params.items():
-            prompt = prompt.replace(f"{{{k}}}", str(v))
-        # Check for unresolved placeholders (e.g., {field})
-        unresolved = re.findall(r'\{(\w+)\}', prompt)
+        unresolved = compiled.unresolved(merged_params)
         if unresolved:
             self.logger.warning(
                 f"Prompt rendering: Unresolved placeholders in template '{template}': {unresolved}"
             )
-        return prompt
+        return compiled.render(merged_params)
 
     def parameterize_prompt(self, fhir_json: str, document_type: str = 'encounter note', note_tone: str = 'formal', userType: str = 'clinician', section_formatting: str = 'SOAP') -> List[str]:
-        rendered = []
-        for prompt in self.base_templates:
-            params = {
-                'fhir_json': fhir_json,
-                'document_type': document_type,
-                'note_tone': note_tone,
-                'userType': userType,
-                'section_formatting': section_formatting
-            }
-            rendered.append(self.render_prompt(prompt, {}, params))
-        return rendered
+        params = {
+            'fhir_json': fhir_json,
+            'document_type': document_type,
+            'note_tone': note_tone,
+            'userType': userType,
+            'section_formatting': section_formatting
+        }
+        return [compiled.render(params) for compiled in self.compiled_templates]
+
+    def compile_bulk(self, params: Optional[Dict[str, Any]] = None, templates: Optional[List[str]] = None, slot: str = 'fhir_json') -> List[CompiledTemplate]:
+        """
+        Compile templates with `params` bound ahead of time, leaving only `slot` open.
+        Raises ValueError listing any placeholder that would stay unresolved.
+        """
+        params = dict(params or {})
+        compiled = [compile_template(t) for t in (templates if templates is not None else self.base_templates)]
+        problems = {c.template: c.unresolved(set(params) | {slot}) for c in compiled}
+        problems = {t: u for t, u in problems.items() if u}
+        if problems:
+            raise ValueError(f'Unresolved placeholders at compile time: {problems}')
+        return [c.partial(params) for c in compiled]
+
+    def render_bulk(
+        self,
+        fhir_jsons: Iterable[str],
+        params: Optional[Dict[str, Any]] = None,
+        templates: Optional[List[str]] = None
+    ) -> Iterator[List[str]]:
+        """
+        Render a column of FHIR JSON strings against all templates, yielding one list of prompts per record.
+        Shared parameters are bound once up front, so each prompt costs one format call; records are
+        rendered in chunks of RENDER_CHUNK_ROWS, one render_column call per template.
+        """
+        params = {
+            'document_type': 'encounter note', 'note_tone': 'formal', 'userType': 'clinician', 'section_formatting': 'SOAP',
+            **(params or {})
+        }
+        params.pop('fhir_json', None)
+        compiled = self.compile_bulk(params, templates)
+        column = iter(fhir_jsons)
+        while True:
+            chunk = list(islice(column, RENDER_CHUNK_ROWS))
+            if not chunk:
+                return
+            if not compiled:
+                yield from ([] for _ in chunk)
+                continue
+            yield from (list(prompts) for prompts in zip(*(c.render_column(chunk) for c in compiled)))
 
 
 def clinical_text_generation_prompt_examples() -> List[str]:
@@ -82,3 +203,43 @@ def clinical_text_generation_prompt_examples() -> List[str]:
         section_formatting="narrative"
     )
     return examples
+
+
+def benchmark_prompt_rendering(n_records: int = 100_000) -> Dict[str, Any]:
+    """
+    Time the original replace-then-findall rendering, per-record parameterize_prompt (compiled) and
+    render_bulk over the same column of FHIR JSON strings.
+    """
+    def legacy_render(template, params):
+        prompt = template
+        for k, v in params.items():
+            prompt = prompt.replace(f"{{{k}}}", str(v))
+        re.findall(r'\{(\w+)\}', prompt)
+        return prompt
+    pt = ClinicalNotePromptTemplates()
+    defaults = {'document_type': 'encounter note', 'note_tone': 'formal', 'userType': 'clinician', 'section_formatting': 'SOAP'}
+    column = [
+        f'{{"resourceType": "Patient", "id": "p{i}", "age": {20 + i % 70}, "visit": {{"chiefComplaint": "cough", "pulse": {60 + i % 40}}}}}'
+        for i in range(n_records)
+    ]
+    t0 = time.perf_counter()
+    for fhir_json in column:
+        for template in pt.base_templates:
+            legacy_render(template, {'fhir_json': fhir_json, **defaults})
+    legacy_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for fhir_json in column:
+        pt.parameterize_prompt(fhir_json)
+    per_record_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    n_prompts = sum(len(prompts) for prompts in pt.render_bulk(column))
+    bulk_s = time.perf_counter() - t0
+    return {
+        'n_records': n_records,
+        'n_prompts': n_prompts,
+        'legacy_seconds': legacy_s,
+        'per_record_seconds': per_record_s,
+        'bulk_seconds': bulk_s,
+        'bulk_prompts_per_second': n_prompts / bulk_s if bulk_s > 0 else float('inf'),
+        'speedup': legacy_s / bulk_s if bulk_s > 0 else float('inf'),
+    }
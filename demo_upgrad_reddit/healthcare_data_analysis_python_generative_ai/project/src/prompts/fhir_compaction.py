@@ -0,0 +1,194 @@
+import os
+import re
+import json
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Any, List, Tuple, Union
+
+try:
+    import tiktoken
+except ImportError:  # optional: without it token counts use a regex approximation
+    tiktoken = None
+
+FHIR_TOKEN_BUDGET = int(os.getenv('FHIR_TOKEN_BUDGET', 1024))
+FHIR_TOP_N_RESOURCES = int(os.getenv('FHIR_TOP_N_RESOURCES', 20))
+TOKENIZER_ENCODING = os.getenv('FHIR_TOKENIZER_ENCODING', 'cl100k_base')
+# Memoized per-resource token counts: only serializations up to TOKEN_CACHE_MAX_CHARS are kept, so the
+# cache holds at most TOKEN_CACHE_ENTRIES * TOKEN_CACHE_MAX_CHARS characters
+TOKEN_CACHE_ENTRIES = int(os.getenv('FHIR_TOKEN_CACHE_ENTRIES', 16384))
+TOKEN_CACHE_MAX_CHARS = int(os.getenv('FHIR_TOKEN_CACHE_MAX_CHARS', 2048))
+# Keys that carry no clinical content for note generation, or direct identifiers the note must not see
+DROP_KEYS = frozenset({
+    'meta', 'text', 'extension', 'modifierExtension', 'contained', 'identifier', 'implicitRules', 'language',
+    'fullUrl', 'request', 'search', 'name', 'telecom', 'address', 'photo', 'contact',
+})
+# Resource types ordered by usefulness for writing a note; unlisted types rank last
+RESOURCE_PRIORITY = {
+    'Patient': 0, 'Encounter': 1, 'Condition': 2, 'Observation': 3, 'MedicationRequest': 4,
+    'MedicationStatement': 4, 'Procedure': 5, 'AllergyIntolerance': 6, 'DiagnosticReport': 7,
+    'Immunization': 8, 'CarePlan': 9,
+}
+DATE_KEYS = ('effectiveDateTime', 'onsetDateTime', 'recordedDate', 'authoredOn', 'performedDateTime', 'issued', 'date')
+_APPROX_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.get_encoding(TOKENIZER_ENCODING) if tiktoken is not None else None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count with tiktoken when installed, else a word/punctuation approximation.
+    """
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return sum(1 for _ in _APPROX_TOKEN_RE.finditer(text))
+
+
+@lru_cache(maxsize=TOKEN_CACHE_ENTRIES)
+def _cached_count(text: str) -> int:
+    return count_tokens(text)
+
+
+def resource_tokens(serialized: str) -> int:
+    """
+    count_tokens for one serialized resource, memoized when it is short: the same resources recur across
+    records, while whole bundles and long free text would only pin memory.
+    """
+    return _cached_count(serialized) if len(serialized) <= TOKEN_CACHE_MAX_CHARS else count_tokens(serialized)
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def _flatten(value: Any) -> Any:
+    """
+    Collapse common FHIR datatypes to scalars and drop empty values and non-clinical keys.
+    """
+    if isinstance(value, dict):
+        if 'coding' in value or ('text' in value and set(value) <= {'text', 'coding'}):
+            # CodeableConcept -> its text, else first coding's display or code
+            if value.get('text'):
+                return value['text']
+            for coding in value.get('coding') or []:
+                label = coding.get('display') or coding.get('code')
+                if label:
+                    return label
+            return None
+        if 'reference' in value and set(value) <= {'reference', 'display', 'type'}:
+            return value.get('display') or value['reference']
+        if 'value' in value and set(value) <= {'value', 'unit', 'system', 'code', 'comparator'}:
+            unit = value.get('unit') or value.get('code')
+            return f"{value.get('comparator', '')}{value['value']}{' ' + unit if unit else ''}"
+        if set(value) <= {'start', 'end'} and value:
+            return '/'.join(str(value[k]) for k in ('start', 'end') if value.get(k))
+        out = {}
+        for key, item in value.items():
+            if key in DROP_KEYS:
+                continue
+            item = _flatten(item)
+            if item in (None, '', [], {}):
+                continue
+            # valueQuantity / valueCodeableConcept / ... -> value
+            if key.startswith('value') and key != 'value' and 'value' not in value:
+                key = 'value'
+            out[key] = item
+        return out
+    if isinstance(value, list):
+        items = [_flatten(v) for v in value]
+        return [v for v in items if v not in (None, '', [], {})]
+    return value
+
+
+def _resources(doc: Any) -> List[Dict[str, Any]]:
+    if isinstance(doc, dict) and doc.get('resourceType') == 'Bundle':
+        return [e['resource'] for e in doc.get('entry') or [] if isinstance(e, dict) and isinstance(e.get('resource'), dict)]
+    if isinstance(doc, list):
+        return [r for r in doc if isinstance(r, dict)]
+    return [doc] if isinstance(doc, dict) else []
+
+
+def _rank_resources(resources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Higher-priority types first; within a type, most recent first (ISO dates sort lexically).
+    # Two stable sorts: by date descending, then by type priority.
+    by_date = sorted(resources, key=lambda r: next((str(r[k]) for k in DATE_KEYS if r.get(k)), ''), reverse=True)
+    return sorted(by_date, key=lambda r: RESOURCE_PRIORITY.get(r.get('resourceType'), len(RESOURCE_PRIORITY)))
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    """
+    `text` cut to at most `budget` tokens including a trailing ellipsis, from a single tokenization.
+    """
+    enc = _encoding()
+    if enc is None:
+        # The ellipsis is one approximate token; stop scanning once the text is known to be over budget
+        ends = [m.end() for m in islice(_APPROX_TOKEN_RE.finditer(text), budget + 1)]
+        if len(ends) <= budget:
+            return text
+        return text[:ends[budget - 2] if budget > 1 else 0] + '…'
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= budget:
+        return text
+    keep = max(budget - 1, 0)
+    out = enc.decode(tokens[:keep]) + '…'
+    # A decoded prefix can re-tokenize differently at the cut; drop tokens until it fits
+    while keep and count_tokens(out) > budget:
+        keep -= 1
+        out = enc.decode(tokens[:keep]) + '…'
+    return out
+
+
+def compact_fhir(
+    fhir: Union[str, Dict[str, Any], List[Any]],
+    token_budget: int = FHIR_TOKEN_BUDGET,
+    top_n: int = FHIR_TOP_N_RESOURCES
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Shrink a FHIR resource/bundle for prompting: prune empty and non-clinical fields, flatten common
+    datatypes, keep the top_n most relevant resources and fit the result into token_budget tokens.
+    Returns (compact JSON, stats with tokens_before/tokens_after and resource counts).
+    """
+    raw = fhir if isinstance(fhir, str) else _dumps(fhir)
+    tokens_before = count_tokens(raw)
+    try:
+        doc = json.loads(raw) if isinstance(fhir, str) else fhir
+    except ValueError:
+        text = _truncate_to_tokens(raw, token_budget)
+        return text, {'tokens_before': tokens_before, 'tokens_after': count_tokens(text), 'resources_before': 0, 'resources_kept': 0}
+    resources = _resources(doc)
+    ranked = _rank_resources([_flatten(r) for r in resources])[:top_n]
+    single = isinstance(doc, dict) and doc.get('resourceType') != 'Bundle'
+    # Greedy fill by priority using memoized per-resource counts (+1 for the separating comma)
+    kept, used = [], 2
+    for resource in ranked:
+        cost = resource_tokens(_dumps(resource)) + 1
+        if used + cost > token_budget:
+            continue
+        kept.append(resource)
+        used += cost
+    if kept or not ranked:
+        text = _dumps(kept[0] if single and kept else kept)
+    else:
+        # Even the most relevant resource alone is over budget: cut its serialized form
+        text = _truncate_to_tokens(_dumps(ranked[0]), token_budget)
+    tokens_after = count_tokens(text)
+    return text, {
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'resources_before': len(resources),
+        'resources_kept': len(kept) if kept else int(bool(ranked)),
+    }
+
+
+class FhirCompactor:
+    """
+    Callable compaction stage for the note engine, configured once with a budget and resource cap.
+    """
+    def __init__(self, token_budget: int = FHIR_TOKEN_BUDGET, top_n: int = FHIR_TOP_N_RESOURCES):
+        self.token_budget = token_budget
+        self.top_n = top_n
+    def __call__(self, fhir: Union[str, Dict[str, Any], List[Any]]) -> Tuple[str, Dict[str, Any]]:
+        return compact_fhir(fhir, self.token_budget, self.top_n)
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from src.data.signed_cache import CACHE_ROOT, private_cache_dir
+
+# Per-user by default: a shared temp-dir database would let any local user read or plant notes
+NOTE_CACHE_PATH = os.getenv('NOTE_CACHE_PATH', os.path.join(CACHE_ROOT, 'note_cache.sqlite'))
+NOTE_CACHE_MAX_BYTES = int(os.getenv('NOTE_CACHE_MAX_BYTES', 1024 ** 3))
+# After an eviction pass the cache is trimmed to this fraction of max_bytes, so evictions are batched
+EVICT_TARGET_RATIO = 0.9
+# SQLite's default limit on bound parameters is 999 on older builds
+_SQL_CHUNK = 500
+
+
+def note_cache_key(prompt: str, backend: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Content address of a generation: BLAKE2b over backend name, canonical generation params and the rendered prompt.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(backend.encode('utf-8'))
+    h.update(b'\0')
+    h.update(json.dumps(params or {}, sort_keys=True, default=str).encode('utf-8'))
+    h.update(b'\0')
+    h.update(prompt.encode('utf-8'))
+    return h.hexdigest()
+
+
+class NoteCache:
+    """
+    Persistent content-addressed store of generated notes in SQLite (WAL mode, safe across threads and
+    processes). Entries are evicted least-recently-used once the stored text exceeds max_bytes. The total
+    size is kept in a meta row by triggers, so checking it never scans the table. The database lives in
+    a private (0700) directory: it holds generated clinical text.
+    """
+    def __init__(self, path: str = NOTE_CACHE_PATH, max_bytes: int = NOTE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        private_cache_dir(os.path.dirname(os.path.abspath(path)))
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS notes ('
+                'key TEXT PRIMARY KEY, note TEXT NOT NULL, size INTEGER NOT NULL, '
+                'created REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS notes_last_access ON notes(last_access)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            # Seeded once from the table (databases created before the meta row existed), then maintained
+            self._conn.execute(
+                "INSERT OR IGNORE INTO meta (name, value) SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM notes"
+            )
+            self._conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS notes_size_insert AFTER INSERT ON notes BEGIN '
+                "UPDATE meta SET value = value + NEW.size WHERE name = 'total_bytes'; END"
+            )
+            self._conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS notes_size_update AFTER UPDATE OF size ON notes BEGIN '
+                "UPDATE meta SET value = value + NEW.size - OLD.size WHERE name = 'total_bytes'; END"
+            )
+            self._conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS notes_size_delete AFTER DELETE ON notes BEGIN '
+                "UPDATE meta SET value = value - OLD.size WHERE name = 'total_bytes'; END"
+            )
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes_locked()
+    def _total_bytes_locked(self) -> int:
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """
+        Return {key: note} for cached keys and refresh their LRU position.
+        """
+        found: Dict[str, str] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _SQL_CHUNK):
+                chunk = keys[i:i + _SQL_CHUNK]
+                marks = ','.join('?' * len(chunk))
+                found.update(self._conn.execute(f'SELECT key, note FROM notes WHERE key IN ({marks})', chunk).fetchall())
+            if found:
+                self._conn.executemany(
+                    'UPDATE notes SET last_access = ?, hits = hits + 1 WHERE key = ?', [(now, k) for k in found]
+                )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+    def put_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        now = time.time()
+        rows = [(k, note, len(note.encode('utf-8')), now, now) for k, note in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # An upsert rather than INSERT OR REPLACE: REPLACE's implicit delete does not fire triggers
+                self._conn.executemany(
+                    'INSERT INTO notes (key, note, size, created, last_access) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET note = excluded.note, size = excluded.size, '
+                    'created = excluded.created, last_access = excluded.last_access', rows
+                )
+                self._evict_locked()
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+    def put(self, key: str, note: str) -> None:
+        self.put_many([(key, note)])
+    def _evict_locked(self) -> None:
+        total = self._total_bytes_locked()
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        evict, freed = [], 0
+        for key, size in self._conn.execute('SELECT key, size FROM notes ORDER BY last_access ASC'):
+            if total - freed <= target:
+                break
+            evict.append((key,))
+            freed += size
+        self._conn.executemany('DELETE FROM notes WHERE key = ?', evict)
+        self.evictions += len(evict)
+        logging.info('Note cache over %d bytes; evicted %d LRU entries (%d bytes)', self.max_bytes, len(evict), freed)
+    def report(self) -> Dict[str, Any]:
+        """
+        Hit-rate report for lookups made through this instance plus current size.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self),
+            'bytes': self.total_bytes(),
+            'max_bytes': self.max_bytes,
+        }
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
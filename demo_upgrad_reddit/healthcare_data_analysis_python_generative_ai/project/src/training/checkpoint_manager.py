@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Dict, Any, Optional, List
+import torch
+
+CHECKPOINT_INTERVAL = int(os.getenv('CHECKPOINT_INTERVAL', 10))
+CHECKPOINT_KEEP_LAST = int(os.getenv('CHECKPOINT_KEEP_LAST', 2))
+CHECKPOINT_KEEP_BEST = int(os.getenv('CHECKPOINT_KEEP_BEST', 1))
+# Snapshots waiting for the writer; save() blocks (backpressure) rather than holding more in memory
+CHECKPOINT_MAX_PENDING = int(os.getenv('CHECKPOINT_MAX_PENDING', 2))
+
+
+def snapshot_state(value: Any) -> Any:
+    """
+    Detached CPU copy of a state_dict (nested dicts/lists of tensors), safe to serialize while training continues.
+    """
+    if isinstance(value, torch.Tensor):
+        return value.detach().to('cpu', copy=True)
+    if isinstance(value, dict):
+        return {k: snapshot_state(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(snapshot_state(v) for v in value)
+    return value
+
+
+class CheckpointManager:
+    """
+    Periodic checkpoints written off the training thread. save() snapshots the state_dicts of the given
+    modules/optimizers in memory and queues them; a background thread writes each file with an atomic
+    rename, then applies retention: the keep_last most recent plus the keep_best best by `metric`.
+    An index (<prefix>_checkpoints.json) lists retained checkpoints for resume().
+    """
+    def __init__(
+        self,
+        directory: str,
+        prefix: str,
+        interval: int = CHECKPOINT_INTERVAL,
+        keep_last: int = CHECKPOINT_KEEP_LAST,
+        keep_best: int = CHECKPOINT_KEEP_BEST,
+        metric: Optional[str] = None,
+        mode: str = 'min',
+        max_pending: int = CHECKPOINT_MAX_PENDING
+    ):
+        if mode not in ('min', 'max'):
+            raise ValueError("mode must be 'min' or 'max'")
+        self.directory = directory
+        self.prefix = prefix
+        self.interval = max(1, interval)
+        self.keep_last = keep_last
+        self.keep_best = keep_best if metric else 0
+        self.metric = metric
+        self.mode = mode
+        self.index_path = os.path.join(directory, f'{prefix}_checkpoints.json')
+        os.makedirs(directory, exist_ok=True)
+        self.entries: List[Dict[str, Any]] = self._read_index()
+        self.stats = {'saved': 0, 'deleted': 0, 'blocked_seconds': 0.0, 'write_seconds': 0.0}
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=max(1, max_pending))
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._writer, name=f'checkpoint-writer-{prefix}', daemon=True)
+        self._thread.start()
+    def __enter__(self) -> 'CheckpointManager':
+        return self
+    def __exit__(self, *exc) -> None:
+        self.close()
+    def _read_index(self) -> List[Dict[str, Any]]:
+        if not os.path.isfile(self.index_path):
+            return []
+        with open(self.index_path) as f:
+            entries = json.load(f)
+        # Drop entries whose file vanished (e.g. removed by hand)
+        return [e for e in entries if os.path.isfile(os.path.join(self.directory, e['file']))]
+    def _write_index_locked(self) -> None:
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, self.index_path)
+    def should_save(self, epoch: int) -> bool:
+        return epoch % self.interval == 0
+    def _raise_pending_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f'Background checkpoint write failed: {error}') from error
+    def save(self, epoch: int, objects: Dict[str, Any], metrics: Optional[Dict[str, float]] = None, force: bool = False) -> bool:
+        """
+        Queue a checkpoint of `objects` (name -> module/optimizer with state_dict(), or plain picklable values)
+        if epoch falls on the interval or `force`. Returns whether a checkpoint was queued.
+        """
+        self._raise_pending_error()
+        if not (force or self.should_save(epoch)):
+            return False
+        payload = {
+            'epoch': epoch,
+            'metrics': dict(metrics or {}),
+            'state': {k: snapshot_state(v.state_dict() if hasattr(v, 'state_dict') else v) for k, v in objects.items()},
+        }
+        t0 = time.perf_counter()
+        self._queue.put(payload)
+        self.stats['blocked_seconds'] += time.perf_counter() - t0
+        return True
+    def _writer(self) -> None:
+        while True:
+            payload = self._queue.get()
+            try:
+                if payload is None:
+                    return
+                self._write(payload)
+            except BaseException as e:  # surfaced to the training thread on its next call
+                logging.error('Checkpoint write failed for epoch %s: %s', payload['epoch'], e)
+                self._error = e
+            finally:
+                self._queue.task_done()
+    def _write(self, payload: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
+        name = f"{self.prefix}_epoch{payload['epoch']}.pt"
+        path = os.path.join(self.directory, name)
+        tmp = path + '.tmp'
+        torch.save(payload, tmp)
+        os.replace(tmp, path)
+        with self._lock:
+            self.entries = [e for e in self.entries if e['file'] != name]
+            self.entries.append({'epoch': payload['epoch'], 'file': name, 'metrics': payload['metrics']})
+            removed = self._apply_retention_locked()
+            self._write_index_locked()
+        for file in removed:
+            try:
+                os.remove(os.path.join(self.directory, file))
+            except FileNotFoundError:
+                pass
+        self.stats['saved'] += 1
+        self.stats['deleted'] += len(removed)
+        self.stats['write_seconds'] += time.perf_counter() - t0
+    def _ranked_by_metric(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        scored = [e for e in entries if self.metric in e['metrics']]
+        return sorted(scored, key=lambda e: e['metrics'][self.metric], reverse=self.mode == 'max')
+    def _apply_retention_locked(self) -> List[str]:
+        by_epoch = sorted(self.entries, key=lambda e: e['epoch'])
+        keep = {e['file'] for e in by_epoch[-self.keep_last:]} if self.keep_last > 0 else set()
+        if self.keep_best:
+            keep.update(e['file'] for e in self._ranked_by_metric(self.entries)[:self.keep_best])
+        removed = [e['file'] for e in self.entries if e['file'] not in keep]
+        self.entries = [e for e in by_epoch if e['file'] in keep]
+        return removed
+    def flush(self) -> None:
+        """
+        Block until every queued checkpoint is on disk; re-raises a failed background write.
+        """
+        self._queue.join()
+        self._raise_pending_error()
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_pending_error()
+    def clear(self) -> None:
+        """
+        Delete every retained checkpoint, e.g. before retraining from scratch under the same prefix.
+        """
+        self.flush()
+        with self._lock:
+            files, self.entries = [e['file'] for e in self.entries], []
+            self._write_index_locked()
+        for file in files:
+            try:
+                os.remove(os.path.join(self.directory, file))
+            except FileNotFoundError:
+                pass
+        self.stats['deleted'] += len(files)
+    def latest(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return max(self.entries, key=lambda e: e['epoch'], default=None)
+    def best(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            ranked = self._ranked_by_metric(self.entries) if self.metric else []
+        return ranked[0] if ranked else None
+    def resume(self, objects: Dict[str, Any], which: str = 'latest', map_location: str = 'cpu') -> Optional[Dict[str, Any]]:
+        """
+        Load the latest (or best) retained checkpoint into `objects` (name -> module/optimizer).
+        Returns the payload ({'epoch', 'metrics', 'state'}) or None when there is nothing to resume.
+        """
+        self.flush()
+        entry = self.best() if which == 'best' else self.latest()
+        if entry is None:
+            return None
+        payload = torch.load(os.path.join(self.directory, entry['file']), map_location=map_location, weights_only=False)
+        for name, obj in objects.items():
+            if name in payload['state'] and hasattr(obj, 'load_state_dict'):
+                obj.load_state_dict(payload['state'][name])
+        logging.info('Resumed %s from epoch %d (%s)', self.prefix, payload['epoch'], entry['file'])
+        return payload
@@ -0,0 +1,169 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from src.data.signed_cache import CACHE_ROOT, private_cache_dir, dump_signed, load_signed
+
+BASELINE_VERSION = 1
+BASELINE_DIR = os.getenv('CLASSIFIER_BASELINE_DIR', os.path.join(CACHE_ROOT, 'classifier_baselines'))
+EVAL_WORKERS = int(os.getenv('EVAL_WORKERS', 4))
+# Held-out split shared by the real baseline and the synthetic classifier
+UTILITY_TEST_SIZE = 0.3
+UTILITY_SPLIT_SEED = 42
+# Real and synthetic rows loaded for evaluation, so scoring a large table stays within bounded memory
+EVAL_SAMPLE_ROWS = int(os.getenv('EVAL_SAMPLE_ROWS', 100_000))
+# Baselines kept in process memory, most recently used last
+_MEMORY_CACHE_SIZE = 8
+
+_memory_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def default_classifier() -> RandomForestClassifier:
+    return RandomForestClassifier(n_estimators=100, random_state=UTILITY_SPLIT_SEED)
+
+
+def utility_split(df: pd.DataFrame, target_col: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]:
+    """
+    (X_train, X_test, y_train, y_test) of the real data; deterministic, so cached baselines stay comparable.
+    """
+    return train_test_split(
+        df.drop(columns=[target_col]), df[target_col], test_size=UTILITY_TEST_SIZE, random_state=UTILITY_SPLIT_SEED
+    )
+
+
+def fit_and_score(X_train, y_train, X_test, y_test, make_classifier: Callable[[], Any] = default_classifier) -> Tuple[Any, float]:
+    model = make_classifier().fit(X_train, y_train)
+    return model, float(accuracy_score(y_test, model.predict(X_test)))
+
+
+def baseline_key(dataset_version: str, target_col: str, make_classifier: Callable[[], Any] = default_classifier) -> str:
+    # The classifier repr carries its hyperparameters, so changing them invalidates the baseline
+    spec = {
+        'version': BASELINE_VERSION, 'dataset_version': str(dataset_version), 'target_col': target_col,
+        'classifier': repr(make_classifier()), 'test_size': UTILITY_TEST_SIZE, 'seed': UTILITY_SPLIT_SEED,
+    }
+    return hashlib.blake2b(json.dumps(spec, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def real_baseline(
+    df: pd.DataFrame,
+    target_col: str,
+    dataset_version: str,
+    make_classifier: Callable[[], Any] = default_classifier,
+    cache_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Real-data classifier and its held-out accuracy for (dataset_version, target_col): in-memory LRU, then
+    disk, then trained and saved. The entry's 'cached' flag says whether training was skipped.
+    Without a dataset_version nothing identifies the data, so the baseline is trained and not cached.
+    Disk entries are HMAC-signed in a private directory (see src.data.signed_cache).
+    """
+    if dataset_version is None:
+        X_train, X_test, y_train, y_test = utility_split(df, target_col)
+        model, accuracy = fit_and_score(X_train, y_train, X_test, y_test, make_classifier)
+        return {'dataset_version': None, 'target_col': target_col, 'model': model, 'accuracy': accuracy, 'cached': False}
+    cache_dir = cache_dir or BASELINE_DIR
+    key = baseline_key(dataset_version, target_col, make_classifier)
+    with _lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return dict(_memory_cache[key], cached=True)
+    try:
+        path = os.path.join(private_cache_dir(cache_dir), f'{key}.pkl')
+    except OSError as e:
+        logging.warning('Not caching classifier baselines on disk: %s', e)
+        path = None
+    entry = load_signed(path) if path else None
+    cached = entry is not None
+    if entry is None:
+        t0 = time.perf_counter()
+        X_train, X_test, y_train, y_test = utility_split(df, target_col)
+        model, accuracy = fit_and_score(X_train, y_train, X_test, y_test, make_classifier)
+        entry = {
+            'key': key, 'dataset_version': dataset_version, 'target_col': target_col,
+            'model': model, 'accuracy': accuracy, 'train_seconds': time.perf_counter() - t0,
+        }
+        if path:
+            dump_signed(entry, path)
+        logging.info('Trained real-data baseline for %s/%s (accuracy %.4f)', dataset_version, target_col, accuracy)
+    with _lock:
+        _memory_cache[key] = entry
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > _MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+    return dict(entry, cached=cached)
+
+
+def evaluation_frames(
+    data: np.ndarray,
+    transform: Any,
+    synth_path: str,
+    dataset_version: Optional[str] = None,
+    sample_rows: int = EVAL_SAMPLE_ROWS,
+    seed: int = UTILITY_SPLIT_SEED
+) -> Tuple[pd.DataFrame, pd.DataFrame, Optional[str]]:
+    """
+    (real df, synthetic df, baseline version) for evaluate_synthetic, both in the transformed space.
+    At most sample_rows real rows are read from the preprocessed array (a memmap: only the sampled rows
+    are paged in), drawn uniformly without replacement, and the first sample_rows synthetic rows are read
+    from synth_path (independent draws, so a prefix is an unbiased sample). A sampled real side gets its
+    own baseline version, so its cached baseline is never mistaken for the full-data one.
+    """
+    n = data.shape[0]
+    if n > sample_rows:
+        rows = np.sort(np.random.default_rng(seed).choice(n, size=sample_rows, replace=False))
+        real = np.asarray(data[rows])
+        if dataset_version is not None:
+            dataset_version = f'{dataset_version}/sample-{sample_rows}-{seed}'
+    else:
+        real = np.asarray(data)
+    df = pd.DataFrame(real, columns=transform.columns)
+    synth_df = transform.encode_frame(pd.read_csv(synth_path, nrows=sample_rows), transform.feature_columns)
+    return df, synth_df, dataset_version
+
+
+def synthetic_utility(
+    df: pd.DataFrame,
+    synth_df: pd.DataFrame,
+    target_col: str,
+    make_classifier: Callable[[], Any] = default_classifier
+) -> float:
+    """
+    Accuracy on the real held-out split of a classifier trained on the synthetic rows.
+    """
+    _, X_test, _, _ = utility_split(df, target_col)
+    # Synthetic rows carry no label: as before, the real labels are reused positionally
+    y = df[target_col]
+    _, accuracy = fit_and_score(synth_df[X_test.columns], y[:synth_df.shape[0]], X_test, y[X_test.index], make_classifier)
+    return accuracy
+
+
+def run_concurrently(tasks: Dict[str, Callable[[], Any]], max_workers: int = EVAL_WORKERS) -> Dict[str, Any]:
+    """
+    Run independent evaluation callables in a thread pool (the heavy work is in NumPy/scikit-learn, which
+    release the GIL). Returns name -> result; the first failure is re-raised. Adds per-task and total seconds.
+    """
+    timings = {}
+    def timed(name: str, fn: Callable[[], Any]) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            timings[name] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as pool:
+        futures = {name: pool.submit(timed, name, fn) for name, fn in tasks.items()}
+        results = {name: fut.result() for name, fut in futures.items()}
+    results['seconds'] = {'total': time.perf_counter() - t0, **timings}
+    return results
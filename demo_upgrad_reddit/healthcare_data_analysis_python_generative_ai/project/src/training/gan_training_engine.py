@@ -0,0 +1,203 @@
+import os
+import time
+import logging
+from typing import Dict, Any, Callable, Iterable, Optional, Sequence, Tuple
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+
+GAN_NUM_THREADS = int(os.getenv('GAN_NUM_THREADS', 0))  # 0: leave torch's default
+GAN_COMPILE = os.getenv('GAN_COMPILE', '0') == '1'
+# (rows, features) of the tables we typically train on: narrow claims extracts to wide EHR feature sets
+TYPICAL_TABLE_SHAPES = ((20_000, 24), (20_000, 64), (20_000, 160))
+
+
+def make_adam(params, lr: float) -> optim.Optimizer:
+    """
+    Adam with the fused kernel when the installed torch supports it for these parameters, else foreach.
+    """
+    params = list(params)
+    try:
+        return optim.Adam(params, lr=lr, fused=True)
+    except (RuntimeError, TypeError, ValueError):
+        return optim.Adam(params, lr=lr, foreach=True)
+
+
+def eager_gan_epoch(
+    generator: nn.Module,
+    discriminator: nn.Module,
+    g_optimizer: optim.Optimizer,
+    d_optimizer: optim.Optimizer,
+    data_tensor: torch.Tensor,
+    noise_dim: int,
+    batch_size: int,
+    criterion: nn.Module = None,
+    max_steps: Optional[int] = None
+) -> Dict[str, float]:
+    """
+    One epoch of the original eager GAN loop (fresh label/noise tensors every step); last-step losses.
+    """
+    device = data_tensor.device
+    criterion = criterion or nn.BCELoss()
+    n = data_tensor.shape[0]
+    steps = max(1, n // batch_size)
+    if max_steps is not None:
+        steps = min(steps, max_steps)
+    perm = torch.randperm(n)
+    for i in range(steps):
+        idx = perm[i*batch_size:(i+1)*batch_size]
+        real_data = data_tensor[idx]
+        batch_size_actual = real_data.shape[0]
+        real_labels = torch.ones((batch_size_actual, 1), device=device)
+        fake_labels = torch.zeros((batch_size_actual, 1), device=device)
+        z = torch.randn((batch_size_actual, noise_dim), device=device)
+        fake_data = generator(z)
+        d_real = discriminator(real_data)
+        d_fake = discriminator(fake_data.detach())
+        d_loss = criterion(d_real, real_labels) + criterion(d_fake, fake_labels)
+        d_optimizer.zero_grad()
+        d_loss.backward()
+        d_optimizer.step()
+        z = torch.randn((batch_size_actual, noise_dim), device=device)
+        fake_data = generator(z)
+        d_fake = discriminator(fake_data)
+        g_loss = criterion(d_fake, real_labels)
+        g_optimizer.zero_grad()
+        g_loss.backward()
+        g_optimizer.step()
+    return {'d_loss': d_loss.item(), 'g_loss': g_loss.item(), 'steps': steps}
+
+
+class GANTrainingEngine:
+    """
+    Allocation-free GAN training steps. Label, noise, permutation and real-batch buffers are allocated
+    once and refilled in place. Real and fake rows share one discriminator forward (identical loss, since
+    the BCE means are over equal halves), Adam runs fused/foreach, and losses are read back once per
+    epoch. Optionally compiles both models with torch.compile and sets the intra-op thread count.
+    """
+    def __init__(
+        self,
+        generator: nn.Module,
+        discriminator: nn.Module,
+        noise_dim: int,
+        batch_size: int,
+        lr: float = 0.0002,
+        device: str = 'cpu',
+        compile_models: bool = GAN_COMPILE,
+        num_threads: int = GAN_NUM_THREADS
+    ):
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        self.generator = generator
+        self.discriminator = discriminator
+        self.noise_dim = noise_dim
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.g_optimizer = make_adam(generator.parameters(), lr)
+        self.d_optimizer = make_adam(discriminator.parameters(), lr)
+        self._g_forward, self._d_forward = generator, discriminator
+        if compile_models:
+            try:
+                self._g_forward = torch.compile(generator, dynamic=False)
+                self._d_forward = torch.compile(discriminator, dynamic=False)
+            except Exception as e:  # no compiler toolchain: stay eager
+                logging.warning(f'torch.compile unavailable ({e}); GAN engine runs eager')
+        self._buffers_for = None
+    def _allocate(self, n: int, data_dim: int, dtype: torch.dtype) -> None:
+        b = min(self.batch_size, n)
+        kw = {'device': self.device, 'dtype': dtype}
+        # [ones | zeros] matches the [real | fake] layout of the joint discriminator batch
+        self._d_labels = torch.cat([torch.ones((b, 1), **kw), torch.zeros((b, 1), **kw)])
+        self._g_labels = self._d_labels[:b]
+        self._d_input = torch.empty((2 * b, data_dim), **kw)
+        self._real = self._d_input[:b]
+        self._noise = torch.empty((b, self.noise_dim), **kw)
+        self._perm = torch.empty(n, dtype=torch.long)
+        self._losses = torch.zeros(2, dtype=torch.float32)
+        self._buffers_for = (n, data_dim, dtype)
+    def step(self, idx: torch.Tensor, data_tensor: torch.Tensor) -> None:
+        torch.index_select(data_tensor, 0, idx.to(data_tensor.device), out=self._real)
+        self._update()
+    def _update(self) -> None:
+        # One D and one G step on the real rows already in self._real
+        b = self._real.shape[0]
+        with torch.no_grad():
+            self._d_input[b:].copy_(self._g_forward(self._noise.normal_()))
+        d_loss = 2.0 * F.binary_cross_entropy(self._d_forward(self._d_input), self._d_labels)
+        self.d_optimizer.zero_grad(set_to_none=True)
+        d_loss.backward()
+        self.d_optimizer.step()
+        g_loss = F.binary_cross_entropy(self._d_forward(self._g_forward(self._noise.normal_())), self._g_labels)
+        self.g_optimizer.zero_grad(set_to_none=True)
+        g_loss.backward()
+        self.g_optimizer.step()
+        self._losses[0].copy_(d_loss.detach(), non_blocking=True)
+        self._losses[1].copy_(g_loss.detach(), non_blocking=True)
+    def train_epoch(self, data_tensor: torch.Tensor, max_steps: Optional[int] = None) -> Dict[str, float]:
+        """
+        One shuffled pass over data_tensor in full batches; returns last-step losses like the eager loop.
+        """
+        n, data_dim = data_tensor.shape
+        if self._buffers_for != (n, data_dim, data_tensor.dtype):
+            self._allocate(n, data_dim, data_tensor.dtype)
+        b = self._real.shape[0]
+        steps = n // b if max_steps is None else min(n // b, max_steps)
+        torch.randperm(n, out=self._perm)
+        for i in range(steps):
+            self.step(self._perm[i*b:(i+1)*b], data_tensor)
+        d_loss, g_loss = self._losses.tolist()
+        return {'d_loss': d_loss, 'g_loss': g_loss, 'steps': steps}
+    def train_loader_epoch(self, loader: Iterable[torch.Tensor], data_dim: int, max_steps: Optional[int] = None) -> Dict[str, float]:
+        """
+        One pass over equally sized batches from a loader (e.g. out-of-core PrefetchingBatchLoader).
+        """
+        steps = 0
+        for batch in loader:
+            if self._buffers_for is None or self._real.shape != batch.shape:
+                self._allocate(batch.shape[0], data_dim, batch.dtype)
+            self._real.copy_(batch, non_blocking=True)
+            self._update()
+            steps += 1
+            if max_steps is not None and steps >= max_steps:
+                break
+        d_loss, g_loss = self._losses.tolist()
+        return {'d_loss': d_loss, 'g_loss': g_loss, 'steps': steps}
+
+
+def benchmark_gan_engine(
+    make_generator: Callable[[int, int], nn.Module],
+    make_discriminator: Callable[[int], nn.Module],
+    shapes: Sequence[Tuple[int, int]] = TYPICAL_TABLE_SHAPES,
+    noise_dim: int = 24,
+    batch_size: int = 256,
+    steps: int = 60,
+    compile_models: bool = False
+) -> Dict[str, Any]:
+    """
+    Training steps/second of the eager loop vs GANTrainingEngine for each (rows, features) table shape.
+    """
+    report = {}
+    for rows, features in shapes:
+        data = torch.rand(rows, features)
+        rates = {}
+        for name in ('eager', 'engine'):
+            torch.manual_seed(0)
+            generator, discriminator = make_generator(noise_dim, features), make_discriminator(features)
+            if name == 'eager':
+                g_opt = optim.Adam(generator.parameters(), lr=0.0002)
+                d_opt = optim.Adam(discriminator.parameters(), lr=0.0002)
+                run = lambda k: eager_gan_epoch(generator, discriminator, g_opt, d_opt, data, noise_dim, batch_size, max_steps=k)
+            else:
+                engine = GANTrainingEngine(generator, discriminator, noise_dim, batch_size, compile_models=compile_models)
+                run = lambda k: engine.train_epoch(data, max_steps=k)
+            run(5)  # warm-up (and compilation)
+            t0 = time.perf_counter()
+            done = run(steps)['steps']
+            rates[name] = done / (time.perf_counter() - t0)
+        report[f'{rows}x{features}'] = {
+            'eager_steps_per_second': rates['eager'],
+            'engine_steps_per_second': rates['engine'],
+            'speedup': rates['engine'] / rates['eager'],
+        }
+    return report
@@ -0,0 +1,280 @@
+import os
+import json
+import math
+import hashlib
+import time
+import logging
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import torch
+
+from src.training.checkpoint_manager import CheckpointManager
+from src.training.gan_training_engine import GANTrainingEngine
+
+SWEEP_WORKERS = int(os.getenv('SWEEP_WORKERS', max(1, (os.cpu_count() or 1) // 2)))
+# Intra-op threads per worker; workers x threads should not exceed the cores
+SWEEP_THREADS_PER_WORKER = int(os.getenv('SWEEP_THREADS_PER_WORKER', 1))
+# Successive halving keeps the best 1/eta of the candidates at each rung
+SWEEP_ETA = int(os.getenv('SWEEP_ETA', 3))
+# 'spawn' avoids forking a parent whose torch/OpenMP thread pools are already running
+SWEEP_START_METHOD = os.getenv('SWEEP_START_METHOD', 'spawn')
+SWEEP_EVAL_ROWS = int(os.getenv('SWEEP_EVAL_ROWS', 10_000))
+DEFAULT_GAN_CONFIG = {'noise_dim': 24, 'batch_size': 256, 'lr': 0.0002}
+
+
+class SharedArray:
+    """
+    A float32 array copied once into a named shared-memory block. Workers attach by spec and read the same
+    pages without pickling the data. The creating process unlinks the block on close().
+    """
+    def __init__(self, array: np.ndarray):
+        array = np.asarray(array, dtype=np.float32)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        self.array = np.ndarray(array.shape, dtype=np.float32, buffer=self._shm.buf)
+        self.array[:] = array
+        self.spec = {'name': self._shm.name, 'shape': array.shape}
+    def close(self) -> None:
+        self.array = None
+        self._shm.close()
+        self._shm.unlink()
+    def __enter__(self) -> 'SharedArray':
+        return self
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+# Worker-side attachments, one per shared block per process
+_ATTACHED: Dict[str, Tuple[shared_memory.SharedMemory, np.ndarray]] = {}
+
+def attach_shared_array(spec: Dict[str, Any]) -> np.ndarray:
+    if spec['name'] not in _ATTACHED:
+        try:
+            # Python 3.13+: only the creating process tracks (and unlinks) the block
+            shm = shared_memory.SharedMemory(name=spec['name'], track=False)
+        except TypeError:
+            # Older versions register the attachment too, but with the resource tracker the parent shares
+            # with its spawned/forked workers; the parent's unlink() settles it, so nothing to undo here
+            shm = shared_memory.SharedMemory(name=spec['name'])
+        _ATTACHED[spec['name']] = (shm, np.ndarray(tuple(spec['shape']), dtype=np.float32, buffer=shm.buf))
+    return _ATTACHED[spec['name']][1]
+
+
+def expand_grid(space: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Cartesian product of a search space (name -> candidate values) over DEFAULT_GAN_CONFIG.
+    """
+    names = sorted(space)
+    return [dict(DEFAULT_GAN_CONFIG, **dict(zip(names, values))) for values in itertools.product(*(space[n] for n in names))]
+
+
+def halving_rungs(min_epochs: int, max_epochs: int, eta: int = SWEEP_ETA) -> List[int]:
+    """
+    Cumulative epoch budgets per rung: min_epochs, min_epochs*eta, ... capped at max_epochs.
+    """
+    rungs, epochs = [], max(1, min_epochs)
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= max(2, eta)
+    rungs.append(max_epochs)
+    return rungs
+
+
+def marginal_fidelity_error(real: np.ndarray, synth: np.ndarray) -> float:
+    """
+    Mean over columns of |mean|, |std| and 5/50/95% quantile differences between real and synthetic rows
+    (both in the preprocessed space). Lower is better.
+    """
+    q = (0.05, 0.5, 0.95)
+    error = np.abs(real.mean(axis=0) - synth.mean(axis=0)) + np.abs(real.std(axis=0) - synth.std(axis=0))
+    error += np.abs(np.quantile(real, q, axis=0) - np.quantile(synth, q, axis=0)).mean(axis=0)
+    return float(error.mean())
+
+
+def array_version(data: np.ndarray) -> str:
+    """
+    Content hash of a training array (shape and float32 bytes), for keying checkpoints to the data.
+    """
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    h = hashlib.blake2b(repr(data.shape).encode('utf-8'), digest_size=16)
+    h.update(memoryview(data).cast('B'))
+    return h.hexdigest()
+
+
+def _qualified_name(fn: Callable) -> str:
+    return f"{getattr(fn, '__module__', '')}.{getattr(fn, '__qualname__', type(fn).__qualname__)}"
+
+
+def candidate_key(index: int, config: Dict[str, Any], data_version: str, make_generator: Callable, make_discriminator: Callable, seed: int) -> str:
+    """
+    'cand<index>-<digest>': the digest covers the config, data, architectures and seed, so a rerun in the same
+    output_dir only resumes checkpoints of the identical candidate.
+    """
+    spec = {
+        'config': config, 'data': data_version, 'seed': seed,
+        'generator': _qualified_name(make_generator), 'discriminator': _qualified_name(make_discriminator),
+    }
+    digest = hashlib.blake2b(json.dumps(spec, sort_keys=True, default=str).encode('utf-8'), digest_size=5).hexdigest()
+    return f'cand{index:03d}-{digest}'
+
+
+def _init_worker(threads: int) -> None:
+    torch.set_num_threads(max(1, threads))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:  # already set in this process
+        pass
+
+
+def train_candidate(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Worker: continue one candidate from its last rung checkpoint to task['epochs'] total epochs on the
+    shared training array, checkpoint it, and score it by marginal fidelity on a fixed sample of rows.
+    """
+    t0 = time.perf_counter()
+    data = torch.from_numpy(attach_shared_array(task['shared']))
+    config, data_dim = task['config'], data.shape[1]
+    torch.manual_seed(task['seed'])
+    generator = task['make_generator'](config['noise_dim'], data_dim)
+    discriminator = task['make_discriminator'](data_dim)
+    engine = GANTrainingEngine(generator, discriminator, config['noise_dim'], config['batch_size'], lr=config['lr'])
+    state = {'generator': generator, 'discriminator': discriminator, 'g_optimizer': engine.g_optimizer, 'd_optimizer': engine.d_optimizer}
+    checkpoints = CheckpointManager(task['checkpoint_dir'], task['key'], interval=task['epochs'], keep_last=1, keep_best=0)
+    latest = checkpoints.latest()
+    if latest is not None and latest['epoch'] > task['epochs']:
+        # Trained past this rung by an earlier run; retention would keep it over this rung's checkpoint
+        checkpoints.clear()
+    payload = checkpoints.resume(state)
+    start = 0
+    if payload is not None:
+        start = payload['epoch']
+        torch.set_rng_state(payload['state']['rng'])
+    losses = {'d_loss': None, 'g_loss': None}
+    for _ in range(start, task['epochs']):
+        losses = engine.train_epoch(data)
+    checkpoints.save(task['epochs'], dict(state, rng=torch.get_rng_state()), metrics=losses, force=True)
+    checkpoints.close()
+    rows = np.random.default_rng(0).choice(len(data), size=min(task['eval_rows'], len(data)), replace=False)
+    real = data.numpy()[np.sort(rows)]
+    gen = torch.Generator().manual_seed(task['seed'])
+    generator.eval()
+    with torch.no_grad():
+        synth = generator(torch.randn((len(real), config['noise_dim']), generator=gen)).numpy()
+    return {
+        'key': task['key'],
+        'config': config,
+        'epochs': task['epochs'],
+        'epochs_trained': task['epochs'] - start,
+        'fidelity_error': marginal_fidelity_error(real, synth),
+        'd_loss': losses['d_loss'],
+        'g_loss': losses['g_loss'],
+        'seconds': time.perf_counter() - t0,
+        'checkpoint': os.path.join(task['checkpoint_dir'], checkpoints.latest()['file']),
+    }
+
+
+def successive_halving(
+    data: np.ndarray,
+    configs: List[Dict[str, Any]],
+    output_dir: str,
+    make_generator: Callable[[int, int], torch.nn.Module],
+    make_discriminator: Callable[[int], torch.nn.Module],
+    min_epochs: int = 1,
+    max_epochs: int = 27,
+    eta: int = SWEEP_ETA,
+    max_workers: int = SWEEP_WORKERS,
+    threads_per_worker: int = SWEEP_THREADS_PER_WORKER,
+    eval_rows: int = SWEEP_EVAL_ROWS,
+    seed: int = 0,
+    data_version: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Train all configs for the first rung's epochs in a process pool, keep the best 1/eta by fidelity error,
+    continue the survivors from their checkpoints to the next rung's budget, and so on up to max_epochs.
+    `data` is placed in shared memory once; make_generator/make_discriminator must be picklable
+    (e.g. module-level classes). Checkpoints are keyed by candidate_key (data_version defaults to a hash
+    of `data`). Returns each candidate's latest result with the rung it reached, ordered best first
+    (furthest rung, then lowest error).
+    """
+    checkpoint_dir = os.path.join(output_dir, 'sweep_checkpoints')
+    rungs = halving_rungs(min_epochs, max_epochs, eta)
+    results: Dict[str, Dict[str, Any]] = {}
+    data_version = data_version or array_version(data)
+    alive = [candidate_key(i, c, data_version, make_generator, make_discriminator, seed) for i, c in enumerate(configs)]
+    by_key = dict(zip(alive, configs))
+    context = multiprocessing.get_context(SWEEP_START_METHOD)
+    with SharedArray(data) as shared, ProcessPoolExecutor(
+        max_workers=max(1, min(max_workers, len(configs))), mp_context=context,
+        initializer=_init_worker, initargs=(threads_per_worker,)
+    ) as pool:
+        for rung, epochs in enumerate(rungs):
+            tasks = [{
+                'key': key, 'config': by_key[key], 'epochs': epochs, 'shared': shared.spec,
+                'checkpoint_dir': checkpoint_dir, 'make_generator': make_generator,
+                'make_discriminator': make_discriminator, 'eval_rows': eval_rows, 'seed': seed,
+            } for key in alive]
+            for result in pool.map(train_candidate, tasks):
+                results[result['key']] = dict(result, rung=rung)
+            ranked = sorted(alive, key=lambda k: results[k]['fidelity_error'])
+            logging.info(f"Sweep rung {rung} ({epochs} epochs): best {ranked[0]} error={results[ranked[0]]['fidelity_error']:.4f}")
+            if rung < len(rungs) - 1:
+                alive = ranked[:max(1, len(ranked) // max(2, eta))]
+    return sorted(results.values(), key=lambda r: (-r['rung'], r['fidelity_error']))
+
+
+def load_candidate_generator(result: Dict[str, Any], make_generator: Callable[[int, int], torch.nn.Module], data_dim: int) -> torch.nn.Module:
+    payload = torch.load(result['checkpoint'], map_location='cpu', weights_only=False)
+    generator = make_generator(result['config']['noise_dim'], data_dim)
+    generator.load_state_dict(payload['state']['generator'])
+    return generator.eval()
+
+
+def write_leaderboard(entries: List[Dict[str, Any]], path: str) -> str:
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(entries, f, indent=2, default=str)
+    os.replace(tmp, path)
+    return path
+
+
+def run_sweep(
+    data: np.ndarray,
+    search_space: Dict[str, List[Any]],
+    output_dir: str,
+    make_generator: Callable[[int, int], torch.nn.Module],
+    make_discriminator: Callable[[int], torch.nn.Module],
+    report_fn: Optional[Callable[[torch.nn.Module, Dict[str, Any]], Dict[str, Any]]] = None,
+    finalists: int = 3,
+    min_epochs: int = 1,
+    eta: int = SWEEP_ETA,
+    max_workers: int = SWEEP_WORKERS,
+    threads_per_worker: int = SWEEP_THREADS_PER_WORKER,
+    eval_rows: int = SWEEP_EVAL_ROWS,
+    seed: int = 0,
+    data_version: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Successive-halving sweep over a search space of noise_dim/batch_size/lr/epochs values. 'epochs' sets the
+    budget (its largest value is the final rung) rather than being a grid axis. The top `finalists` are then
+    passed to report_fn(generator, result), whose privacy/utility metrics (a run_report) are merged into
+    their leaderboard rows. The leaderboard is written to <output_dir>/leaderboard.json and returned.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    space = dict(search_space)
+    max_epochs = max(space.pop('epochs', [27]))
+    configs = expand_grid(space)
+    results = successive_halving(
+        data, configs, output_dir, make_generator, make_discriminator, min_epochs=min_epochs,
+        max_epochs=max_epochs, eta=eta, max_workers=max_workers, threads_per_worker=threads_per_worker,
+        eval_rows=eval_rows, seed=seed, data_version=data_version
+    )
+    leaderboard = []
+    for position, result in enumerate(results):
+        entry = {'rank': position + 1, **result}
+        if report_fn is not None and position < finalists:
+            entry['report'] = report_fn(load_candidate_generator(result, make_generator, data.shape[1]), result)
+        leaderboard.append(entry)
+    write_leaderboard(leaderboard, os.path.join(output_dir, 'leaderboard.json'))
+    return leaderboard
@@ -0,0 +1,214 @@
+import os
+import time
+import queue
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+import numpy as np
+import torch
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # optional: only needed to train from Arrow IPC files
+    pa = None
+
+# Rows read per contiguous block; several blocks are mixed per shuffle buffer
+BLOCK_ROWS = int(os.getenv('OOC_BLOCK_ROWS', 65_536))
+BLOCKS_PER_BUFFER = int(os.getenv('OOC_BLOCKS_PER_BUFFER', 4))
+PREFETCH_BATCHES = int(os.getenv('OOC_PREFETCH_BATCHES', 8))
+
+
+class ArrayRowSource:
+    """
+    Rows of a 2-D array-like (np.memmap, including column-sliced views, or an ndarray) read block by block.
+    """
+    def __init__(self, array: np.ndarray):
+        if array.ndim != 2:
+            raise ValueError('Expected a 2-D array of rows')
+        self.array = array
+        self.shape = array.shape
+    def __len__(self) -> int:
+        return self.shape[0]
+    def read(self, start: int, stop: int) -> np.ndarray:
+        # A contiguous row range: sequential reads of only those pages
+        return np.ascontiguousarray(self.array[start:stop], dtype=np.float32)
+
+
+class ArrowRowSource:
+    """
+    Rows of a memory-mapped, uncompressed Arrow IPC file (numeric columns), stacked per block.
+    """
+    def __init__(self, path: str):
+        if pa is None:
+            raise ImportError('pyarrow is required to train from Arrow files')
+        self.table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        self.shape = (self.table.num_rows, self.table.num_columns)
+    def __len__(self) -> int:
+        return self.shape[0]
+    def read(self, start: int, stop: int) -> np.ndarray:
+        block = self.table.slice(start, stop - start)
+        out = np.empty((stop - start, self.shape[1]), dtype=np.float32)
+        for j, column in enumerate(block.columns):
+            out[:, j] = column.to_numpy()
+        return out
+
+
+def make_row_source(data: Union[str, np.ndarray]):
+    """
+    Row source for a .npy path (memory-mapped), an Arrow/Feather path, or an array already in hand.
+    """
+    if isinstance(data, str):
+        if data.endswith('.npy'):
+            return ArrayRowSource(np.load(data, mmap_mode='r'))
+        if data.endswith(('.arrow', '.feather', '.ipc')):
+            return ArrowRowSource(data)
+        raise ValueError(f'Unsupported out-of-core training file: {data}')
+    return ArrayRowSource(data)
+
+
+class BlockShuffleSampler:
+    """
+    Approximate shuffling with sequential I/O: each epoch visits contiguous blocks in random order,
+    pools blocks_per_buffer of them and shuffles rows within the pool.
+    """
+    def __init__(self, n_rows: int, block_rows: int = BLOCK_ROWS, blocks_per_buffer: int = BLOCKS_PER_BUFFER, seed: Optional[int] = None):
+        self.n_rows = n_rows
+        self.block_rows = max(1, block_rows)
+        self.blocks_per_buffer = max(1, blocks_per_buffer)
+        self.rng = np.random.default_rng(seed)
+    def buffers(self) -> Iterator[list]:
+        """
+        One epoch of shuffle buffers, each a list of (start, stop) blocks.
+        """
+        starts = np.arange(0, self.n_rows, self.block_rows)
+        self.rng.shuffle(starts)
+        for i in range(0, len(starts), self.blocks_per_buffer):
+            yield [(int(s), min(int(s) + self.block_rows, self.n_rows)) for s in starts[i:i + self.blocks_per_buffer]]
+    def permutation(self, n: int) -> np.ndarray:
+        return self.rng.permutation(n)
+
+
+class PrefetchingBatchLoader:
+    """
+    Batches from a row source that is never loaded whole. A background thread reads shuffle buffers,
+    cuts them into batch_size tensors (pinned when feeding CUDA) and keeps up to `prefetch` batches ready,
+    so file reads overlap the training step. Rows that do not fill a batch carry over to the next buffer;
+    only the final remainder of an epoch (< batch_size rows) is dropped, as in the full-batch in-memory loop.
+    """
+    def __init__(
+        self,
+        source,
+        batch_size: int,
+        block_rows: int = BLOCK_ROWS,
+        blocks_per_buffer: int = BLOCKS_PER_BUFFER,
+        prefetch: int = PREFETCH_BATCHES,
+        pin_memory: bool = False,
+        seed: Optional[int] = None
+    ):
+        self.source = source
+        self.batch_size = min(batch_size, len(source))
+        self.sampler = BlockShuffleSampler(len(source), max(block_rows, self.batch_size), blocks_per_buffer, seed)
+        self.prefetch = max(1, prefetch)
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+    def __len__(self) -> int:
+        return len(self.source) // self.batch_size
+    @staticmethod
+    def _put(out: 'queue.Queue', item, stop: threading.Event) -> bool:
+        # Bounded put that gives up once the consumer has gone away
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    def _produce(self, out: 'queue.Queue', stop: threading.Event) -> None:
+        try:
+            carry = None
+            for blocks in self.sampler.buffers():
+                rows = np.concatenate([self.source.read(a, b) for a, b in blocks])
+                rows = rows[self.sampler.permutation(len(rows))]
+                if carry is not None:
+                    rows = np.concatenate([carry, rows])
+                n_full = len(rows) // self.batch_size * self.batch_size
+                for i in range(0, n_full, self.batch_size):
+                    batch = torch.from_numpy(rows[i:i + self.batch_size])
+                    if self.pin_memory:
+                        batch = batch.pin_memory()
+                    if not self._put(out, batch, stop):
+                        return
+                carry = rows[n_full:] if n_full < len(rows) else None
+        except BaseException as e:
+            self._put(out, e, stop)
+            return
+        self._put(out, None, stop)
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        out: 'queue.Queue' = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        worker = threading.Thread(target=self._produce, args=(out, stop), name='ooc-prefetch', daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = out.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            worker.join()
+
+
+def benchmark_out_of_core(
+    make_generator: Callable[[int, int], Any],
+    make_discriminator: Callable[[int], Any],
+    n_rows: int = 200_000,
+    n_features: int = 64,
+    noise_dim: int = 24,
+    batch_size: int = 256,
+    steps: int = 300,
+    block_rows: int = BLOCK_ROWS
+) -> Dict[str, Any]:
+    """
+    Training steps/second with the whole table in one tensor vs streamed from a memory-mapped .npy
+    through PrefetchingBatchLoader, plus the bytes each mode has to hold resident for the dataset.
+    """
+    from src.training.gan_training_engine import GANTrainingEngine
+    workdir = tempfile.mkdtemp(prefix='ooc_bench_')
+    try:
+        path = os.path.join(workdir, 'data.npy')
+        mm = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n_rows, n_features))
+        mm[:] = np.random.default_rng(0).random((n_rows, n_features), dtype=np.float32)
+        mm.flush()
+        del mm
+        rates = {}
+        for mode in ('in_memory', 'memmap'):
+            torch.manual_seed(0)
+            engine = GANTrainingEngine(make_generator(noise_dim, n_features), make_discriminator(n_features), noise_dim, batch_size)
+            if mode == 'in_memory':
+                data = torch.tensor(np.load(path), dtype=torch.float32)
+                run = lambda k: engine.train_epoch(data, max_steps=k)
+            else:
+                loader = PrefetchingBatchLoader(make_row_source(path), batch_size, block_rows=block_rows, seed=0)
+                run = lambda k: engine.train_loader_epoch(loader, n_features, max_steps=k)
+            run(5)
+            t0 = time.perf_counter()
+            done = run(steps)['steps']
+            rates[mode] = done / (time.perf_counter() - t0)
+        # A shuffle buffer exists twice while it is permuted, plus the prefetched batches
+        buffer_rows = min(block_rows * BLOCKS_PER_BUFFER, n_rows)
+        loader_bytes = (2 * buffer_rows + PREFETCH_BATCHES * batch_size) * n_features * 4
+        return {
+            'n_rows': n_rows,
+            'n_features': n_features,
+            'in_memory_steps_per_second': rates['in_memory'],
+            'memmap_steps_per_second': rates['memmap'],
+            'throughput_ratio': rates['memmap'] / rates['in_memory'],
+            'in_memory_dataset_bytes': n_rows * n_features * 4,
+            'memmap_buffer_bytes': loader_bytes,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
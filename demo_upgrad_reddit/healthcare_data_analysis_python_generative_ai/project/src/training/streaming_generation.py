@@ -0,0 +1,203 @@
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional: CSV output works without it
+    pa = None
+
+from src.data.tabular_io import resolve_output_format, write_tabular_file
+from src.training.streaming_preprocessing import TabularTransform
+
+# Rows drawn, decoded and written per batch; memory stays O(batch) whatever the number of samples
+GENERATION_BATCH_ROWS = int(os.getenv('GENERATION_BATCH_ROWS', 65_536))
+
+
+def iter_generated_batches(
+    generator: nn.Module,
+    num_samples: int,
+    noise_dim: int,
+    batch_size: int = GENERATION_BATCH_ROWS,
+    device: Optional[str] = None,
+    seed: Optional[int] = None
+) -> Iterator[np.ndarray]:
+    """
+    Generator output in fixed-size batches (the last one may be short) from one reused noise buffer.
+    Each yielded array is only valid until the next one is requested.
+    """
+    if device is None:
+        device = next(generator.parameters()).device
+    rng = torch.Generator(device=device)
+    if seed is not None:
+        rng.manual_seed(seed)
+    else:
+        rng.seed()
+    noise = torch.empty((min(batch_size, max(num_samples, 1)), noise_dim), device=device)
+    generator.eval()
+    with torch.no_grad():
+        for start in range(0, num_samples, noise.shape[0]):
+            z = noise[:min(noise.shape[0], num_samples - start)]
+            z.normal_(generator=rng)
+            yield generator(z).cpu().numpy()
+
+
+class BatchDecoder:
+    """
+    Inverse transform for generated batches. Min-max scaling of every column is undone by one fused
+    multiply-add into a reused float64 buffer; categorical codes are decoded with np.take on the class arrays.
+    """
+    def __init__(self, transform: TabularTransform, columns: Optional[List[str]] = None):
+        self.transform = transform
+        self.columns = list(columns or transform.feature_columns)
+        self.scale, self.offset = transform.inverse_affine(self.columns)
+        self._buffer = np.empty((0, len(self.columns)), dtype=np.float64)
+    def __call__(self, batch: np.ndarray) -> Dict[str, np.ndarray]:
+        n = batch.shape[0]
+        if self._buffer.shape[0] < n:
+            self._buffer = np.empty((n, len(self.columns)), dtype=np.float64)
+        values = np.multiply(batch, self.scale, out=self._buffer[:n])
+        values += self.offset
+        out = {}
+        for j, col in enumerate(self.columns):
+            if col in self.transform.categories:
+                out[col] = self.transform.decode_category(col, values[:, j])
+            else:
+                # Copy: the buffer is overwritten by the next batch
+                out[col] = values[:, j].copy()
+        return out
+
+
+class IncrementalTableWriter:
+    """
+    Appends column batches to a CSV, zstd Parquet (one row group per batch) or uncompressed Arrow IPC file.
+    Writes go to a temporary file that replaces `path` only when close() succeeds, so readers never see a
+    partial output. Parquet and Arrow output require pyarrow.
+    """
+    def __init__(self, path: str, columns: List[str], output_format: Optional[str] = None):
+        self.path = path
+        self.columns = list(columns)
+        self.format = resolve_output_format(output_format, path)
+        if self.format != 'csv' and pa is None:
+            raise ImportError(f'pyarrow is required to write {self.format} output')
+        self.rows = 0
+        self._tmp = path + '.tmp'
+        self._file = None
+        self._writer = None
+    def write(self, batch: Dict[str, np.ndarray]) -> None:
+        if self.format == 'csv':
+            if self._file is None:
+                self._file = open(self._tmp, 'w', newline='')
+            pd.DataFrame(batch, columns=self.columns).to_csv(self._file, index=False, header=self.rows == 0)
+        else:
+            table = pa.Table.from_pydict({c: batch[c] for c in self.columns})
+            if self._writer is None:
+                if self.format == 'parquet':
+                    self._writer = pq.ParquetWriter(self._tmp, table.schema, compression='zstd')
+                else:
+                    self._writer = pa.ipc.new_file(self._tmp, table.schema)
+            self._writer.write_table(table)
+        self.rows += len(batch[self.columns[0]])
+    def close(self) -> None:
+        if self._writer is None and self._file is None:
+            # No rows: still produce a readable file with the header/schema
+            self.write({c: np.empty(0) for c in self.columns})
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        os.replace(self._tmp, self.path)
+    def abort(self) -> None:
+        for handle in (self._writer, self._file):
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+    def __enter__(self) -> 'IncrementalTableWriter':
+        return self
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def generate_to_file(
+    generator: nn.Module,
+    transform: TabularTransform,
+    path: str,
+    num_samples: int,
+    noise_dim: int,
+    columns: Optional[List[str]] = None,
+    batch_size: int = GENERATION_BATCH_ROWS,
+    output_format: Optional[str] = None,
+    device: Optional[str] = None,
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Sample num_samples rows in batches, decode each batch to original units and append it to `path`,
+    so peak memory is set by batch_size rather than num_samples. Returns generation stats.
+    """
+    decoder = BatchDecoder(transform, columns)
+    t0 = time.perf_counter()
+    batches = 0
+    with IncrementalTableWriter(path, decoder.columns, output_format) as writer:
+        for batch in iter_generated_batches(generator, num_samples, noise_dim, batch_size, device, seed):
+            writer.write(decoder(batch))
+            batches += 1
+    seconds = time.perf_counter() - t0
+    return {
+        'path': path,
+        'format': writer.format,
+        'rows': writer.rows,
+        'batches': batches,
+        'batch_size': batch_size,
+        'seconds': seconds,
+        'rows_per_second': writer.rows / seconds if seconds > 0 else None,
+    }
+
+
+def benchmark_streaming_generation(
+    make_generator: Callable[[int, int], nn.Module],
+    transform: TabularTransform,
+    workdir: str,
+    num_samples: int = 1_000_000,
+    noise_dim: int = 24,
+    batch_size: int = GENERATION_BATCH_ROWS,
+    output_format: str = 'parquet'
+) -> Dict[str, Any]:
+    """
+    Rows/second of one-shot generation (single forward pass, inverse_frame, whole-table write) vs
+    generate_to_file, plus the decoded-array bytes each has to hold at once.
+    """
+    columns = transform.feature_columns
+    torch.manual_seed(0)
+    generator = make_generator(noise_dim, len(columns))
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        synth = generator.eval()(torch.randn((num_samples, noise_dim))).numpy()
+    write_tabular_file(transform.inverse_frame(synth, columns), os.path.join(workdir, 'one_shot.' + output_format), output_format)
+    one_shot = time.perf_counter() - t0
+    del synth
+    stats = generate_to_file(
+        generator, transform, os.path.join(workdir, 'streamed.' + output_format), num_samples, noise_dim,
+        batch_size=batch_size, output_format=output_format, seed=0
+    )
+    row_bytes = len(columns) * (4 + 8)  # float32 generator output + float64 decoded values
+    return {
+        'num_samples': num_samples,
+        'one_shot_rows_per_second': num_samples / one_shot,
+        'streamed_rows_per_second': stats['rows_per_second'],
+        'speedup': stats['rows_per_second'] / (num_samples / one_shot),
+        'one_shot_array_bytes': num_samples * row_bytes,
+        'streamed_array_bytes': min(batch_size, num_samples) * row_bytes,
+    }
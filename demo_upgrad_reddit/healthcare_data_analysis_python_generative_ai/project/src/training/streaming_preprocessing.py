@@ -0,0 +1,260 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+PREPROCESS_CHUNK_ROWS = int(os.getenv('PREPROCESS_CHUNK_ROWS', 200_000))
+# Bump when the artifact layout or the transform semantics change; older artifacts are refitted
+TRANSFORM_SCHEMA_VERSION = 1
+
+
+def _file_identity(path: str) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+class TabularTransform:
+    """
+    Fitted preprocessing for a tabular extract: label codes for categorical columns (sorted string classes,
+    as LabelEncoder), min-max scaling for numeric columns (as MinMaxScaler; NaNs pass through), other columns
+    cast to float32. Output column order is features first, target (if any) last.
+    """
+    def __init__(
+        self,
+        columns: List[str],
+        cat_cols: List[str],
+        num_cols: List[str],
+        categories: Dict[str, List[str]],
+        data_min: Dict[str, float],
+        data_max: Dict[str, float],
+        target_col: Optional[str] = None,
+        n_rows: int = 0,
+        source: Optional[Dict[str, Any]] = None,
+        output: Optional[Dict[str, Any]] = None
+    ):
+        self.columns = list(columns)
+        self.cat_cols = list(cat_cols)
+        self.num_cols = list(num_cols)
+        self.categories = {c: np.asarray(v, dtype=object) for c, v in categories.items()}
+        self.data_min = dict(data_min)
+        self.data_max = dict(data_max)
+        self.target_col = target_col
+        self.n_rows = n_rows
+        self.source = source or {}
+        self.output = output or {}
+        self._index = {c: i for i, c in enumerate(self.columns)}
+        # Vectors for the fused affine transform over numeric columns
+        self._num_idx = np.array([self._index[c] for c in self.num_cols], dtype=np.intp)
+        lo = np.array([self.data_min[c] for c in self.num_cols], dtype=np.float64)
+        span = np.array([self.data_max[c] - self.data_min[c] for c in self.num_cols], dtype=np.float64)
+        span[~(span > 0)] = 1.0  # constant column: MinMaxScaler maps it to 0
+        self._lo, self._span = lo, span
+    @property
+    def feature_columns(self) -> List[str]:
+        return [c for c in self.columns if c != self.target_col]
+    @property
+    def version(self) -> str:
+        """
+        Content hash of the fitted parameters: equal versions transform identically.
+        """
+        fitted = {
+            'schema': TRANSFORM_SCHEMA_VERSION, 'columns': self.columns, 'cat_cols': self.cat_cols,
+            'num_cols': self.num_cols, 'target_col': self.target_col,
+            'categories': {c: v.tolist() for c, v in self.categories.items()},
+            'min': self.data_min, 'max': self.data_max,
+        }
+        return hashlib.blake2b(json.dumps(fitted, sort_keys=True, default=str).encode('utf-8'), digest_size=16).hexdigest()
+    def transform_chunk(self, chunk: pd.DataFrame, columns: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Rows of `chunk` in the transformed space, over `columns` (default: all columns) in that order.
+        """
+        columns = list(columns or self.columns)
+        out = np.empty((len(chunk), len(columns)), dtype=np.float32)
+        for i, col in enumerate(columns):
+            if col in self.categories:
+                codes = pd.Categorical(chunk[col].astype(str), categories=self.categories[col]).codes
+                if (codes < 0).any():
+                    unseen = sorted(set(chunk[col].astype(str)[codes < 0]))[:5]
+                    raise ValueError(f'Column {col!r} has categories not seen during fit: {unseen}')
+                out[:, i] = codes
+            else:
+                out[:, i] = chunk[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        scale, offset = self.inverse_affine(columns)
+        out[:] = (out - offset) / scale
+        return out
+    def encode_frame(self, frame: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Decoded rows (original units, string categories; e.g. a synthetic output file) back in the
+        transformed space the models and the preprocessed real data use.
+        """
+        columns = list(columns or self.columns)
+        return pd.DataFrame(self.transform_chunk(frame, columns), columns=columns, index=frame.index)
+    def inverse_numeric(self, arr: np.ndarray) -> np.ndarray:
+        """
+        Undo min-max scaling in place on the numeric columns of a (rows, len(columns)) float array.
+        """
+        if len(self._num_idx):
+            arr[:, self._num_idx] = arr[:, self._num_idx] * self._span + self._lo
+        return arr
+    def decode_category(self, col: str, values: np.ndarray) -> np.ndarray:
+        # Generated codes are continuous: round and clip into the class range, then gather
+        classes = self.categories[col]
+        codes = np.clip(np.rint(values), 0, len(classes) - 1).astype(np.intp)
+        return np.take(classes, codes)
+    def inverse_affine(self, columns: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (scale, offset) vectors over `columns` so that original = transformed * scale + offset for every
+        column at once (identity for categorical and pass-through columns).
+        """
+        scale, offset = np.ones(len(columns)), np.zeros(len(columns))
+        position = {c: k for k, c in enumerate(self.num_cols)}
+        for j, col in enumerate(columns):
+            if col in position:
+                scale[j], offset[j] = self._span[position[col]], self._lo[position[col]]
+        return scale, offset
+    def inverse_frame(self, arr: np.ndarray, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        DataFrame in original units from transformed rows whose columns are `columns` (default: all columns).
+        """
+        columns = list(columns or self.columns)
+        scale, offset = self.inverse_affine(columns)
+        values = np.asarray(arr, dtype=np.float64) * scale + offset
+        data = {}
+        for j, col in enumerate(columns):
+            data[col] = self.decode_category(col, values[:, j]) if col in self.categories else values[:, j]
+        return pd.DataFrame(data, columns=columns)
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'schema': TRANSFORM_SCHEMA_VERSION,
+            'version': self.version,
+            'columns': self.columns,
+            'cat_cols': self.cat_cols,
+            'num_cols': self.num_cols,
+            'target_col': self.target_col,
+            'categories': {c: v.tolist() for c, v in self.categories.items()},
+            'min': self.data_min,
+            'max': self.data_max,
+            'n_rows': self.n_rows,
+            'source': self.source,
+            'output': self.output,
+        }
+    def save(self, path: str) -> str:
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        os.replace(tmp, path)
+        return self.version
+    @classmethod
+    def load(cls, path: str) -> 'TabularTransform':
+        with open(path) as f:
+            d = json.load(f)
+        if d.get('schema') != TRANSFORM_SCHEMA_VERSION:
+            raise ValueError(f"Transform artifact {path} has schema {d.get('schema')}, expected {TRANSFORM_SCHEMA_VERSION}")
+        transform = cls(
+            d['columns'], d['cat_cols'], d['num_cols'], d['categories'], d['min'], d['max'],
+            target_col=d['target_col'], n_rows=d['n_rows'], source=d['source'], output=d['output'],
+        )
+        if transform.version != d['version']:
+            raise ValueError(f'Transform artifact {path} does not match its recorded version')
+        return transform
+
+
+def _read_chunks(data_path: str, deid_cols: List[str], chunksize: int):
+    drop = set(deid_cols)
+    # usecols as a callable skips parsing PHI columns at all
+    return pd.read_csv(data_path, chunksize=chunksize, usecols=lambda c: c not in drop)
+
+
+def fit_streaming_transform(
+    data_path: str,
+    deid_cols: List[str],
+    cat_cols: List[str],
+    num_cols: List[str],
+    target_col: Optional[str] = None,
+    chunksize: int = PREPROCESS_CHUNK_ROWS
+) -> TabularTransform:
+    """
+    Pass 1: category sets and numeric min/max accumulated chunk by chunk; memory is O(chunk + categories).
+    """
+    seen = {c: set() for c in cat_cols}
+    lo = {c: np.inf for c in num_cols}
+    hi = {c: -np.inf for c in num_cols}
+    columns, n_rows = None, 0
+    for chunk in _read_chunks(data_path, deid_cols, chunksize):
+        if columns is None:
+            columns = list(chunk.columns)
+        n_rows += len(chunk)
+        for c in cat_cols:
+            seen[c].update(chunk[c].astype(str).unique())
+        for c in num_cols:
+            values = chunk[c].to_numpy(dtype=np.float64, na_value=np.nan)
+            if np.isfinite(values).any():
+                lo[c] = min(lo[c], float(np.nanmin(values)))
+                hi[c] = max(hi[c], float(np.nanmax(values)))
+    if columns is None:
+        raise ValueError(f'No rows in {data_path}')
+    if target_col is not None:
+        if target_col not in columns:
+            raise ValueError(f'Target column {target_col!r} not in {data_path}')
+        columns = [c for c in columns if c != target_col] + [target_col]
+    return TabularTransform(
+        columns, cat_cols, num_cols,
+        categories={c: sorted(v) for c, v in seen.items()},
+        data_min={c: (lo[c] if np.isfinite(lo[c]) else 0.0) for c in num_cols},
+        data_max={c: (hi[c] if np.isfinite(hi[c]) else 0.0) for c in num_cols},
+        target_col=target_col,
+        n_rows=n_rows,
+        source=dict(_file_identity(data_path), deid_cols=list(deid_cols)),
+    )
+
+
+def preprocess_streaming(
+    data_path: str,
+    deid_cols: List[str],
+    cat_cols: List[str],
+    num_cols: List[str],
+    output_npy: str,
+    artifact_path: Optional[str] = None,
+    target_col: Optional[str] = None,
+    chunksize: int = PREPROCESS_CHUNK_ROWS,
+    reuse: bool = True
+) -> Tuple[np.ndarray, TabularTransform]:
+    """
+    Two-pass chunked preprocessing of a CSV that need not fit in memory. Pass 1 fits the transform, pass 2
+    writes transformed float32 rows into a memory-mapped .npy. The fitted transform is saved as a versioned
+    JSON artifact (default <output_npy>.transform.json); when the artifact matches the same source file,
+    columns and output, both passes are skipped. Returns (read-only memmap, transform).
+    """
+    artifact_path = artifact_path or output_npy + '.transform.json'
+    source = dict(_file_identity(data_path), deid_cols=list(deid_cols))
+    transform = None
+    if reuse and os.path.isfile(artifact_path):
+        try:
+            cached = TabularTransform.load(artifact_path)
+        except ValueError as e:
+            logging.warning(f'Refitting preprocessing: {e}')
+            cached = None
+        if (cached is not None and cached.source == source and cached.cat_cols == list(cat_cols)
+                and cached.num_cols == list(num_cols) and cached.target_col == target_col):
+            transform = cached
+            if os.path.isfile(output_npy) and cached.output == _file_identity(output_npy):
+                logging.info(f'Reusing preprocessed {output_npy} (transform {cached.version})')
+                return np.load(output_npy, mmap_mode='r'), cached
+    if transform is None:
+        transform = fit_streaming_transform(data_path, deid_cols, cat_cols, num_cols, target_col, chunksize)
+    tmp = output_npy + '.tmp.npy'
+    out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=(transform.n_rows, len(transform.columns)))
+    row = 0
+    for chunk in _read_chunks(data_path, deid_cols, chunksize):
+        out[row:row + len(chunk)] = transform.transform_chunk(chunk)
+        row += len(chunk)
+    out.flush()
+    del out
+    os.replace(tmp, output_npy)
+    transform.output = _file_identity(output_npy)
+    transform.save(artifact_path)
+    logging.info(f'Preprocessed {transform.n_rows} rows into {output_npy} (transform {transform.version})')
+    return np.load(output_npy, mmap_mode='r'), transform
@@ -9,11 +9,20 @@ import torch.optim as optim
 from sklearn.preprocessing import MinMaxScaler, LabelEncoder
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
-from typing import Tuple, Dict, Any, List  # Fixed: Ensure List is imported as required
+from typing import Tuple, Dict, Any, List, Union  # Fixed: Ensure List is imported as required
 # Project-specific imports (assumed present)
 from src.utils.dp_metrics import compute_epsilon_delta, membership_inference_attack
-from src.utils.model_versioning import save_model, load_latest_model, version_dataset, log_run_result
-from src.evaluation.tabular_utility import evaluate_downstream_classifier
+from src.utils.model_versioning import save_model, load_latest_model, log_run_result
+from src.data.file_hashing import content_version
+from src.training.checkpoint_manager import CheckpointManager, CHECKPOINT_INTERVAL, CHECKPOINT_KEEP_LAST, CHECKPOINT_KEEP_BEST
+from src.training.streaming_preprocessing import preprocess_streaming
+from src.training.memmap_batches import make_row_source, PrefetchingBatchLoader, benchmark_out_of_core
+from src.training.gan_training_engine import GANTrainingEngine, eager_gan_epoch, benchmark_gan_engine, TYPICAL_TABLE_SHAPES
+from src.training.evaluation_runner import real_baseline, synthetic_utility, run_concurrently, evaluation_frames, EVAL_WORKERS, EVAL_SAMPLE_ROWS
+from src.training.hyperparameter_sweep import run_sweep, SWEEP_ETA, SWEEP_WORKERS, SWEEP_THREADS_PER_WORKER
+from src.training.streaming_generation import generate_to_file, benchmark_streaming_generation, GENERATION_BATCH_ROWS
+
+GAN_TRAINING_ENGINE = os.getenv('GAN_TRAINING_ENGINE', 'optimized')  # 'optimized' or 'eager'
 
 
 def preprocess_healthcare_data(
@@ -86,7 +95,7 @@ class Discriminator(nn.Module):
 
 
 def train_gan(
-    data: np.ndarray,
+    data: Union[np.ndarray, str],
     noise_dim: int,
     epochs: int,
     batch_size: int,
@@ -94,12 +103,19 @@ def train_gan(
     model_name: str,
     logging_path: str,
     lr: float = 0.0002,
-    device: str = None
+    device: str = None,
+    checkpoint_interval: int = CHECKPOINT_INTERVAL,
+    keep_last: int = CHECKPOINT_KEEP_LAST,
+    keep_best: int = CHECKPOINT_KEEP_BEST,
+    checkpoint_metric: str = None,
+    resume: bool = False,
+    engine: str = GAN_TRAINING_ENGINE,
+    out_of_core: bool = None
 ) -> Tuple[Generator, Discriminator]:
     """
     Train a GAN on tabular data using PyTorch.
     Args:
-        data: Numpy array of normalized tabular data.
+        data: Numpy array of normalized tabular data, or a .npy/Arrow path for out-of-core training.
         noise_dim: Dimension of noise input.
         epochs: Number of training epochs.
         batch_size: Batch size.
@@ -108,6 +124,14 @@ def train_gan(
         logging_path: Log file path.
         lr: Learning rate.
         device: Device string, autodetect if None.
+        checkpoint_interval: Checkpoint every N epochs (written by a background thread).
+        keep_last: Number of most recent checkpoints retained.
+        keep_best: Number of best checkpoints retained by checkpoint_metric ('d_loss' or 'g_loss'; min is best).
+        checkpoint_metric: Metric for keep_best; None keeps only the most recent.
+        resume: Continue from the latest retained checkpoint in output_dir, if any.
+        engine: 'optimized' (GANTrainingEngine: preallocated buffers, fused Adam) or 'eager' (original loop).
+        out_of_core: Stream block-shuffled batches from disk instead of copying data into one tensor.
+            Defaults to True for file paths and np.memmap inputs; requires the optimized engine.
     Returns:
         (Trained Generator, Discriminator)
     """
@@ -115,46 +139,84 @@ def train_gan(
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
     os.makedirs(output_dir, exist_ok=True)
     logging.basicConfig(filename=logging_path, filemode='w', level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
-    data_tensor = torch.tensor(data, dtype=torch.float32).to(device)
-    data_dim = data.shape[1]
+    if out_of_core is None:
+        out_of_core = isinstance(data, (str, np.memmap))
+    if out_of_core:
+        if engine != 'optimized':
+            raise ValueError('Out-of-core GAN training requires the optimized engine')
+        source = make_row_source(data)
+        # Seeded from torch so torch.manual_seed also fixes the block order
+        loader = PrefetchingBatchLoader(source, batch_size, pin_memory=str(device).startswith('cuda'), seed=torch.initial_seed())
+        data_tensor, data_dim = None, source.shape[1]
+    else:
+        loader = None
+        data_tensor = torch.tensor(data, dtype=torch.float32).to(device)
+        data_dim = data.shape[1]
     generator = Generator(noise_dim, data_dim).to(device)
     discriminator = Discriminator(data_dim).to(device)
-    g_optimizer = optim.Adam(generator.parameters(), lr=lr)
-    d_optimizer = optim.Adam(discriminator.parameters(), lr=lr)
-    criterion = nn.BCELoss()
-    steps_per_epoch = max(1, data.shape[0] // batch_size)
-    for epoch in range(epochs):
-        perm = torch.randperm(data.shape[0])
-        for i in range(steps_per_epoch):
-            idx = perm[i*batch_size:(i+1)*batch_size]
-            real_data = data_tensor[idx]
-            batch_size_actual = real_data.shape[0]
-            real_labels = torch.ones((batch_size_actual, 1), device=device)
-            fake_labels = torch.zeros((batch_size_actual, 1), device=device)
-            z = torch.randn((batch_size_actual, noise_dim), device=device)
-            fake_data = generator(z)
-            d_real = discriminator(real_data)
-            d_fake = discriminator(fake_data.detach())
-            d_loss = criterion(d_real, real_labels) + criterion(d_fake, fake_labels)
-            d_optimizer.zero_grad()
-            d_loss.backward()
-            d_optimizer.step()
-            z = torch.randn((batch_size_actual, noise_dim), device=device)
-            fake_data = generator(z)
-            d_fake = discriminator(fake_data)
-            g_loss = criterion(d_fake, real_labels)
-            g_optimizer.zero_grad()
-            g_loss.backward()
-            g_optimizer.step()
-        logging.info(f'Epoch {epoch+1}/{epochs} | D_loss={d_loss.item():.4f} | G_loss={g_loss.item():.4f}')
-        # Save checkpoint each epoch (best practice: saves resilience to interruptions)
-        save_model(generator, os.path.join(output_dir, f'{model_name}_generator_epoch{epoch+1}.pt'))
-        save_model(discriminator, os.path.join(output_dir, f'{model_name}_discriminator_epoch{epoch+1}.pt'))
+    if engine == 'optimized':
+        trainer = GANTrainingEngine(generator, discriminator, noise_dim, batch_size, lr=lr, device=device)
+        g_optimizer, d_optimizer = trainer.g_optimizer, trainer.d_optimizer
+    elif engine == 'eager':
+        trainer = None
+        g_optimizer = optim.Adam(generator.parameters(), lr=lr)
+        d_optimizer = optim.Adam(discriminator.parameters(), lr=lr)
+    else:
+        raise ValueError(f"Unknown GAN training engine {engine!r}; expected 'optimized' or 'eager'")
+    checkpoints = CheckpointManager(
+        output_dir, f'{model_name}_ckpt', interval=checkpoint_interval, keep_last=keep_last,
+        keep_best=keep_best, metric=checkpoint_metric
+    )
+    training_state = {'generator': generator, 'discriminator': discriminator, 'g_optimizer': g_optimizer, 'd_optimizer': d_optimizer}
+    start_epoch = 0
+    if resume:
+        payload = checkpoints.resume(training_state, map_location=device)
+        if payload is not None:
+            start_epoch = payload['epoch']
+            torch.set_rng_state(payload['state']['rng'])
+    for epoch in range(start_epoch, epochs):
+        if loader is not None:
+            losses = trainer.train_loader_epoch(loader, data_dim)
+        elif trainer is not None:
+            losses = trainer.train_epoch(data_tensor)
+        else:
+            losses = eager_gan_epoch(generator, discriminator, g_optimizer, d_optimizer, data_tensor, noise_dim, batch_size)
+        logging.info(f"Epoch {epoch+1}/{epochs} | D_loss={losses['d_loss']:.4f} | G_loss={losses['g_loss']:.4f}")
+        # Snapshot in memory; the file is written off the training loop. The last epoch is always kept.
+        checkpoints.save(
+            epoch + 1,
+            dict(training_state, rng=torch.get_rng_state()),
+            metrics={'d_loss': losses['d_loss'], 'g_loss': losses['g_loss']},
+            force=epoch + 1 == epochs
+        )
+    checkpoints.close()
+    logging.info(f'Checkpoints: {checkpoints.stats}')
     save_model(generator, os.path.join(output_dir, f'{model_name}_generator_final.pt'))
     save_model(discriminator, os.path.join(output_dir, f'{model_name}_discriminator_final.pt'))
     return generator, discriminator
 
 
+def benchmark_gan_training(shapes=TYPICAL_TABLE_SHAPES, noise_dim: int = 24, batch_size: int = 256, steps: int = 200) -> Dict[str, Any]:
+    """
+    Steps/second of the eager train_gan loop vs GANTrainingEngine on this module's Generator/Discriminator.
+    """
+    return benchmark_gan_engine(Generator, Discriminator, shapes, noise_dim, batch_size, steps)
+
+
+def benchmark_out_of_core_training(n_rows: int = 1_000_000, n_features: int = 64, batch_size: int = 256) -> Dict[str, Any]:
+    """
+    Steps/second of in-memory vs memmap-streamed GANTrainingEngine epochs on this module's models.
+    """
+    return benchmark_out_of_core(Generator, Discriminator, n_rows, n_features, batch_size=batch_size)
+
+
+def benchmark_synthetic_generation(transform, workdir: str, num_samples: int = 1_000_000, noise_dim: int = 24, output_format: str = 'parquet') -> Dict[str, Any]:
+    """
+    Rows/second and array memory of one-shot vs batched streaming generation with this module's Generator.
+    """
+    return benchmark_streaming_generation(Generator, transform, workdir, num_samples, noise_dim, output_format=output_format)
+
+
 def generate_synthetic_data(
     generator: Generator, num_samples: int, noise_dim: int, device: str = None
 ) -> np.ndarray:
@@ -177,6 +239,49 @@ def generate_synthetic_data(
     return synth
 
 
+def evaluate_synthetic(
+    df: pd.DataFrame,
+    synth_df: pd.DataFrame,
+    target_col: str = None,
+    dp_delta: float = 1e-5,
+    baseline_accuracy_drop: float = 0.1,
+    dataset_version: str = None,
+    max_workers: int = EVAL_WORKERS
+) -> Dict[str, Any]:
+    """
+    Privacy (DP epsilon estimate, membership-inference risk) and downstream utility metrics of a run_report.
+    df and synth_df must be in the same transformed space (see TabularTransform.encode_frame).
+    The evaluations are independent and run concurrently. The real-data baseline classifier is cached by
+    (dataset_version, target_col), so repeated runs on an unchanged dataset only train on the synthetic side.
+    """
+    tasks = {
+        'dp_epsilon': lambda: compute_epsilon_delta(real_df=df, synth_df=synth_df, delta=dp_delta),
+        'mia_risk': lambda: membership_inference_attack(real_df=df, synth_df=synth_df),
+    }
+    if target_col:
+        tasks['baseline'] = lambda: real_baseline(df, target_col, dataset_version)
+        tasks['synthetic_accuracy'] = lambda: synthetic_utility(df, synth_df, target_col)
+    results = run_concurrently(tasks, max_workers=max_workers)
+    logging.info(f"DP epsilon (lower=stronger privacy): {results['dp_epsilon']:.2f}, MIA risk: {results['mia_risk']}")
+    logging.info(f"Evaluation seconds: {results['seconds']}")
+    if target_col:
+        real_acc, synth_acc = results['baseline']['accuracy'], results['synthetic_accuracy']
+        accuracy_drop = real_acc - synth_acc
+        utility_valid = accuracy_drop < baseline_accuracy_drop
+        baseline_cached = results['baseline']['cached']
+    else:
+        real_acc, synth_acc, accuracy_drop, utility_valid, baseline_cached = None, None, None, None, None
+    return {
+        'dp_epsilon': results['dp_epsilon'],
+        'mia_risk': results['mia_risk'],
+        'real_classifier_accuracy': real_acc,
+        'synthetic_classifier_accuracy': synth_acc,
+        'accuracy_drop': accuracy_drop,
+        'utility_valid': utility_valid,
+        'baseline_cached': baseline_cached
+    }
+
+
 def pipeline(
     raw_data_path: str,
     output_dir: str,
@@ -188,10 +293,15 @@ def pipeline(
     epochs: int = 100,
     downstream_target_col: str = None,
     dp_delta: float = 1e-5,
-    baseline_accuracy_drop: float = 0.1
+    baseline_accuracy_drop: float = 0.1,
+    generation_batch_size: int = GENERATION_BATCH_ROWS,
+    eval_sample_rows: int = EVAL_SAMPLE_ROWS
 ) -> Dict[str, Any]:
     """
     Complete workflow for GAN-based tabular healthcare data generation and evaluation.
+    Preprocessing, training and generation stream through disk; evaluation loads at most
+    eval_sample_rows real and synthetic rows (see evaluation_frames), so peak memory does not grow with
+    the table. Metrics on larger tables are therefore estimates from that sample.
     Args:
         raw_data_path: Path to raw healthcare CSV.
         output_dir: Workflow output directory.
@@ -204,19 +314,21 @@ def pipeline(
         downstream_target_col: Optional, for downstream utility classifier.
         dp_delta: For differential privacy epsilon estimation.
         baseline_accuracy_drop: Acceptable accuracy drop as downstream utility threshold.
+        generation_batch_size: Rows sampled and written per batch when generating synthetic data.
+        eval_sample_rows: Rows of real and synthetic data scored by the privacy/utility evaluation.
     Returns:
         Dict with metrics, model/dataset versioning info, logs.
     """
     os.makedirs(output_dir, exist_ok=True)
-    preprocessed_path = os.path.join(output_dir, 'preprocessed.csv')
-    df, meta, scaler, cat_encoders = preprocess_healthcare_data(raw_data_path, deid_cols, cat_cols, num_cols, preprocessed_path)
-    if downstream_target_col and downstream_target_col in df.columns:
-        X = df.drop(columns=[downstream_target_col])
-        y = df[downstream_target_col]
-    else:
-        X = df
-        y = None
-    data_np = X.to_numpy().astype(np.float32)
+    preprocessed_path = os.path.join(output_dir, 'preprocessed.npy')
+    header = pd.read_csv(raw_data_path, nrows=0).columns
+    target_col = downstream_target_col if downstream_target_col in header else None
+    # Chunked two-pass preprocessing into a memmap; the fitted transform artifact is reused across runs
+    data_mm, transform = preprocess_streaming(
+        raw_data_path, deid_cols, cat_cols, num_cols, preprocessed_path, target_col=target_col
+    )
+    # The target is stored last, so the features are a memmap view that train_gan streams from disk
+    data_np = data_mm[:, :len(transform.feature_columns)]
     generator, discriminator = train_gan(
         data=data_np,
         noise_dim=noise_dim,
@@ -226,44 +338,28 @@ def pipeline(
         model_name='tabgan',
         logging_path=os.path.join(output_dir, 'training.log')
     )
-    synth_np = generate_synthetic_data(generator, num_samples=data_np.shape[0], noise_dim=noise_dim)
-    synth_df = pd.DataFrame(synth_np, columns=X.columns)
-    synth_df[num_cols] = scaler.inverse_transform(synth_df[num_cols])
-    # Reverse label encoding for categorical columns
-    for col in cat_cols:
-        inv = np.round(synth_df[col]).clip(0, len(cat_encoders[col].classes_)-1).astype(int)
-        synth_df[col] = cat_encoders[col].inverse_transform(inv)
+    # Batched sampling, decoded with the fitted transform artifact and appended to the file batch by batch
     synth_data_path = os.path.join(output_dir, 'synthetic.csv')
     try:
-        synth_df.to_csv(synth_data_path, index=False)
+        generation = generate_to_file(
+            generator, transform, synth_data_path, num_samples=data_np.shape[0], noise_dim=noise_dim,
+            columns=transform.feature_columns, batch_size=generation_batch_size
+        )
     except Exception as e:
         raise RuntimeError(f'Error saving synthetic data: {e}')
+    logging.info(f"Generated {generation['rows']} rows in {generation['batches']} batches ({generation['rows_per_second'] or 0:.0f} rows/s)")
     # Version real/preprocessed dataset and model
-    dataset_version = version_dataset(preprocessed_path)
+    dataset_version = content_version(preprocessed_path)
+    # Evaluated on a bounded sample, in the transformed space (codes, min-max scaled) of the memmap
+    df, synth_df, eval_version = evaluation_frames(data_mm, transform, synth_data_path, dataset_version, eval_sample_rows)
     model_version = save_model(generator, os.path.join(output_dir, 'tabgan_generator_final.pt'))
     logging.info(f'Dataset version: {dataset_version}, Model version: {model_version}')
-    # Privacy risk metrics
-    dp_epsilon = compute_epsilon_delta(real_df=df, synth_df=synth_df, delta=dp_delta)
-    privacy_risk = membership_inference_attack(real_df=df, synth_df=synth_df)
-    logging.info(f'DP epsilon (lower=stronger privacy): {dp_epsilon:.2f}, MIA risk: {privacy_risk}')
-    if downstream_target_col and y is not None:
-        real_train_X, real_test_X, real_train_y, real_test_y = train_test_split(X, y, test_size=0.3, random_state=42)
-        # For downstream utility, we'll use same labels for synth as real (cf. context requirements)
-        synth_train_X, synth_train_y = synth_df, y[:synth_df.shape[0]]
-        real_acc, synth_acc = evaluate_downstream_classifier(real_train_X, real_train_y, real_test_X, real_test_y, synth_train_X, synth_train_y)
-        accuracy_drop = real_acc - synth_acc
-        utility_valid = accuracy_drop < baseline_accuracy_drop
-    else:
-        real_acc, synth_acc, accuracy_drop, utility_valid = None, None, None, None
     run_report = {
         'dataset_version': dataset_version,
+        'transform_version': transform.version,
         'model_version': model_version,
-        'dp_epsilon': dp_epsilon,
-        'mia_risk': privacy_risk,
-        'real_classifier_accuracy': real_acc,
-        'synthetic_classifier_accuracy': synth_acc,
-        'accuracy_drop': accuracy_drop,
-        'utility_valid': utility_valid
+        'eval_rows': len(df),
+        **evaluate_synthetic(df, synth_df, target_col, dp_delta, baseline_accuracy_drop, eval_version)
     }
     # Save run report
     try:
@@ -271,3 +367,52 @@ def pipeline(
     except Exception as e:
         logging.error(f'Unable to save run report: {e}')
     return run_report
+
+
+def sweep(
+    raw_data_path: str,
+    output_dir: str,
+    deid_cols: List[str],
+    cat_cols: List[str],
+    num_cols: List[str],
+    search_space: Dict[str, List[Any]],
+    downstream_target_col: str = None,
+    dp_delta: float = 1e-5,
+    baseline_accuracy_drop: float = 0.1,
+    finalists: int = 3,
+    min_epochs: int = 1,
+    eta: int = SWEEP_ETA,
+    max_workers: int = SWEEP_WORKERS,
+    threads_per_worker: int = SWEEP_THREADS_PER_WORKER
+) -> List[Dict[str, Any]]:
+    """
+    Hyperparameter sweep over noise_dim, batch_size, lr and epochs with successive halving.
+    Preprocesses once (reusing pipeline's transform artifact), trains candidates in a process pool on a
+    shared-memory copy of the features, and evaluates the finalists with the same privacy/utility metrics
+    as pipeline. Returns the leaderboard (also written to <output_dir>/leaderboard.json).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    preprocessed_path = os.path.join(output_dir, 'preprocessed.npy')
+    header = pd.read_csv(raw_data_path, nrows=0).columns
+    target_col = downstream_target_col if downstream_target_col in header else None
+    data_mm, transform = preprocess_streaming(
+        raw_data_path, deid_cols, cat_cols, num_cols, preprocessed_path, target_col=target_col
+    )
+    dataset_version = content_version(preprocessed_path)
+    def report(generator: Generator, result: Dict[str, Any]) -> Dict[str, Any]:
+        synth_path = os.path.join(output_dir, f"synthetic_{result['key']}.csv")
+        generate_to_file(generator, transform, synth_path, num_samples=data_mm.shape[0], noise_dim=result['config']['noise_dim'],
+                         columns=transform.feature_columns, seed=0)
+        # Same bounded evaluation sample as pipeline
+        df, synth_df, eval_version = evaluation_frames(data_mm, transform, synth_path, dataset_version)
+        return {
+            'dataset_version': dataset_version,
+            'transform_version': transform.version,
+            'eval_rows': len(df),
+            **evaluate_synthetic(df, synth_df, target_col, dp_delta, baseline_accuracy_drop, eval_version)
+        }
+    return run_sweep(
+        data_mm[:, :len(transform.feature_columns)], search_space, output_dir, Generator, Discriminator,
+        report_fn=report, finalists=finalists, min_epochs=min_epochs, eta=eta, max_workers=max_workers,
+        threads_per_worker=threads_per_worker, data_version=f'{dataset_version}/{transform.version}'
+    )
@@ -0,0 +1,49 @@
+import pytest
+from src.api.metrics import Counter, Histogram, MetricsRegistry, StageTimer
+
+
+def test_counter_labels_and_render():
+    registry = MetricsRegistry()
+    jobs = registry.register(Counter('jobs_total', 'Jobs run.', ['status']))
+    jobs.inc(status='ok')
+    jobs.inc(2, status='ok')
+    assert jobs.value(status='ok') == 3
+    with pytest.raises(ValueError):
+        jobs.inc(kind='ok')
+    with pytest.raises(ValueError):
+        jobs.inc(-1, status='ok')
+    text = registry.render()
+    assert '# TYPE jobs_total counter' in text
+    assert 'jobs_total{status="ok"} 3.0' in text
+
+def test_label_values_and_help_are_escaped():
+    registry = MetricsRegistry()
+    jobs = registry.register(Counter('jobs_total', 'Jobs run.\nPer C:\\ path.', ['path']))
+    jobs.inc(path='C:\\out "new"\nline')
+    text = registry.render()
+    assert 'jobs_total{path="C:\\\\out \\"new\\"\\nline"} 1.0' in text
+    assert '# HELP jobs_total Jobs run.\\nPer C:\\\\ path.' in text
+    assert len(text.splitlines()) == 3
+
+def test_histogram_cumulative_buckets():
+    registry = MetricsRegistry()
+    h = registry.register(Histogram('latency_seconds', 'Latency.', buckets=[0.1, 1.0]))
+    for v in (0.05, 0.1, 0.5, 5.0):
+        h.observe(v)
+    lines = h.collect()
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'latency_seconds_count 4' in lines
+    assert h.count() == 4
+    with pytest.raises(ValueError):
+        registry.register(Histogram('latency_seconds', 'dup'))
+
+def test_stage_timer_accumulates():
+    timer = StageTimer()
+    with timer.stage('a'):
+        pass
+    timer.add('a', 1.0)
+    timer.add('b', 0.5)
+    assert timer.stages['a'] >= 1.0 and timer.stages['b'] == 0.5
+    assert timer.elapsed() >= 0
@@ -0,0 +1,107 @@
+import os
+import gzip
+import time
+import pytest
+from src.api.output_store import OutputStore, parse_accept_encoding, COMMIT_MARKER, STALE_PARTIAL_S
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OutputStore(root=str(tmp_path / 'outputs'), ttl_s=60, tenant_quota_bytes=10_000, precompress_min_bytes=0)
+
+def _write_job(store, tenant='acme', n_bytes=1000, output_format='csv'):
+    job_id, path = store.allocate(tenant, output_format)
+    with open(path, 'wb') as f:
+        f.write(b'x' * n_bytes)
+    store.commit(job_id)
+    return job_id, path
+
+def test_allocate_returns_unique_job_scoped_paths(store):
+    first = store.allocate('acme', 'csv')
+    second = store.allocate('acme', 'parquet')
+    assert first[0] != second[0]
+    assert first[1].endswith(os.path.join('acme', first[0], 'synthetic.csv'))
+    assert second[1].endswith('synthetic.parquet')
+    with pytest.raises(ValueError):
+        store.allocate('../etc', 'csv')
+
+def test_commit_writes_gzip_variant_for_csv_only(store):
+    job_id, path = _write_job(store)
+    with gzip.open(path + '.gz', 'rb') as f:
+        assert f.read() == b'x' * 1000
+    pq_job, pq_path = _write_job(store, output_format='parquet')
+    assert not os.path.exists(pq_path + '.gz')
+    assert store.resolve(pq_job, 'acme', 'gzip') == (pq_path, None)
+
+def test_resolve_honours_accept_encoding(store):
+    job_id, path = _write_job(store)
+    assert store.resolve(job_id, 'acme', None) == (path, None)
+    assert store.resolve(job_id, 'acme', 'gzip, deflate') == (path + '.gz', 'gzip')
+    assert store.resolve(job_id, 'acme', 'gzip;q=0') == (path, None)
+    assert parse_accept_encoding('br;q=0.5, gzip, zstd;q=0') == {'br': 0.5, 'gzip': 1.0}
+
+def test_resolve_only_serves_the_owning_tenant(store):
+    job_id, path = _write_job(store, tenant='acme')
+    assert store.resolve(job_id, 'other') is None
+    assert store.resolve(job_id, 'acme') == (path, None)
+
+def test_expired_jobs_are_evicted(store):
+    job_id, path = _write_job(store)
+    store._jobs[job_id]['created'] -= 120
+    assert store.resolve(job_id, 'acme') is None
+    assert not os.path.exists(os.path.dirname(path))
+    other, _ = _write_job(store)
+    assert store.evict_expired(now=store._jobs[other]['created'] + 61) == [other]
+
+def test_quota_evicts_least_recently_used_jobs(store):
+    old, old_path = _write_job(store, n_bytes=4000)
+    recent, _ = _write_job(store, n_bytes=4000)
+    store.resolve(old, 'acme')  # touch: `recent` becomes the LRU candidate
+    store._jobs[recent]['last_access'] -= 10
+    newest, _ = _write_job(store, n_bytes=4000)
+    assert recent not in store._jobs
+    assert old in store._jobs and newest in store._jobs
+    assert store.usage('acme') <= 10_000
+    assert store.usage('other') == 0
+
+def test_rescan_registers_existing_outputs(store):
+    job_id, path = _write_job(store)
+    reopened = OutputStore(root=store.root, ttl_s=60, tenant_quota_bytes=10_000)
+    assert reopened.resolve(job_id, 'acme', 'gzip') == (path + '.gz', 'gzip')
+    assert reopened.usage('acme') == store.usage('acme')
+
+def test_rescan_skips_and_sweeps_uncommitted_jobs(store):
+    committed, _ = _write_job(store)
+    partial, partial_path = store.allocate('acme', 'csv')
+    with open(partial_path, 'wb') as f:
+        f.write(b'id,col1\n1,fo')  # the job crashed mid-write
+    in_progress, _ = store.allocate('acme', 'csv')
+    stale = time.time() - STALE_PARTIAL_S - 1
+    os.utime(os.path.dirname(partial_path), (stale, stale))
+    reopened = OutputStore(root=store.root, ttl_s=60, tenant_quota_bytes=10_000)
+    assert set(reopened._jobs) == {committed}
+    assert os.path.isfile(os.path.join(store._jobs[committed]['dir'], COMMIT_MARKER))
+    assert not os.path.exists(os.path.dirname(partial_path))
+    # A recent uncommitted job may belong to another worker process: left alone
+    assert os.path.isdir(store._jobs[in_progress]['dir'])
+
+def test_jobs_are_shared_between_worker_processes(store):
+    # A second store over the same root stands in for another worker process
+    other = OutputStore(root=store.root, ttl_s=60, tenant_quota_bytes=10_000, precompress_min_bytes=0)
+    job_id, path = _write_job(store, n_bytes=4000)
+    assert other.resolve(job_id, 'other') is None
+    assert other.resolve(job_id, 'acme') == (path, None)
+    assert other.resolve('../' + job_id, 'acme') is None
+    # Quota in the other worker counts this worker's jobs
+    _write_job(store, n_bytes=4000)
+    assert other.usage('acme') == store.usage('acme')
+    _write_job(other, n_bytes=4000)
+    assert other.usage('acme') <= 10_000
+    # A job removed by one worker is not served by the other
+    store.remove(job_id)
+    assert other.resolve(job_id, 'acme') is None and job_id not in other._jobs
+
+def test_directories_are_private(store):
+    _, path = store.allocate('acme', 'csv')
+    for d in (store.root, os.path.dirname(os.path.dirname(path)), os.path.dirname(path)):
+        assert os.stat(d).st_mode & 0o077 == 0
@@ -3,6 +3,8 @@ import io
 import json
 import tempfile
 import shutil
+import threading
+import time
 from unittest import mock
 import pytest
 from fastapi.testclient import TestClient
@@ -15,6 +17,13 @@ from src.api import synthetic_data_api
 def client():
     return TestClient(synthetic_data_api.app)
 
+@pytest.fixture(autouse=True)
+def note_cache(tmp_path, monkeypatch):
+    # Each test gets its own note cache rather than the process-wide default database
+    cache = synthetic_data_api.NoteCache(str(tmp_path / 'note_cache.sqlite'))
+    monkeypatch.setattr(synthetic_data_api, '_note_cache', cache)
+    return cache
+
 # --- Helper Fixtures for Mocking Dependencies & Test Data ---
 @pytest.fixture
 def valid_api_key(monkeypatch):
@@ -125,6 +134,18 @@ def test_num_records_bounds(client, valid_api_key, temp_files, bad_num):
     resp = client.post('/api/v1/generate', json=data, headers=headers)
     assert resp.status_code == 422
 
+@pytest.mark.parametrize('path,output_format', [('out.csv', 'parquet'), ('out.parquet', 'csv'), ('out.txt', 'arrow')])
+def test_output_path_extension_must_match_format(client, valid_api_key, temp_files, tmp_path, path, output_format):
+    data = {
+        'num_records': 2,
+        'model_config_path': temp_files['config_path'],
+        'trained_model_path': temp_files['weights_path'],
+        'output_csv_path': str(tmp_path / path),
+        'output_format': output_format,
+    }
+    resp = client.post('/api/v1/generate', json=data, headers={'X-API-KEY': valid_api_key})
+    assert resp.status_code == 422 and 'does not match output_format' in resp.text
+
 # File missing validation
 def test_generate_bad_paths(client, valid_api_key, temp_files):
     req_data = {
@@ -193,4 +214,259 @@ def test_download_synthetic_file_missing(client, valid_api_key, patch_logdir):
 def test_download_path_traversal(client, valid_api_key, evil_path):
     headers = {'X-API-KEY': valid_api_key}
     resp = client.get(f'/api/v1/download?file={evil_path}', headers=headers)
-    assert resp.status_code == HTTP_403_FORBIDDEN or resp.status_code == HTTP_404_NOT_FOUND
\ No newline at end of file
+    assert resp.status_code == HTTP_403_FORBIDDEN or resp.status_code == HTTP_404_NOT_FOUND
+# --- Columnar formats, Range and conditional downloads ---
+def test_generate_rejects_unknown_output_format(client, valid_api_key, temp_files):
+    req = {
+        'num_records': 2,
+        'model_config_path': temp_files['config_path'],
+        'trained_model_path': temp_files['weights_path'],
+        'output_format': 'xlsx'
+    }
+    resp = client.post('/api/v1/generate', json=req, headers={'X-API-KEY': valid_api_key})
+    assert resp.status_code == 422
+
+def test_download_parquet_media_type(client, valid_api_key, patch_logdir):
+    file_path = os.path.join('/tmp', 'testfile.parquet')
+    with open(file_path, 'wb') as f:
+        f.write(b'PAR1' + b'\x00' * 32)
+    try:
+        resp = client.get(f'/api/v1/download?file={file_path}', headers={'X-API-KEY': valid_api_key})
+        assert resp.status_code == 200
+        assert resp.headers['content-type'] == 'application/vnd.apache.parquet'
+    finally:
+        os.remove(file_path)
+
+def test_download_supports_range_and_conditional_requests(client, valid_api_key, patch_logdir):
+    file_path = os.path.join('/tmp', 'testfile_range.csv')
+    payload = b'id,col1\n' + b''.join(b'%d,foo\n' % i for i in range(100))
+    with open(file_path, 'wb') as f:
+        f.write(payload)
+    headers = {'X-API-KEY': valid_api_key}
+    try:
+        full = client.get(f'/api/v1/download?file={file_path}', headers=headers)
+        assert full.headers['accept-ranges'] == 'bytes'
+        etag = full.headers['etag']
+        partial = client.get(f'/api/v1/download?file={file_path}', headers={**headers, 'Range': 'bytes=0-9'})
+        assert partial.status_code == 206
+        assert partial.content == payload[:10]
+        resumed = client.get(f'/api/v1/download?file={file_path}', headers={**headers, 'Range': 'bytes=10-', 'If-Range': etag})
+        assert resumed.status_code == 206 and resumed.content == payload[10:]
+        cached = client.get(f'/api/v1/download?file={file_path}', headers={**headers, 'If-None-Match': etag})
+        assert cached.status_code == 304
+        since = client.get(f'/api/v1/download?file={file_path}', headers={**headers, 'If-Modified-Since': full.headers['last-modified']})
+        assert since.status_code == 304
+    finally:
+        os.remove(file_path)
+
+# --- Managed output store downloads ---
+@pytest.fixture
+def output_store(tmp_path, monkeypatch):
+    store = synthetic_data_api.OutputStore(root=str(tmp_path / 'outputs'), precompress_min_bytes=0)
+    monkeypatch.setattr(synthetic_data_api, 'output_store', store)
+    return store
+
+def test_download_job_serves_precompressed_variant(client, valid_api_key, output_store):
+    job_id, path = output_store.allocate('acme', 'csv')
+    payload = b'id,col1\n' + b''.join(b'%d,foo\n' % i for i in range(500))
+    with open(path, 'wb') as f:
+        f.write(payload)
+    output_store.commit(job_id)
+    headers = {'X-API-KEY': valid_api_key, 'X-TENANT-ID': 'acme'}
+    # Another tenant (or the default one) cannot fetch it, even with the job id
+    assert client.get(f'/api/v1/download?job={job_id}', headers={'X-API-KEY': valid_api_key}).status_code == HTTP_404_NOT_FOUND
+    assert client.get(f'/api/v1/download?job={job_id}', headers={**headers, 'X-TENANT-ID': 'other'}).status_code == HTTP_404_NOT_FOUND
+    plain = client.get(f'/api/v1/download?job={job_id}', headers={**headers, 'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200 and plain.content == payload
+    assert 'content-encoding' not in plain.headers
+    gz = client.get(f'/api/v1/download?job={job_id}', headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert gz.headers['content-encoding'] == 'gzip'
+    assert gz.headers['content-type'].startswith('text/csv')
+    assert 'Accept-Encoding' in gz.headers['vary']
+    assert gz.content == payload  # transparently decoded by the client
+    assert client.get('/api/v1/download?job=unknown', headers=headers).status_code == HTTP_404_NOT_FOUND
+    # Nor by its path
+    assert client.get('/api/v1/download', params={'file': path}, headers={**headers, 'X-TENANT-ID': 'other'}).status_code == HTTP_404_NOT_FOUND
+    assert client.get('/api/v1/download', params={'file': path}, headers={**headers, 'Accept-Encoding': 'identity'}).content == payload
+
+# --- Single-flight coalescing ---
+def test_single_flight_shares_result_and_exception():
+    flight = synthetic_data_api.SingleFlight()
+    followers_before = synthetic_data_api.SINGLEFLIGHT_CALLS.value(role='follower')
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'done'
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('k', work))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while synthetic_data_api.SINGLEFLIGHT_CALLS.value(role='follower') < followers_before + 3:
+        time.sleep(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+    assert len(calls) == 1
+    assert sorted(results) == [('done', False)] + [('done', True)] * 3
+    assert flight.in_flight() == 0
+    with pytest.raises(ZeroDivisionError):
+        flight.do('k', lambda: 1 / 0)
+
+def test_identical_concurrent_generate_requests_are_coalesced(client, valid_api_key, temp_files, output_store, monkeypatch):
+    followers_before = synthetic_data_api.SINGLEFLIGHT_CALLS.value(role='follower')
+    calls = []
+    def slow_sample(model_path, config_path, num_samples, output_path, output_format=None, seed=None, timings=None):
+        calls.append(seed)
+        deadline = time.time() + 5
+        while synthetic_data_api.SINGLEFLIGHT_CALLS.value(role='follower') < followers_before + 2 and time.time() < deadline:
+            time.sleep(0.01)
+        with open(output_path, 'w') as f:
+            f.write('id,col1\n1,foo\n')
+    monkeypatch.setattr(synthetic_data_api, 'sample_synthetic_data', slow_sample)
+    req = {
+        'num_records': 5,
+        'model_config_path': temp_files['config_path'],
+        'trained_model_path': temp_files['weights_path'],
+        'seed': 7
+    }
+    headers = {'X-API-KEY': valid_api_key}
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(client.post('/api/v1/generate', json=req, headers=headers))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert calls == [7]
+    bodies = [r.json() for r in responses]
+    assert all(r.status_code == HTTP_201_CREATED for r in responses)
+    assert len({b['synthetic_data_file'] for b in bodies}) == 1
+    assert sorted(b['coalesced'] for b in bodies) == [False, True, True]
+    metrics = client.get('/metrics', headers=headers).text
+    assert 'synthetic_generate_singleflight_total{role="follower"}' in metrics
+    # A different seed is a different request and runs separately
+    client.post('/api/v1/generate', json={**req, 'seed': 8}, headers=headers)
+    assert calls == [7, 8]
+
+# --- Stage timings & metrics ---
+def test_generate_reports_stage_timings_and_metrics(client, valid_api_key, temp_files, output_store, note_cache, monkeypatch, caplog):
+    def fake_sample(model_path, config_path, num_samples, output_path, output_format=None, seed=None, timings=None):
+        with open(output_path, 'w') as f:
+            f.write('id,col1\n1,foo\n')
+        timings.update({'model_load': 0.01, 'sampling': 0.02, 'write': 0.001})
+    monkeypatch.setattr(synthetic_data_api, 'sample_synthetic_data', fake_sample)
+    monkeypatch.setattr(synthetic_data_api, 'STAGE_SLO_S', {'sampling': 0.0})
+    monkeypatch.setenv('NOTE_BACKEND', 'local')
+    monkeypatch.setenv('NOTE_BACKEND_ALLOW_STAND_IN', '1')
+    before = synthetic_data_api.STAGE_SECONDS.count(stage='sampling')
+    req = {
+        'num_records': 2,
+        'model_config_path': temp_files['config_path'],
+        'trained_model_path': temp_files['weights_path'],
+        'prompt_template': 'Patient: {name}',
+        'prompt_vars': {'name': 'Jane'},
+        'generate_notes': True
+    }
+    with caplog.at_level('WARNING'):
+        resp = client.post('/api/v1/generate', json=req, headers={'X-API-KEY': valid_api_key})
+    body = resp.json()
+    assert resp.status_code == HTTP_201_CREATED
+    assert set(body['stage_timings']) == {'prompt_persist', 'model_load', 'sampling', 'write', 'note_generation', 'validation', 'register'}
+    assert body['stage_timings']['sampling'] == pytest.approx(0.02)
+    assert body['bytes_written'] >= len('id,col1\n1,foo\n')
+    assert body['notes_report']['n_written'] == 1 and len(note_cache) == 1
+    with open(body['notes_file']) as f:
+        assert json.loads(f.readline())['prompt'] == 'Patient: Jane'
+    assert synthetic_data_api.STAGE_SECONDS.count(stage='sampling') == before + 1
+    assert 'Slow generation exemplar' in caplog.text and "'sampling'" in caplog.text
+    assert client.get('/metrics').status_code == HTTP_401_UNAUTHORIZED
+    text = client.get('/metrics', headers={'X-API-KEY': valid_api_key}).text
+    assert 'synthetic_generate_stage_seconds_bucket{stage="sampling",le="+Inf"}' in text
+    assert 'synthetic_generate_bytes_written_count' in text
+
+def test_note_cache_opens_lazily_at_configured_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(synthetic_data_api, '_note_cache', None)
+    monkeypatch.setenv('NOTE_CACHE_PATH', str(tmp_path / 'lazy' / 'notes.sqlite'))
+    assert not (tmp_path / 'lazy').exists()
+    cache = synthetic_data_api.get_note_cache()
+    assert cache.path == str(tmp_path / 'lazy' / 'notes.sqlite') and synthetic_data_api.get_note_cache() is cache
+
+@pytest.mark.parametrize('raw', ['{sampling: 1}', '[1, 2]', '{"sampling": "slow"}'])
+def test_malformed_stage_slos_are_ignored(raw, caplog):
+    with caplog.at_level('WARNING'):
+        assert synthetic_data_api.parse_stage_slos(raw) == {}
+    assert 'Ignoring invalid SYNTH_STAGE_SLO_S' in caplog.text
+    assert synthetic_data_api.parse_stage_slos('{"sampling": 2}') == {'sampling': 2.0}
+    assert synthetic_data_api.parse_stage_slos(None) == {}
+
+def test_rejected_batch_generates_no_notes(client, valid_api_key, temp_files, output_store, monkeypatch):
+    def fake_sample(model_path, config_path, num_samples, output_path, output_format=None, seed=None, timings=None):
+        with open(output_path, 'w') as f:
+            f.write('id,col1\n1,foo\n')
+    monkeypatch.setattr(synthetic_data_api, 'sample_synthetic_data', fake_sample)
+    monkeypatch.setattr(synthetic_data_api, 'check_synthetic_data_privacy', lambda **kw: {'passed': False})
+    notes = mock.Mock()
+    monkeypatch.setattr(synthetic_data_api, 'generate_clinical_notes', notes)
+    req = {
+        'num_records': 1,
+        'model_config_path': temp_files['config_path'],
+        'trained_model_path': temp_files['weights_path'],
+        'prompt_template': 'Patient: {name}',
+        'prompt_vars': {'name': 'Jane'},
+        'generate_notes': True
+    }
+    monkeypatch.setenv('NOTE_BACKEND', 'local')
+    monkeypatch.setenv('NOTE_BACKEND_ALLOW_STAND_IN', '1')
+    resp = client.post('/api/v1/generate', json=req, headers={'X-API-KEY': valid_api_key})
+    assert resp.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+    assert notes.call_count == 0
+    assert not any(f.endswith('_notes.jsonl') for _, _, files in os.walk(output_store.root) for f in files)
+
+def test_notes_are_opt_in_and_need_a_configured_backend(client, valid_api_key, temp_files, output_store, monkeypatch):
+    sample = mock.Mock()
+    monkeypatch.setattr(synthetic_data_api, 'sample_synthetic_data', sample)
+    monkeypatch.delenv('NOTE_BACKEND', raising=False)
+    req = {
+        'num_records': 1,
+        'model_config_path': temp_files['config_path'],
+        'trained_model_path': temp_files['weights_path'],
+        'prompt_template': 'Patient: {record}',
+    }
+    headers = {'X-API-KEY': valid_api_key}
+    resp = client.post('/api/v1/generate', json={**req, 'generate_notes': True}, headers=headers)
+    assert resp.status_code == 503 and sample.call_count == 0
+    # The stand-in backend is not a real model and needs an explicit opt-in
+    monkeypatch.setenv('NOTE_BACKEND', 'local')
+    assert client.post('/api/v1/generate', json={**req, 'generate_notes': True}, headers=headers).status_code == 503
+    resp = client.post('/api/v1/generate', json={**req, 'prompt_template': None, 'generate_notes': True}, headers=headers)
+    assert resp.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+def test_reused_output_path_regenerates_notes(client, valid_api_key, temp_files, tmp_path, monkeypatch):
+    rows = iter(['id,col1\n1,foo\n', 'id,col1\n1,bar\n'])
+    def fake_sample(model_path, config_path, num_samples, output_path, output_format=None, seed=None, timings=None):
+        with open(output_path, 'w') as f:
+            f.write(next(rows))
+    monkeypatch.setattr(synthetic_data_api, 'sample_synthetic_data', fake_sample)
+    monkeypatch.setenv('NOTE_BACKEND', 'local')
+    monkeypatch.setenv('NOTE_BACKEND_ALLOW_STAND_IN', '1')
+    req = {
+        'num_records': 1,
+        'model_config_path': temp_files['config_path'],
+        'trained_model_path': temp_files['weights_path'],
+        'output_csv_path': str(tmp_path / 'out.csv'),
+        'prompt_template': 'Row {record}',
+        'generate_notes': True,
+    }
+    prompts = []
+    for seed in (1, 2):
+        body = client.post('/api/v1/generate', json={**req, 'seed': seed}, headers={'X-API-KEY': valid_api_key}).json()
+        with open(body['notes_file']) as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 1
+        prompts.append(lines[0]['prompt'])
+    assert 'foo' in prompts[0] and 'bar' in prompts[1]
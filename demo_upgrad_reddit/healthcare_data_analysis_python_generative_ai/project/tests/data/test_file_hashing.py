@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+import pytest
+from unittest import mock
+from src.data import file_hashing
+from src.data.file_hashing import HashingService, hash_file, available_algorithms, benchmark_hashing
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache' / 'content_hashes')
+    monkeypatch.setattr(file_hashing, 'HASH_INDEX_DIR', path)
+    return path
+
+@pytest.fixture
+def data_file(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    path = data_dir / 'data.csv'
+    path.write_bytes(os.urandom(3 * 1024 + 17))
+    return str(path)
+
+@pytest.mark.parametrize('algorithm', available_algorithms())
+def test_chunked_hash_matches_one_shot(data_file, algorithm):
+    digest = hash_file(data_file, algorithm, chunk_bytes=1000)
+    assert digest.startswith(algorithm + ':')
+    assert digest == hash_file(data_file, algorithm)
+    if algorithm == 'blake2b':
+        with open(data_file, 'rb') as f:
+            assert digest == 'blake2b:' + hashlib.blake2b(f.read(), digest_size=20).hexdigest()
+
+def test_unchanged_file_is_not_rehashed(data_file):
+    first = HashingService(algorithm='blake2b')
+    digest = first.hash(data_file)
+    assert first.stats['hashed'] == 1 and first.hash(data_file) == digest and first.stats['memo_hits'] == 1
+    with open(first.index_path(data_file)) as f:
+        assert json.load(f)[data_file]['digests']['blake2b'] == digest
+    # Nothing is written into the data directory
+    assert os.listdir(os.path.dirname(data_file)) == ['data.csv']
+    # A new process only has the persistent index
+    second = HashingService(algorithm='blake2b')
+    with mock.patch.object(file_hashing, 'hash_file', side_effect=AssertionError('rehashed')):
+        assert second.hash(data_file) == digest
+    assert second.stats['index_hits'] == 1
+
+def test_modified_file_is_rehashed(data_file):
+    service = HashingService(algorithm='blake2b')
+    before = service.hash(data_file)
+    with open(data_file, 'ab') as f:
+        f.write(b'one more row\n')
+    assert service.hash(data_file) != before and service.stats['hashed'] == 2
+
+def test_hash_many_in_parallel(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f'part-{i}.bin'
+        path.write_bytes(os.urandom(2048))
+        paths.append(str(path))
+    service = HashingService(algorithm='blake2b', max_workers=3)
+    service.hash(paths[0])
+    digests = service.hash_many(paths)
+    assert list(digests) == paths and len(set(digests.values())) == 6
+    assert service.stats['hashed'] == 6
+    assert digests[paths[3]] == hash_file(paths[3], 'blake2b')
+    with open(service.index_path(paths[0])) as f:
+        assert sorted(json.load(f)) == sorted(paths)
+
+def test_memo_is_bounded(tmp_path):
+    service = HashingService(algorithm='blake2b', use_sidecar=False, memo_entries=2)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'part-{i}.bin'
+        path.write_bytes(os.urandom(64))
+        paths.append(str(path))
+        service.hash(str(path))
+    assert len(service._memo) == 2
+    service.hash(paths[0])  # evicted, so hashed again
+    assert service.stats['hashed'] == 4 and service.stats['memo_hits'] == 0
+
+def test_read_only_data_directory_is_hashed_without_writes(data_file, index_dir):
+    os.chmod(os.path.dirname(data_file), 0o500)
+    try:
+        digest = HashingService(algorithm='blake2b').hash(data_file)
+    finally:
+        os.chmod(os.path.dirname(data_file), 0o700)
+    assert digest == hash_file(data_file, 'blake2b')
+    assert oct(os.stat(index_dir).st_mode & 0o777) == '0o700'
+
+def test_unknown_algorithm_rejected():
+    with pytest.raises(ValueError):
+        HashingService(algorithm='md5')
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_hashing_throughput(tmp_path):
+    result = benchmark_hashing(size_mb=256, workdir=str(tmp_path))
+    assert result['unchanged_lookup_ms'] < 50, result
+    assert result['blake2b_mb_per_second'] > 100, result
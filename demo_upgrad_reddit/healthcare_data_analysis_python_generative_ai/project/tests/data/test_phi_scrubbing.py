@@ -0,0 +1,42 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.data.phi_scrubbing import PHIScrubber, sequential_scrub, synthetic_notes, benchmark_scrubbing, REDACTION_TOKEN
+
+
+def test_single_pass_matches_sequential_passes():
+    scrubber = PHIScrubber()
+    for note in synthetic_notes(300, phi_rate=0.1):
+        assert scrubber.scrub(note) == sequential_scrub(note)
+
+def test_counts_per_category():
+    text = 'Seen by John Smith on 01/02/2020, SSN 123-45-6789, call (555)123-4567 or JANE@EXAMPLE.COM.'
+    scrubbed, counts = PHIScrubber().scrub_with_counts(text)
+    assert counts == {'name': 1, 'date': 1, 'ssn': 1, 'phone': 1, 'email': 1}
+    assert scrubbed.count(REDACTION_TOKEN) == 5 and 'Seen by' in scrubbed
+    # Lower-case word pairs and numbers inside words are not PHI
+    assert PHIScrubber().scrub('no identifiers here, covid19 ward 3') == 'no identifiers here, covid19 ward 3'
+
+def test_custom_patterns_without_trigger():
+    scrubber = PHIScrubber({'mrn': r'MRN\d+', 'zip': r'\b\d{5}\b'})
+    scrubbed, counts = scrubber.scrub_with_counts('MRN0042 lives in 90210')
+    assert scrubbed == f'{REDACTION_TOKEN} lives in {REDACTION_TOKEN}' and counts == {'mrn': 1, 'zip': 1}
+
+def test_series_order_and_index_preserved_across_pool():
+    notes = synthetic_notes(1000, phi_rate=0.05)
+    notes[7] = np.nan
+    series = pd.Series(notes, index=np.arange(1000)[::-1], name='note_text')
+    scrubber = PHIScrubber()
+    pooled, counts = scrubber.scrub_series(series, workers=2, chunk_rows=128, parallel_min_rows=0)
+    inline, inline_counts = scrubber.scrub_series(series, workers=1)
+    assert pooled.index.equals(series.index) and pooled.name == 'note_text'
+    assert pd.isna(pooled.iloc[7])
+    assert pooled.tolist()[:7] == inline.tolist()[:7] and pooled.tolist()[8:] == inline.tolist()[8:]
+    assert counts == inline_counts and sum(counts.values()) > 0
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_scrubbing_throughput():
+    result = benchmark_scrubbing(n_notes=50_000)
+    assert result['single_pass_mb_per_second'] > 2 * result['sequential_mb_per_second'], result
+    assert all(n > 0 for n in result['redactions'].values())
@@ -0,0 +1,70 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from src.models.privacy_risk import (
+    quantize_records,
+    record_hashes,
+    RecordIndex,
+    membership_inference_report
+)
+
+
+@pytest.fixture
+def real_and_synth():
+    rng = np.random.default_rng(11)
+    real = pd.DataFrame({
+        'age': rng.integers(20, 90, 500),
+        'bp': rng.normal(120, 10, 500).round(2),
+        'dx': rng.integers(0, 5, 500),
+    })
+    synth = pd.DataFrame({
+        'age': rng.integers(20, 90, 400).astype(float),
+        'bp': rng.normal(120, 10, 400),
+        'dx': rng.integers(0, 5, 400).astype(float),
+    })
+    # Plant 20 verbatim copies of real rows (as floats, like a CSV round-trip would produce)
+    synth.iloc[:20] = real.iloc[100:120].to_numpy(dtype=float)
+    return real, synth
+
+def test_quantize_records_hashes_int_and_float_equally():
+    ints = pd.DataFrame({'a': [1, 2], 'b': [0, 3]})
+    floats = pd.DataFrame({'a': [1.0, 2.0000000001], 'b': [-0.0, 3.0]})
+    np.testing.assert_array_equal(record_hashes(quantize_records(ints)), record_hashes(quantize_records(floats)))
+
+def test_record_index_exact_matches(real_and_synth):
+    real, synth = real_and_synth
+    index = RecordIndex(synth)
+    mask = index.exact_matches(real)
+    assert mask.sum() == 20
+    assert mask[100:120].all()
+
+def test_record_index_distance_to_closest_zero_for_copies(real_and_synth):
+    real, synth = real_and_synth
+    index = RecordIndex(synth)
+    d = index.distance_to_closest(real.iloc[100:120])
+    np.testing.assert_allclose(d, 0.0, atol=1e-9)
+    assert (index.distance_to_closest(real.iloc[:50]) >= 0).all()
+
+def test_membership_inference_report_uses_all_real_rows(real_and_synth):
+    real, synth = real_and_synth
+    report = membership_inference_report(real, synth)
+    assert report['n_probes'] == len(real)
+    assert report['n_exact_matches'] == 20
+    assert report['exact_match_rate'] == pytest.approx(20 / len(real))
+    assert report['dcr']['min'] == pytest.approx(0.0, abs=1e-9)
+    sampled = membership_inference_report(real, synth, n_probe=50, dcr=False)
+    assert sampled['n_probes'] == 50 and 'dcr' not in sampled
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_membership_inference_report_performance():
+    rng = np.random.default_rng(0)
+    n = 1_000_000
+    real = pd.DataFrame(rng.normal(size=(n, 8)).round(3))
+    synth = pd.DataFrame(rng.normal(size=(n, 8)).round(3))
+    start = time.time()
+    report = membership_inference_report(real, synth)
+    elapsed = time.time() - start
+    assert report['n_probes'] == n
+    assert elapsed < 30, f'Privacy report took too long: {elapsed:.1f}s'
@@ -0,0 +1,107 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from unittest import mock
+from src.data.file_hashing import content_version
+from src.models import reference_profile
+from src.models.reference_profile import (
+    build_reference_profile,
+    load_reference_profile,
+    compare_to_reference_profile
+)
+from src.models.synthetic_healthcare_data_pipeline import minimum_viable_quality_checks
+
+
+@pytest.fixture
+def real_csv(tmp_path):
+    rng = np.random.default_rng(21)
+    df = pd.DataFrame({
+        'age': rng.integers(20, 90, 400),
+        'bp': rng.normal(120, 10, 400),
+        'dx': rng.integers(0, 4, 400),
+    })
+    path = tmp_path / 'real.csv'
+    df.to_csv(path, index=False)
+    return str(path), df
+
+@pytest.fixture(autouse=True)
+def clear_profile_cache():
+    reference_profile._memory_cache.clear()
+    yield
+    reference_profile._memory_cache.clear()
+
+def test_build_reference_profile_contents(real_csv):
+    path, df = real_csv
+    profile = build_reference_profile(path)
+    assert profile['n_rows'] == len(df)
+    assert profile['content_hash'] == content_version(path)
+    assert set(profile['numeric']) == {'age', 'bp', 'dx'}
+    assert 'dx' in profile['categorical'] and 'bp' not in profile['categorical']
+    assert profile['correlation'].shape == (3, 3)
+    assert len(profile['index']) == len(df)
+
+def test_load_reference_profile_builds_once_per_content(real_csv, tmp_path):
+    path, df = real_csv
+    profile_dir = str(tmp_path / 'profiles')
+    with mock.patch.object(reference_profile, 'build_reference_profile', wraps=build_reference_profile) as build:
+        first = load_reference_profile(path, profile_dir)
+        reference_profile._memory_cache.clear()
+        second = load_reference_profile(path, profile_dir)  # served from disk
+        assert build.call_count == 1
+        assert second['content_hash'] == first['content_hash']
+        # Changing the data changes the key and forces a rebuild
+        df.iloc[:10].to_csv(path, index=False)
+        load_reference_profile(path, profile_dir)
+        assert build.call_count == 2
+
+def test_compare_to_reference_profile_detects_copies(real_csv):
+    path, df = real_csv
+    profile = build_reference_profile(path)
+    synth = df.astype(float).sample(100, random_state=1)
+    synth.iloc[50:] += 1000.0
+    results = compare_to_reference_profile(profile, synth)
+    assert results['privacy']['n_exact_matches'] == 50
+    assert results['privacy']['exact_match_rate'] == pytest.approx(0.5)
+    assert set(results['marginals']['feature_mse']) == {'age', 'bp', 'dx'}
+    assert 0.0 <= results['categories']['category_tvd']['dx'] <= 1.0
+    assert 'correlation_mae' in results['correlation']
+    assert results['silhouette']['mode'] in ('blockwise', 'sampled')
+
+def test_minimum_viable_quality_checks_uses_profile(real_csv, tmp_path):
+    path, df = real_csv
+    synth_path = str(tmp_path / 'synth.parquet')
+    rng = np.random.default_rng(2)
+    synth = df.astype(float) + rng.normal(0, 0.5, df.shape)
+    synth.iloc[:150].to_parquet(synth_path, index=False)
+    thresholds = {'feature_mse': 10.0, 'silhouette': -1.0, 'mirisk': 0.5}
+    profile_dir = str(tmp_path / 'profiles')
+    with mock.patch.object(reference_profile, 'load_reference_profile', wraps=load_reference_profile) as load:
+        # The default (paired, row-aligned) checks need as many synthetic rows as real ones
+        full_path = str(tmp_path / 'synth_full.parquet')
+        synth.to_parquet(full_path, index=False)
+        minimum_viable_quality_checks(path, full_path, thresholds)
+        assert load.call_count == 0  # opt-in
+        result = minimum_viable_quality_checks(path, synth_path, thresholds, use_profile=True, profile_dir=profile_dir)
+        assert load.call_count == 1
+    assert result['passed'] is True
+    assert result['membership_risk'] == 0.0
+    assert 'marginals' in result['details'] and 'privacy' in result['details']
+    with pytest.raises(ValueError):
+        compare_to_reference_profile(load_reference_profile(path, profile_dir), synth.drop(columns=['bp']))
+
+def test_tampered_profile_is_rebuilt_not_loaded(real_csv, tmp_path):
+    path, _ = real_csv
+    profile_dir = tmp_path / 'profiles'
+    load_reference_profile(path, str(profile_dir))
+    assert oct(os.stat(profile_dir).st_mode & 0o777) == '0o700'
+    (entry,) = profile_dir.glob('*.pkl')
+    class Planted:
+        def __reduce__(self):
+            return (os.remove, (path,))
+    entry.write_bytes(b'\0' * 32 + pickle.dumps(Planted()))
+    reference_profile._memory_cache.clear()
+    with mock.patch.object(reference_profile, 'build_reference_profile', wraps=build_reference_profile) as build:
+        profile = load_reference_profile(path, str(profile_dir))
+    assert os.path.isfile(path) and build.call_count == 1 and profile['n_rows'] == 400
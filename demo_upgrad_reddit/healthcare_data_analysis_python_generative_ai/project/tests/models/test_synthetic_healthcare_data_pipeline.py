@@ -1,7 +1,9 @@
 import os
+import glob
 import io
 import json
 import tempfile
+import time
 import shutil
 import pytest
 import numpy as np
@@ -9,16 +11,37 @@ import pandas as pd
 import torch
 from torch.utils.data import DataLoader
 from unittest import mock
+from opacus import PrivacyEngine
 from models.synthetic_healthcare_data_pipeline import (
     TabularHealthcareDataset,
     TabularVAE,
     vae_loss,
     validate_config,
     train_vae_with_privacy,
+    save_training_checkpoint,
+    load_training_checkpoint,
+    VectorizedDPTrainer,
+    rdp_epsilon,
+    benchmark_dp_overhead,
+    DECODER_VARIANTS,
+    export_decoder,
+    load_exported_decoder,
+    decoder_manifest_path,
+    benchmark_sampling_variants,
     sample_synthetic_data,
     PrivacyUtilityValidator,
     minimum_viable_quality_checks,
-    design_pipeline_documentation
+    design_pipeline_documentation,
+    resolve_output_format,
+    write_tabular_file,
+    read_tabular_file,
+    blockwise_silhouette_samples,
+    estimate_silhouette,
+    TensorBatchLoader,
+    make_tabular_loader,
+    benchmark_loader_epoch_time,
+    benchmark_distributed_scaling,
+    spawn_and_collect
 )
 
 
@@ -116,6 +139,35 @@ def test_vae_loss_behavior():
     assert l.item() > 0
     l.backward()
 
+def test_TensorBatchLoader_covers_each_row_once(small_dataframe):
+    dataset = TabularHealthcareDataset(small_dataframe)
+    loader = TensorBatchLoader(dataset, batch_size=5, drop_last=True, generator=torch.Generator().manual_seed(0))
+    batches = list(loader)
+    assert len(batches) == len(loader) == 6
+    rows = torch.cat(batches)
+    assert rows.shape == (30, small_dataframe.shape[1])
+    # Rows are a permutation subset of the data: no duplicates, all present in the source
+    assert len({tuple(r.tolist()) for r in rows}) == 30
+    assert len(list(TensorBatchLoader(dataset, batch_size=5, shuffle=False))) == 7
+    again = list(TensorBatchLoader(dataset, batch_size=5, drop_last=True, generator=torch.Generator().manual_seed(0)))
+    assert all(torch.equal(a, b) for a, b in zip(batches, again))
+
+def test_batch_sampler_loader_fetches_whole_batches(small_dataframe):
+    dataset = TabularHealthcareDataset(small_dataframe, share_memory=True)
+    assert dataset.tensor.is_shared()
+    assert torch.equal(dataset[[0, 2]], dataset.tensor[[0, 2]])
+    loader = make_tabular_loader(dataset, 8, mode='batch_sampler')
+    batches = list(loader)
+    assert [b.shape for b in batches] == [(8, small_dataframe.shape[1])] * 4
+    assert isinstance(make_tabular_loader(dataset, 8, mode='rows'), DataLoader)
+    with pytest.raises(ValueError):
+        make_tabular_loader(dataset, 8, mode='bogus')
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_tensor_loader_epoch_speedup():
+    report = benchmark_loader_epoch_time(n_rows=200_000)
+    assert report['speedup'] >= 10, report
+
 # ---------------------------
 # Integration tests: training & sampling
 # ---------------------------
@@ -156,6 +208,227 @@ def test_train_vae_with_privacy_and_sampling(temp_datafile, temp_configfile, tem
 # PrivacyUtilityValidator and metric checks
 # ---------------------------
 
+def test_train_vae_distributed_matches_single_process_contract(small_dataframe, tmp_path):
+    data_path = str(tmp_path / 'data.csv')
+    small_dataframe.to_csv(data_path, index=False)
+    config_path = str(tmp_path / 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump({'seed': 42, 'batch_size': 4, 'latent_dim': 4, 'epochs': 2}, f)
+    model_path = str(tmp_path / 'vae_ddp.pt')
+    result = train_vae_with_privacy(
+        data_path=data_path,
+        config_path=config_path,
+        model_save_path=model_path,
+        privacy=False,
+        device='cpu',
+        world_size=2
+    )
+    assert result['world_size'] == 2
+    assert len(result['train_losses']) == 2 and result['final_loss'] > 0
+    assert result['samples_per_second'] > 0
+    # Only rank 0 writes, and the file holds plain (unwrapped) TabularVAE weights
+    state = torch.load(model_path)
+    assert not any(k.startswith('module.') for k in state)
+    TabularVAE(input_dim=4, latent_dim=4).load_state_dict(state)
+
+def _put_large_result(rank, n_items, result_queue):
+    if rank == 0:
+        result_queue.put({'train_losses': [0.5] * n_items})
+
+def test_spawn_and_collect_reads_results_larger_than_the_pipe_buffer():
+    # ~1 MB pickled, far above the 64 KiB pipe buffer: joining before reading would hang here
+    result = spawn_and_collect(_put_large_result, (200_000,), nprocs=2)
+    assert len(result['train_losses']) == 200_000
+
+@pytest.mark.skipif(hasattr(PrivacyEngine, 'attach'), reason='attach-style Opacus installed: the hooks DPDDP path is supported')
+def test_train_vae_hooks_distributed_fails_fast_without_attach_api(small_dataframe, tmp_path):
+    data_path = str(tmp_path / 'data.csv')
+    small_dataframe.to_csv(data_path, index=False)
+    config_path = str(tmp_path / 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump({'seed': 42, 'batch_size': 4, 'latent_dim': 4, 'epochs': 1, 'noise_multiplier': 1.0, 'dp_mode': 'hooks'}, f)
+    with mock.patch('models.synthetic_healthcare_data_pipeline.mp.start_processes') as spawn:
+        with pytest.raises(RuntimeError, match="dp_mode='vmap'"):
+            train_vae_with_privacy(data_path, config_path, str(tmp_path / 'vae.pt'), privacy=True, device='cpu', world_size=2)
+    assert spawn.call_count == 0
+
+def _write_training_files(df, tmp_path, name='config.json', **cfg):
+    data_path = str(tmp_path / 'data.csv')
+    df.to_csv(data_path, index=False)
+    config_path = str(tmp_path / name)
+    with open(config_path, 'w') as f:
+        json.dump(dict({'seed': 42, 'batch_size': 4, 'latent_dim': 4}, **cfg), f)
+    return data_path, config_path
+
+def test_train_vae_resume_matches_uninterrupted_run(small_dataframe, tmp_path):
+    # Train 2 epochs, then resume the same checkpoint to 4; the result must equal a straight 4-epoch run
+    data_path, short_cfg = _write_training_files(small_dataframe, tmp_path, 'short.json', epochs=2, val_fraction=0.1, resume=True)
+    _, long_cfg = _write_training_files(small_dataframe, tmp_path, 'long.json', epochs=4, val_fraction=0.1, resume=True)
+    resumed_path = str(tmp_path / 'resumed.pt')
+    first = train_vae_with_privacy(data_path, short_cfg, resumed_path, privacy=False, device='cpu')
+    assert len(glob.glob(resumed_path + '.*.ckpt')) == 1
+    resumed = train_vae_with_privacy(data_path, long_cfg, resumed_path, privacy=False, device='cpu')
+    straight = train_vae_with_privacy(data_path, long_cfg, str(tmp_path / 'straight.pt'), privacy=False, device='cpu')
+    assert first['epochs_run'] == 2
+    assert resumed['resumed_from_epoch'] == 2 and resumed['epochs_run'] == 4
+    np.testing.assert_allclose(resumed['train_losses'], straight['train_losses'], rtol=1e-5)
+    np.testing.assert_allclose(resumed['val_losses'], straight['val_losses'], rtol=1e-5)
+
+def test_train_vae_early_stopping_reports_savings(small_dataframe, tmp_path):
+    # min_delta larger than any possible improvement forces a stop after `patience` epochs
+    data_path, config_path = _write_training_files(small_dataframe, tmp_path, epochs=10, patience=2, min_delta=1e6, val_fraction=0.2, resume=True)
+    model_path = str(tmp_path / 'vae.pt')
+    result = train_vae_with_privacy(data_path, config_path, model_path, privacy=False, device='cpu')
+    assert result['stopped_early']
+    assert result['epochs_run'] == 3 and result['epochs_saved'] == 7
+    assert result['wall_clock_saved_s'] > 0
+    assert result['best_epoch'] == 1 and len(result['val_losses']) == 3
+    # A finished checkpoint is not replayed: the rerun trains (and stops) again
+    again = train_vae_with_privacy(data_path, config_path, model_path, privacy=False, device='cpu')
+    assert again['epochs_run'] == 3 and again['resumed_from_epoch'] == 0 and again['samples_per_second'] > 0
+
+def test_train_vae_defaults_keep_full_data_and_epochs(small_dataframe, tmp_path):
+    data_path, config_path = _write_training_files(small_dataframe, tmp_path, epochs=3)
+    result = train_vae_with_privacy(data_path, config_path, str(tmp_path / 'vae.pt'), privacy=False, device='cpu')
+    assert result['epochs_run'] == 3 and result['val_losses'] == [] and not result['stopped_early']
+    # No checkpoint I/O unless asked for
+    assert not glob.glob(str(tmp_path / 'vae.pt.*.ckpt'))
+
+def test_train_vae_does_not_resume_other_data(small_dataframe, tmp_path):
+    # Same model path, resume on: a checkpoint of other data is not picked up
+    data_path, short_cfg = _write_training_files(small_dataframe, tmp_path, 'short.json', epochs=2, resume=True)
+    _, long_cfg = _write_training_files(small_dataframe, tmp_path, 'long.json', epochs=4, resume=True)
+    model_path = str(tmp_path / 'vae.pt')
+    train_vae_with_privacy(data_path, short_cfg, model_path, privacy=False, device='cpu')
+    (small_dataframe * 2).to_csv(data_path, index=False)
+    other = train_vae_with_privacy(data_path, long_cfg, model_path, privacy=False, device='cpu')
+    assert other['resumed_from_epoch'] == 0 and other['epochs_run'] == 4
+    # Nor one of another config
+    _, wide_cfg = _write_training_files(small_dataframe * 2, tmp_path, 'wide.json', epochs=6, resume=True, latent_dim=8)
+    wide = train_vae_with_privacy(data_path, wide_cfg, model_path, privacy=False, device='cpu')
+    assert wide['resumed_from_epoch'] == 0
+    # The original data still extends its own checkpoint
+    small_dataframe.to_csv(data_path, index=False)
+    resumed = train_vae_with_privacy(data_path, long_cfg, model_path, privacy=False, device='cpu')
+    assert resumed['resumed_from_epoch'] == 2 and resumed['epochs_run'] == 4
+
+def test_save_training_checkpoint_is_atomic(tmp_path):
+    path = str(tmp_path / 'state.ckpt')
+    save_training_checkpoint(path, {'epoch': 1})
+    with mock.patch('torch.save', side_effect=RuntimeError('disk full')):
+        with pytest.raises(RuntimeError):
+            save_training_checkpoint(path, {'epoch': 2})
+    assert load_training_checkpoint(path)['epoch'] == 1
+    assert load_training_checkpoint(str(tmp_path / 'missing.ckpt')) is None
+
+def _clipped_update(physical_batch_size, max_grad_norm):
+    torch.manual_seed(0)
+    model = TabularVAE(input_dim=6, latent_dim=3)
+    before = [p.detach().clone() for p in model.parameters()]
+    trainer = VectorizedDPTrainer(
+        model, torch.optim.SGD(model.parameters(), lr=1.0), noise_multiplier=0.0,
+        max_grad_norm=max_grad_norm, batch_size=16, sample_size=160, physical_batch_size=physical_batch_size,
+    )
+    trainer.step(torch.randn(16, 6, generator=torch.Generator().manual_seed(1)))
+    return torch.cat([(b - p.detach()).flatten() for b, p in zip(before, model.parameters())]), model, trainer
+
+def test_vectorized_dp_trainer_matches_per_sample_loop():
+    # Deterministic forward (z = mu) so vmap gradients can be compared with an explicit per-sample loop
+    with mock.patch.object(TabularVAE, 'reparameterize', lambda self, mu, logvar: mu):
+        full, _, trainer = _clipped_update(16, 0.05)
+        chunked, _, _ = _clipped_update(4, 0.05)
+        torch.manual_seed(0)
+        model = TabularVAE(input_dim=6, latent_dim=3)
+        x = torch.randn(16, 6, generator=torch.Generator().manual_seed(1))
+        expected = None
+        for row in x:
+            model.zero_grad()
+            recon, mu, logvar = model(row[None])
+            vae_loss(recon, row[None], mu, logvar).backward()
+            g = torch.cat([p.grad.flatten() for p in model.parameters()])
+            g = g * min(1.0, 0.05 / (g.norm().item() + 1e-6))
+            expected = g if expected is None else expected + g
+    torch.testing.assert_close(full, expected / 16, rtol=1e-4, atol=1e-6)
+    torch.testing.assert_close(chunked, full, rtol=1e-4, atol=1e-6)
+    assert full.norm() <= 0.05 + 1e-6
+    assert trainer.steps == 1
+
+def test_train_vae_vmap_dp_mode_reports_epsilon(small_dataframe, tmp_path):
+    data_path, config_path = _write_training_files(
+        small_dataframe, tmp_path, epochs=2, patience=None, noise_multiplier=1.0, dp_mode='vmap', physical_batch_size=2,
+    )
+    result = train_vae_with_privacy(data_path, config_path, str(tmp_path / 'vae.pt'), privacy=True, delta=1e-5, device='cpu')
+    report = result['privacy_report']
+    assert report['dp_mode'] == 'vmap' and report['epsilon'] > 0
+    # 29 training rows (3 held out) in batches of 4 over 2 epochs: more than one step was accounted
+    assert report['epsilon'] > rdp_epsilon(1.0, 4 / 29, 1, 1e-5)[0]
+
+def test_privacy_report_documents_validation_model_selection(small_dataframe, tmp_path):
+    data_path, config_path = _write_training_files(
+        small_dataframe, tmp_path, epochs=2, val_fraction=0.2, noise_multiplier=1.0, dp_mode='vmap', physical_batch_size=2,
+    )
+    result = train_vae_with_privacy(data_path, config_path, str(tmp_path / 'vae.pt'), privacy=True, delta=1e-5, device='cpu')
+    selection = result['privacy_report']['model_selection']
+    assert selection['selected_epoch'] == result['best_epoch'] and selection['epochs_accounted'] == 2
+    assert selection['validation_rows'] > 0 and selection['validation_rows_protected'] is False
+
+def test_train_vae_rejects_unknown_dp_mode(small_dataframe, tmp_path):
+    data_path, config_path = _write_training_files(small_dataframe, tmp_path, noise_multiplier=1.0, dp_mode='ghost')
+    with pytest.raises(ValueError):
+        train_vae_with_privacy(data_path, config_path, str(tmp_path / 'vae.pt'), privacy=True, device='cpu')
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_vectorized_dp_overhead():
+    result = benchmark_dp_overhead()
+    # Per-sample gradients cost a small multiple of non-private training, not orders of magnitude
+    assert result['vmap_overhead'] < 30, result
+
+def test_train_vae_exports_gated_decoders_used_for_sampling(small_dataframe, tmp_path):
+    data_path, config_path = _write_training_files(small_dataframe, tmp_path, epochs=2, patience=None)
+    with open(config_path) as f:
+        cfg = json.load(f)
+    with open(config_path, 'w') as f:
+        json.dump(dict(cfg, data_path=data_path), f)
+    model_path = str(tmp_path / 'vae.pt')
+    result = train_vae_with_privacy(data_path, config_path, model_path, privacy=False, device='cpu')
+    manifest = result['decoder_export']
+    assert manifest['variants']['fp32']['passed'] and manifest['variants']['fp32']['mean_error'] < 1e-5
+    assert manifest['preferred'] in DECODER_VARIANTS
+    assert os.path.exists(decoder_manifest_path(model_path))
+    eager_csv, fp32_csv = str(tmp_path / 'eager.csv'), str(tmp_path / 'fp32.csv')
+    sample_synthetic_data(model_path, config_path, 50, eager_csv, device='cpu', seed=7, decoder_variant='eager')
+    with mock.patch('torch.load', side_effect=AssertionError('eager weights should not be loaded')):
+        sample_synthetic_data(model_path, config_path, 50, fp32_csv, device='cpu', seed=7, decoder_variant='fp32')
+    pd.testing.assert_frame_equal(pd.read_csv(fp32_csv), pd.read_csv(eager_csv), rtol=1e-4)
+
+def test_export_decoder_gate_discards_inaccurate_variants(tmp_path):
+    torch.manual_seed(0)
+    model = TabularVAE(input_dim=5, latent_dim=3)
+    model_path = str(tmp_path / 'vae.pt')
+    torch.save(model.state_dict(), model_path)
+    manifest = export_decoder(model, model_path, variants=('fp32', 'bf16'), tolerance=1e-6, gate_rows=2000)
+    assert manifest['variants']['fp32']['passed'] and not manifest['variants']['bf16']['passed']
+    assert not os.path.exists(model_path + '.decoder-bf16.pt')
+    assert manifest['preferred'] == 'fp32'
+    assert load_exported_decoder(model_path, 'bf16') is None
+    assert load_exported_decoder(model_path, 'auto')[1] == 'fp32'
+    # Retrained weights make the artifacts stale
+    time.sleep(0.01)
+    torch.save(TabularVAE(input_dim=5, latent_dim=3).state_dict(), model_path)
+    assert load_exported_decoder(model_path, 'auto') is None
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_exported_decoder_sampling_throughput(tmp_path):
+    report = benchmark_sampling_variants(workdir=str(tmp_path))
+    best = report['variants'][report['preferred']]
+    assert best['rows_per_second'] >= report['variants']['eager']['rows_per_second'] * 0.9, report
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_distributed_training_scaling(tmp_path):
+    n = max(2, min(4, os.cpu_count() or 1))
+    rates = benchmark_distributed_scaling(world_sizes=(1, n), workdir=str(tmp_path))
+    assert rates[n] > rates[1], rates
+
 def test_PrivacyUtilityValidator_stat_and_metrics(small_dataframe, temp_output_csv):
     # Generate synthetic data similar to the real
     synth = small_dataframe.copy()
@@ -177,6 +450,54 @@ def test_PrivacyUtilityValidator_stat_and_metrics(small_dataframe, temp_output_c
     finally:
         os.remove('real_test.csv')
 
+def test_blockwise_silhouette_matches_sklearn():
+    from sklearn.metrics import silhouette_samples
+    rng = np.random.default_rng(3)
+    X = np.vstack([rng.normal(0, 1, (70, 4)), rng.normal(1, 1, (50, 4))])
+    labels = np.array([0] * 70 + [1] * 50)
+    # Block size smaller than n forces several distance tiles
+    values = blockwise_silhouette_samples(X, labels, block_size=16)
+    np.testing.assert_allclose(values, silhouette_samples(X, labels), atol=1e-9)
+
+def test_estimate_silhouette_ci_covers_exact_score():
+    rng = np.random.default_rng(5)
+    X = np.vstack([rng.normal(0, 1, (600, 3)), rng.normal(0.8, 1, (400, 3))])
+    labels = np.array([0] * 600 + [1] * 400)
+    exact = blockwise_silhouette_samples(X, labels).mean()
+    est = estimate_silhouette(X, labels, sample_budget=300 * 1000, confidence=0.99)
+    assert est['n_anchors'] < 1000 and est['n_reference'] == 1000
+    assert est['ci_low'] <= exact <= est['ci_high']
+
+def test_silhouette_report_modes(small_dataframe, temp_output_csv):
+    synth = small_dataframe.astype(float) + 0.5
+    synth.to_csv(temp_output_csv, index=False)
+    real_csv = tempfile.mktemp(suffix='.csv')
+    try:
+        small_dataframe.to_csv(real_csv, index=False)
+        v = PrivacyUtilityValidator(real_csv, temp_output_csv)
+        exact = v.silhouette_report(mode='blockwise')
+        assert exact['mode'] == 'blockwise' and exact['ci_low'] == exact['ci_high']
+        assert v.silhouette_report(mode='auto', time_budget_s=60)['mode'] == 'blockwise'
+        assert v.silhouette_report(mode='auto', time_budget_s=0.0)['mode'] == 'sampled'
+        with pytest.raises(ValueError):
+            v.silhouette_report(mode='full')
+    finally:
+        os.remove(real_csv)
+
+def test_membership_inference_risk_probes_all_rows(small_dataframe, temp_output_csv):
+    synth = small_dataframe.astype(float) + 100.0
+    synth.iloc[:4] = small_dataframe.iloc[:4].to_numpy(dtype=float)
+    synth.to_csv(temp_output_csv, index=False)
+    real_csv = tempfile.mktemp(suffix='.csv')
+    try:
+        small_dataframe.to_csv(real_csv, index=False)
+        v = PrivacyUtilityValidator(real_csv, temp_output_csv)
+        assert v.membership_inference_risk() == pytest.approx(4 / len(small_dataframe))
+        report = v.privacy_risk_report()
+        assert report['n_exact_matches'] == 4 and report['dcr']['min'] == pytest.approx(0.0)
+    finally:
+        os.remove(real_csv)
+
 # --------- minimum_viable_quality_checks
 
 def test_minimum_viable_quality_checks(small_dataframe, temp_output_csv):
@@ -212,6 +533,23 @@ def test_design_pipeline_documentation(tmp_path):
         data = json.load(f)
     assert 'data_ingestion' in data and 'output' in data
 
+# --------- Columnar output formats
+
+@pytest.mark.parametrize('fmt,ext', [('csv', '.csv'), ('parquet', '.parquet'), ('arrow', '.arrow'), ('feather', '.arrow')])
+def test_write_and_read_tabular_file_roundtrip(small_dataframe, tmp_path, fmt, ext):
+    path = str(tmp_path / f'synthetic{ext}')
+    used = write_tabular_file(small_dataframe.astype(np.float32), path, fmt)
+    assert used == resolve_output_format(fmt)
+    loaded = read_tabular_file(path)
+    assert list(loaded.columns) == list(small_dataframe.columns)
+    np.testing.assert_allclose(loaded.to_numpy(), small_dataframe.to_numpy(dtype=np.float32), rtol=1e-6)
+
+def test_resolve_output_format_rejects_unknown():
+    assert resolve_output_format(None, 'out.parquet') == 'parquet'
+    assert resolve_output_format(None, 'out.unknown') == 'csv'
+    with pytest.raises(ValueError):
+        resolve_output_format('xlsx')
+
 # --------------
 # Error Handling & Edge Cases
 # --------------
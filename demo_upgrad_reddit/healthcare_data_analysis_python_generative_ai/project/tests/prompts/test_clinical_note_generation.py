@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import asyncio
+import pytest
+from src.prompts.clinical_note_generation import (
+    TextGenerationBackend,
+    LocalStandInBackend,
+    NoteGenerationEngine,
+    backend_from_env,
+    load_completed_ids,
+    benchmark_note_generation
+)
+
+
+class RecordingBackend(LocalStandInBackend):
+    """
+    Stand-in that records batch sizes and peak concurrency, and can fail selected prompts.
+    """
+    def __init__(self, fail_substring=None, fail_times=0):
+        super().__init__(latency_s=0.01)
+        self.batch_sizes = []
+        self.active = 0
+        self.peak = 0
+        self.fail_substring = fail_substring
+        self.fail_times = fail_times
+    async def generate(self, prompts, **params):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            self.batch_sizes.append(len(prompts))
+            if self.fail_substring and any(self.fail_substring in p for p in prompts) and self.fail_times != 0:
+                self.fail_times -= 1
+                raise RuntimeError('backend unavailable')
+            return await super().generate(prompts, **params)
+        finally:
+            self.active -= 1
+
+def _records(n):
+    return [{'id': f'p{i}', 'fhir_json': {'resourceType': 'Patient', 'age': 30 + i}} for i in range(n)]
+
+def _read(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_engine_batches_with_bounded_concurrency(tmp_path):
+    backend = RecordingBackend()
+    engine = NoteGenerationEngine(backend, batch_size=5, max_concurrency=2)
+    report = engine.run(_records(10), str(tmp_path / 'notes.jsonl'))
+    rows = _read(tmp_path / 'notes.jsonl')
+    assert report['n_written'] == 40 == len(rows)  # 10 records x 4 templates
+    assert {r['note_id'] for r in rows} == {f'p{i}:{t}' for i in range(10) for t in range(4)}
+    assert backend.batch_sizes == [5] * 8
+    assert backend.peak <= 2
+    assert report['notes_per_second'] > 0
+    assert '"age":30' in rows[0]['prompt']
+
+def test_engine_resumes_after_failure(tmp_path):
+    out = str(tmp_path / 'notes.jsonl')
+    backend = RecordingBackend(fail_substring='"age":35', fail_times=-1)
+    engine = NoteGenerationEngine(backend, templates=['Note for {fhir_json}'], batch_size=1, max_retries=1, retry_backoff_s=0)
+    first = engine.run(_records(8), out)
+    assert first['n_written'] == 7 and first['failed_note_ids'] == ['p5:0']
+    # Simulate a crash mid-write: the torn line is dropped on resume
+    with open(out, 'a') as f:
+        f.write('{"note_id": "p9:0", "no')
+    assert len(load_completed_ids(out)) == 7
+    second = NoteGenerationEngine(RecordingBackend(), templates=['Note for {fhir_json}'], batch_size=4).run(_records(8), out)
+    assert second['n_skipped'] == 7 and second['n_written'] == 1
+    assert sorted(r['note_id'] for r in _read(out)) == sorted(f'p{i}:0' for i in range(8))
+
+def test_engine_without_resume_replaces_earlier_notes(tmp_path):
+    out = str(tmp_path / 'notes.jsonl')
+    NoteGenerationEngine(RecordingBackend(), templates=['Note for {fhir_json}']).run(_records(2), out)
+    other = [{'id': f'p{i}', 'fhir_json': {'age': 90 + i}} for i in range(2)]
+    report = NoteGenerationEngine(RecordingBackend(), templates=['Note for {fhir_json}']).run(other, out, resume=False)
+    assert report['n_skipped'] == 0 and report['n_written'] == 2
+    assert [r['prompt'] for r in _read(out)] == ['Note for {"age":90}', 'Note for {"age":91}']
+
+def test_backend_from_env_requires_explicit_configuration(monkeypatch):
+    monkeypatch.delenv('NOTE_BACKEND', raising=False)
+    monkeypatch.delenv('NOTE_BACKEND_ALLOW_STAND_IN', raising=False)
+    with pytest.raises(ValueError, match='not configured'):
+        backend_from_env()
+    monkeypatch.setenv('NOTE_BACKEND', 'local')
+    with pytest.raises(ValueError, match='stand-in'):
+        backend_from_env()
+    monkeypatch.setenv('NOTE_BACKEND_ALLOW_STAND_IN', '1')
+    assert isinstance(backend_from_env(), LocalStandInBackend)
+    monkeypatch.setenv('NOTE_BACKEND', 'openai')
+    monkeypatch.delenv('NOTE_BACKEND_URL', raising=False)
+    with pytest.raises(ValueError, match='NOTE_BACKEND_URL'):
+        backend_from_env()
+
+def test_engine_retries_transient_errors(tmp_path):
+    backend = RecordingBackend(fail_substring='Note', fail_times=1)
+    engine = NoteGenerationEngine(backend, templates=['Note for {fhir_json}'], batch_size=8, retry_backoff_s=0)
+    report = engine.run(_records(3), str(tmp_path / 'notes.jsonl'))
+    assert report['n_written'] == 3 and report['n_failed'] == 0
+    assert backend.batch_sizes == [3, 3]
+
+def test_engine_rejects_short_backend_responses(tmp_path):
+    class Short(TextGenerationBackend):
+        async def generate(self, prompts, **params):
+            return prompts[:-1]
+    engine = NoteGenerationEngine(Short(), templates=['{fhir_json}'], max_retries=0)
+    assert engine.run(_records(2), str(tmp_path / 'notes.jsonl'))['n_failed'] == 2
+
+def test_backend_must_implement_generate():
+    with pytest.raises(TypeError):
+        TextGenerationBackend()
+    class Incomplete(TextGenerationBackend):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete()
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_note_generation_throughput(tmp_path):
+    report = benchmark_note_generation(n_records=5000, output_dir=str(tmp_path))
+    assert report['n_written'] == 20000
+    assert report['notes_per_second'] > 2000, report
@@ -0,0 +1,56 @@
+import os
+import pytest
+from src.prompts.clinical_text_generation_prompts import (
+    ClinicalNotePromptTemplates,
+    CompiledTemplate,
+    compile_template,
+    clinical_text_generation_prompt_examples,
+    benchmark_prompt_rendering
+)
+
+
+def test_compiled_template_segments_and_render():
+    c = CompiledTemplate('A {x} and {y} then {x}; braces {{ ok }}')
+    assert c.fields == ('x', 'y')
+    assert c.segments == ['A ', 0, ' and ', 1, ' then ', 0, '; braces {{ ok }}']
+    assert c.render({'x': 1, 'y': '{z}'}) == 'A 1 and {z} then 1; braces {{ ok }}'
+    assert c.render({'x': 1}) == 'A 1 and {y} then 1; braces {{ ok }}'
+    assert c.unresolved({'x'}) == ['y']
+    assert c.partial({'y': 'Y'}).render_values(('X',)) == 'A X and Y then X; braces {{ ok }}'
+    assert compile_template('{a}') is compile_template('{a}')
+
+def test_render_column_renders_one_open_slot_per_value():
+    c = CompiledTemplate('Note {x} for {y}; {x}').partial({'x': '{N}'})
+    assert c.render_column(['1', '{2}']) == ['Note {N} for 1; {N}', 'Note {N} for {2}; {N}']
+    assert CompiledTemplate('fixed').render_column(['a', 'b']) == ['fixed', 'fixed']
+    with pytest.raises(ValueError):
+        CompiledTemplate('{x} {y}').render_column(['a'])
+
+def test_render_prompt_matches_legacy_and_warns(caplog):
+    pt = ClinicalNotePromptTemplates()
+    with caplog.at_level('WARNING'):
+        out = pt.render_prompt('Tone {note_tone} for {fhir_json}', {}, {'fhir_json': '{"a": 1}'})
+    assert out == 'Tone {note_tone} for {"a": 1}'
+    assert 'Unresolved placeholders' in caplog.text and 'note_tone' in caplog.text
+
+def test_render_bulk_matches_parameterize_prompt():
+    pt = ClinicalNotePromptTemplates()
+    column = ['{"resourceType": "Patient", "age": 40}', '{"resourceType": "Encounter"}']
+    params = {'document_type': 'ER note', 'note_tone': 'concise', 'userType': 'resident', 'section_formatting': 'narrative'}
+    bulk = list(pt.render_bulk(iter(column), params))
+    assert bulk == [pt.parameterize_prompt(f, **params) for f in column]
+    # Across chunk boundaries, in order
+    long_column = [f'{{"age": {i}}}' for i in range(2500)]
+    assert list(pt.render_bulk(long_column, params)) == [pt.parameterize_prompt(f, **params) for f in long_column]
+    assert len(clinical_text_generation_prompt_examples()) == 8
+
+def test_compile_bulk_detects_unresolved_placeholders():
+    pt = ClinicalNotePromptTemplates()
+    with pytest.raises(ValueError, match='userType'):
+        pt.compile_bulk({'note_tone': 'formal', 'document_type': 'note', 'section_formatting': 'SOAP'})
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_render_bulk_performance():
+    report = benchmark_prompt_rendering(200_000)
+    assert report['n_prompts'] == 800_000
+    assert report['speedup'] > 1.5, report
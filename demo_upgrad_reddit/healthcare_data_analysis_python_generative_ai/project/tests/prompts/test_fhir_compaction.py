@@ -0,0 +1,63 @@
+import json
+from src.prompts import fhir_compaction
+from src.prompts.fhir_compaction import compact_fhir, count_tokens, resource_tokens, FhirCompactor, _truncate_to_tokens
+from src.prompts.clinical_note_generation import LocalStandInBackend, NoteGenerationEngine
+
+
+def _bundle(n_obs=30):
+    entries = [{'fullUrl': 'urn:uuid:p1', 'resource': {
+        'resourceType': 'Patient', 'id': 'p1', 'meta': {'versionId': '3', 'lastUpdated': '2023-01-01T00:00:00Z'},
+        'text': {'status': 'generated', 'div': '<div>Jane Roe</div>'}, 'name': [{'family': 'Roe', 'given': ['Jane']}],
+        'gender': 'female', 'birthDate': '1956-04-02', 'telecom': [], 'extension': [{'url': 'http://x', 'valueString': 'y'}],
+    }}]
+    for i in range(n_obs):
+        entries.append({'resource': {
+            'resourceType': 'Observation', 'status': 'final', 'effectiveDateTime': f'2023-01-{i + 1:02d}',
+            'code': {'coding': [{'system': 'http://loinc.org', 'code': '8867-4', 'display': 'Heart rate'}]},
+            'valueQuantity': {'value': 60 + i, 'unit': '/min', 'system': 'http://unitsofmeasure.org', 'code': '/min'},
+            'subject': {'reference': 'Patient/p1'}, 'note': [], 'interpretation': None,
+        }})
+    entries.append({'resource': {'resourceType': 'Condition', 'code': {'text': 'Type 2 diabetes'}, 'onsetDateTime': '2015-06-01'}})
+    return {'resourceType': 'Bundle', 'type': 'collection', 'entry': entries}
+
+def test_compaction_prunes_flattens_and_orders():
+    text, stats = compact_fhir(json.dumps(_bundle(2)), token_budget=10_000)
+    resources = json.loads(text)
+    assert [r['resourceType'] for r in resources] == ['Patient', 'Condition', 'Observation', 'Observation']
+    patient = resources[0]
+    assert 'meta' not in patient and 'text' not in patient and 'name' not in patient and 'telecom' not in patient
+    assert resources[1]['code'] == 'Type 2 diabetes'
+    assert resources[2] == {'resourceType': 'Observation', 'status': 'final', 'effectiveDateTime': '2023-01-02', 'code': 'Heart rate', 'value': '61 /min', 'subject': 'Patient/p1'}
+    assert stats['tokens_after'] < stats['tokens_before']
+    assert stats['resources_before'] == stats['resources_kept'] == 4
+
+def test_compaction_respects_top_n_and_budget():
+    text, stats = compact_fhir(_bundle(30), token_budget=150, top_n=10)
+    assert stats['tokens_after'] <= 150
+    assert 1 <= stats['resources_kept'] < 10
+    assert json.loads(text)[0]['resourceType'] == 'Patient'
+    single, single_stats = compact_fhir({'resourceType': 'Observation', 'valueString': 'x' * 50 + ' word' * 400}, token_budget=40)
+    assert single_stats['tokens_after'] <= 40 and single.endswith('…')
+    assert count_tokens('{"a":1}') == count_tokens('{"a":1}')
+
+def test_truncation_fits_budget_and_long_text_is_not_memoized():
+    text = ' '.join(f'word{i}, x' for i in range(2000))
+    for budget in (1, 2, 7, 300):
+        cut = _truncate_to_tokens(text, budget)
+        assert cut.endswith('…') and count_tokens(cut) <= budget
+        assert text.startswith(cut[:-1])
+    assert _truncate_to_tokens('a b c', 3) == 'a b c'
+    before = fhir_compaction._cached_count.cache_info().currsize
+    assert resource_tokens(text) == count_tokens(text)
+    assert fhir_compaction._cached_count.cache_info().currsize == before
+    resource_tokens('{"resourceType":"Patient","gender":"female"}')
+    assert fhir_compaction._cached_count.cache_info().currsize == before + 1
+
+def test_engine_reports_token_counts_per_prompt(tmp_path):
+    engine = NoteGenerationEngine(LocalStandInBackend(), templates=['Note for {fhir_json}'], compactor=FhirCompactor(token_budget=200))
+    report = engine.run([{'id': 'b1', 'fhir_json': _bundle(30)}], str(tmp_path / 'notes.jsonl'))
+    with open(tmp_path / 'notes.jsonl') as f:
+        row = json.loads(f.readline())
+    assert row['fhir_tokens_after'] <= 200 < row['fhir_tokens_before']
+    assert report['fhir_tokens_before'] == row['fhir_tokens_before']
+    assert report['fhir_tokens_after'] == row['fhir_tokens_after']
@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import pytest
+from src.prompts.note_cache import NoteCache, note_cache_key
+from src.prompts.clinical_note_generation import LocalStandInBackend, NoteGenerationEngine
+
+
+class CountingBackend(LocalStandInBackend):
+    def __init__(self):
+        super().__init__()
+        self.prompts_seen = 0
+    async def generate(self, prompts, **params):
+        self.prompts_seen += len(prompts)
+        return await super().generate(prompts, **params)
+
+def test_note_cache_key_covers_prompt_backend_and_params():
+    base = note_cache_key('p', 'local', {'temperature': 0.7, 'top_p': 1})
+    assert base == note_cache_key('p', 'local', {'top_p': 1, 'temperature': 0.7})
+    assert base != note_cache_key('q', 'local', {'temperature': 0.7, 'top_p': 1})
+    assert base != note_cache_key('p', 'openai:m', {'temperature': 0.7, 'top_p': 1})
+    assert base != note_cache_key('p', 'local', {'temperature': 0.2, 'top_p': 1})
+
+def test_note_cache_roundtrip_and_hit_rate(tmp_path):
+    cache = NoteCache(str(tmp_path / 'notes.sqlite'))
+    cache.put_many([('a', 'note a'), ('b', 'note b')])
+    assert cache.get_many(['a', 'b', 'c']) == {'a': 'note a', 'b': 'note b'}
+    report = cache.report()
+    assert report['hits'] == 2 and report['misses'] == 1
+    assert report['hit_rate'] == pytest.approx(2 / 3)
+    cache.close()
+    reopened = NoteCache(str(tmp_path / 'notes.sqlite'))
+    assert reopened.get('a') == 'note a' and len(reopened) == 2
+
+def test_note_cache_evicts_least_recently_used(tmp_path):
+    cache = NoteCache(str(tmp_path / 'notes.sqlite'), max_bytes=300)
+    cache.put_many([(f'k{i}', 'x' * 100) for i in range(3)])
+    cache.get('k0')  # k1 is now the least recently used
+    cache.put('k3', 'x' * 100)
+    assert cache.get('k1') is None
+    assert cache.get('k0') is not None and cache.get('k3') is not None
+    assert cache.total_bytes() <= 300 and cache.evictions >= 1
+
+def test_note_cache_tracks_total_without_scanning(tmp_path):
+    path = str(tmp_path / 'private' / 'notes.sqlite')
+    cache = NoteCache(path, max_bytes=10_000)
+    assert os.stat(os.path.dirname(path)).st_mode & 0o077 == 0
+    cache.put_many([('a', 'x' * 10), ('b', 'y' * 20)])
+    cache.put('a', 'z' * 5)  # replacing an entry adjusts by the size difference
+    assert cache.total_bytes() == 25
+    other = NoteCache(path, max_bytes=10_000)  # another process sharing the database
+    other.put('c', 'w' * 7)
+    assert cache.total_bytes() == other.total_bytes() == 32
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT SUM(size) FROM notes').fetchone()[0] == 32
+    conn.close()
+
+def test_engine_reuses_cached_notes_across_runs(tmp_path):
+    cache = NoteCache(str(tmp_path / 'notes.sqlite'))
+    records = [{'id': i, 'fhir_json': {'age': 30 + i}} for i in range(5)]
+    first_backend = CountingBackend()
+    first = NoteGenerationEngine(first_backend, cache=cache).run(records, str(tmp_path / 'run1.jsonl'))
+    assert first_backend.prompts_seen == 20 and first['n_cached'] == 0
+    second_backend = CountingBackend()
+    second = NoteGenerationEngine(second_backend, cache=cache).run(records + [{'id': 9, 'fhir_json': {'age': 99}}], str(tmp_path / 'run2.jsonl'))
+    assert second_backend.prompts_seen == 4
+    assert second['n_written'] == 24 and second['n_cached'] == 20
+    assert second['cache']['hit_rate'] == pytest.approx(20 / 44)
@@ -0,0 +1,104 @@
+import os
+import json
+import threading
+import pytest
+import torch
+import torch.nn as nn
+from unittest import mock
+from src.training.checkpoint_manager import CheckpointManager, snapshot_state
+
+
+def _model_and_optimizer():
+    torch.manual_seed(0)
+    model = nn.Linear(4, 2)
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.1)
+    model(torch.randn(3, 4)).sum().backward()
+    optimizer.step()
+    return model, optimizer
+
+def _files(directory):
+    return sorted(f for f in os.listdir(directory) if f.endswith('.pt'))
+
+def test_snapshot_is_detached_from_live_weights():
+    model, _ = _model_and_optimizer()
+    snap = snapshot_state(model.state_dict())
+    with torch.no_grad():
+        model.weight.add_(1.0)
+    assert not torch.equal(snap['weight'], model.weight)
+
+def test_interval_and_keep_last_retention(tmp_path):
+    model, optimizer = _model_and_optimizer()
+    with CheckpointManager(str(tmp_path), 'gan', interval=2, keep_last=2) as manager:
+        queued = [manager.save(epoch, {'generator': model, 'g_optimizer': optimizer}) for epoch in range(1, 8)]
+        manager.save(7, {'generator': model}, force=True)
+    assert queued == [False, True, False, True, False, True, False]
+    assert _files(tmp_path) == ['gan_epoch6.pt', 'gan_epoch7.pt']
+    with open(tmp_path / 'gan_checkpoints.json') as f:
+        assert [e['epoch'] for e in json.load(f)] == [6, 7]
+    assert manager.stats['saved'] == 4 and manager.stats['deleted'] == 2
+
+def test_keep_best_by_metric(tmp_path):
+    model, _ = _model_and_optimizer()
+    losses = {1: 0.9, 2: 0.2, 3: 0.5, 4: 0.7, 5: 0.6}
+    with CheckpointManager(str(tmp_path), 'gan', interval=1, keep_last=1, keep_best=1, metric='g_loss') as manager:
+        for epoch, loss in losses.items():
+            manager.save(epoch, {'generator': model}, metrics={'g_loss': loss})
+    assert _files(tmp_path) == ['gan_epoch2.pt', 'gan_epoch5.pt']
+    assert manager.best()['epoch'] == 2 and manager.latest()['epoch'] == 5
+
+def test_resume_restores_latest_and_best(tmp_path):
+    model, optimizer = _model_and_optimizer()
+    with CheckpointManager(str(tmp_path), 'gan', interval=1, keep_last=1, metric='d_loss') as manager:
+        manager.save(1, {'generator': model, 'g_optimizer': optimizer}, metrics={'d_loss': 0.1})
+        best_weight = model.weight.detach().clone()
+        with torch.no_grad():
+            model.weight.mul_(2.0)
+        manager.save(2, {'generator': model, 'g_optimizer': optimizer}, metrics={'d_loss': 0.5})
+        latest_weight = model.weight.detach().clone()
+    fresh, fresh_opt = nn.Linear(4, 2), torch.optim.Adam(nn.Linear(4, 2).parameters(), lr=0.1)
+    # A new manager over the same directory picks retained checkpoints up from the index
+    manager = CheckpointManager(str(tmp_path), 'gan', metric='d_loss')
+    payload = manager.resume({'generator': fresh, 'g_optimizer': fresh_opt})
+    assert payload['epoch'] == 2 and torch.equal(fresh.weight, latest_weight)
+    assert fresh_opt.state_dict()['state'][0]['step'] == optimizer.state_dict()['state'][0]['step']
+    assert manager.resume({'generator': fresh}, which='best')['epoch'] == 1
+    assert torch.equal(fresh.weight, best_weight)
+    manager.close()
+    assert CheckpointManager(str(tmp_path / 'empty'), 'gan').resume({'generator': fresh}) is None
+
+def test_clear_removes_retained_checkpoints(tmp_path):
+    model, _ = _model_and_optimizer()
+    with CheckpointManager(str(tmp_path), 'gan', interval=1, keep_last=2) as manager:
+        manager.save(5, {'generator': model})
+        manager.clear()
+        manager.save(1, {'generator': model})
+    # The new, lower epoch is kept rather than pruned in favour of the stale one
+    assert _files(tmp_path) == ['gan_epoch1.pt'] and manager.latest()['epoch'] == 1
+
+def test_save_does_not_wait_for_disk(tmp_path):
+    model, _ = _model_and_optimizer()
+    release = threading.Event()
+    real_save = torch.save
+    def slow_save(obj, path):
+        release.wait(5)
+        real_save(obj, path)
+    with mock.patch('src.training.checkpoint_manager.torch.save', side_effect=slow_save):
+        manager = CheckpointManager(str(tmp_path), 'gan', interval=1, max_pending=2)
+        # First payload is taken by the writer, two more fit in the queue: none of these block
+        for epoch in (1, 2, 3):
+            manager.save(epoch, {'generator': model})
+        assert _files(tmp_path) == []
+        release.set()
+        manager.close()
+    assert _files(tmp_path) == ['gan_epoch2.pt', 'gan_epoch3.pt']
+    assert not any(f.endswith('.tmp') for f in os.listdir(tmp_path))
+
+def test_background_write_error_surfaces(tmp_path):
+    model, _ = _model_and_optimizer()
+    manager = CheckpointManager(str(tmp_path), 'gan', interval=1)
+    with mock.patch('src.training.checkpoint_manager.torch.save', side_effect=OSError('disk full')):
+        manager.save(1, {'generator': model})
+        with pytest.raises(RuntimeError, match='disk full'):
+            manager.flush()
+    manager.close()
+    assert _files(tmp_path) == []
@@ -0,0 +1,84 @@
+import os
+import json
+import numpy as np
+import pytest
+import torch.nn as nn
+from src.training.hyperparameter_sweep import (
+    SharedArray, attach_shared_array, expand_grid, halving_rungs, marginal_fidelity_error, run_sweep,
+    successive_halving
+)
+
+
+# Module-level so spawned workers can unpickle them
+class TinyGenerator(nn.Module):
+    def __init__(self, noise_dim, data_dim):
+        super().__init__()
+        self.net = nn.Sequential(nn.Linear(noise_dim, 16), nn.ReLU(), nn.Linear(16, data_dim), nn.Sigmoid())
+    def forward(self, z):
+        return self.net(z)
+
+class TinyDiscriminator(nn.Module):
+    def __init__(self, data_dim):
+        super().__init__()
+        self.net = nn.Sequential(nn.Linear(data_dim, 16), nn.ReLU(), nn.Linear(16, 1), nn.Sigmoid())
+    def forward(self, x):
+        return self.net(x)
+
+def test_grid_and_rungs():
+    configs = expand_grid({'noise_dim': [8, 16], 'lr': [1e-3, 1e-4]})
+    assert len(configs) == 4 and all(c['batch_size'] == 256 for c in configs)
+    assert halving_rungs(1, 27, eta=3) == [1, 3, 9, 27]
+    assert halving_rungs(2, 10, eta=3) == [2, 6, 10]
+    assert halving_rungs(5, 5) == [5]
+
+def test_shared_array_round_trip():
+    data = np.random.default_rng(0).random((50, 3)).astype(np.float32)
+    with SharedArray(data) as shared:
+        np.testing.assert_array_equal(attach_shared_array(shared.spec), data)
+
+def test_fidelity_error_prefers_matching_marginals():
+    rng = np.random.default_rng(0)
+    real = rng.random((2000, 3))
+    assert marginal_fidelity_error(real, rng.random((2000, 3))) < marginal_fidelity_error(real, rng.random((2000, 3)) * 0.2)
+
+def test_sweep_halves_candidates_and_reports_finalists(tmp_path):
+    data = np.random.default_rng(0).beta(2, 5, (512, 4)).astype(np.float32)
+    reported = []
+    def report(generator, result):
+        reported.append(result['key'])
+        return {'dp_epsilon': 1.0, 'mia_risk': 0.5}
+    leaderboard = run_sweep(
+        data, {'noise_dim': [4, 8], 'lr': [1e-2, 1e-4], 'batch_size': [64], 'epochs': [3]},
+        str(tmp_path), TinyGenerator, TinyDiscriminator, report_fn=report, finalists=1,
+        min_epochs=1, eta=3, max_workers=2, eval_rows=256
+    )
+    assert len(leaderboard) == 4
+    # Rungs of 1 and 3 epochs: one of the four candidates continues to the final rung
+    top, rest = leaderboard[0], leaderboard[1:]
+    assert top['rung'] == 1 and top['epochs'] == 3 and top['epochs_trained'] == 2
+    assert all(r['rung'] == 0 and r['epochs'] == 1 for r in rest)
+    assert reported == [top['key']] and top['report']['mia_risk'] == 0.5 and 'report' not in rest[0]
+    with open(tmp_path / 'leaderboard.json') as f:
+        assert [e['key'] for e in json.load(f)] == [e['key'] for e in leaderboard]
+    assert os.path.isfile(top['checkpoint'])
+
+def test_rerun_in_same_output_dir_does_not_resume_other_candidates(tmp_path):
+    rng = np.random.default_rng(0)
+    first, second = rng.beta(2, 5, (256, 4)).astype(np.float32), rng.beta(5, 2, (256, 4)).astype(np.float32)
+    def halve(data, configs, epochs):
+        # A single rung of `epochs`
+        return successive_halving(data, configs, str(tmp_path), TinyGenerator, TinyDiscriminator, min_epochs=epochs,
+                                  max_epochs=epochs, max_workers=1, eval_rows=128)
+    config = {'noise_dim': 4, 'batch_size': 64, 'lr': 1e-2}
+    (done,) = halve(first, [config], 3)
+    assert done['epochs_trained'] == 3
+    # Same candidate and data: resumed, nothing to train
+    assert halve(first, [config], 3)[0]['epochs_trained'] == 0
+    # Other data, learning rate or noise_dim: trained from scratch (no stale weights, no size mismatch)
+    assert halve(second, [config], 3)[0]['epochs_trained'] == 3
+    assert halve(first, [dict(config, lr=1e-3)], 3)[0]['epochs_trained'] == 3
+    assert halve(first, [dict(config, noise_dim=8)], 3)[0]['epochs_trained'] == 3
+    # A checkpoint past the budget is dropped, and the new one is the one kept
+    (short,) = halve(first, [config], 1)
+    assert short['epochs'] == short['epochs_trained'] == 1 and short['checkpoint'].endswith('_epoch1.pt')
+    assert os.path.isfile(short['checkpoint'])
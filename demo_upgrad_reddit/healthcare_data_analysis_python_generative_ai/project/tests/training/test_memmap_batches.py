@@ -0,0 +1,84 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import torch.nn as nn
+from src.training.memmap_batches import (
+    ArrayRowSource, ArrowRowSource, BlockShuffleSampler, PrefetchingBatchLoader, make_row_source, benchmark_out_of_core
+)
+from src.training.gan_training_engine import GANTrainingEngine
+
+
+@pytest.fixture
+def npy_path(tmp_path):
+    # Column 0 holds the row id so batches can be traced back to rows
+    arr = np.column_stack([np.arange(1000), np.random.default_rng(0).random((1000, 3))]).astype(np.float32)
+    path = str(tmp_path / 'rows.npy')
+    np.save(path, arr)
+    return path
+
+def test_epoch_visits_each_row_at_most_once(npy_path):
+    loader = PrefetchingBatchLoader(make_row_source(npy_path), batch_size=64, block_rows=100, blocks_per_buffer=3, prefetch=2, seed=1)
+    batches = list(loader)
+    assert len(batches) == len(loader) == 1000 // 64
+    assert all(b.shape == (64, 4) and b.dtype == torch.float32 for b in batches)
+    ids = torch.cat(batches)[:, 0].long().tolist()
+    assert len(ids) == len(set(ids)) == 15 * 64
+    # Shuffled, and differently in the next epoch
+    assert ids != sorted(ids)
+    assert torch.cat(list(loader))[:, 0].long().tolist() != ids
+
+def test_sampler_blocks_cover_all_rows():
+    sampler = BlockShuffleSampler(1050, block_rows=100, blocks_per_buffer=4, seed=0)
+    blocks = [blk for buf in sampler.buffers() for blk in buf]
+    assert sorted(blocks)[0] == (0, 100) and sorted(blocks)[-1] == (1000, 1050)
+    assert sum(b - a for a, b in blocks) == 1050
+
+def test_memmap_column_view_and_arrow_sources_agree(npy_path, tmp_path):
+    mm = np.load(npy_path, mmap_mode='r')
+    view = ArrayRowSource(mm[:, :3])
+    assert view.shape == (1000, 3)
+    arrow_path = str(tmp_path / 'rows.arrow')
+    pd.DataFrame(np.load(npy_path), columns=['id', 'a', 'b', 'c']).to_feather(arrow_path, compression='uncompressed')
+    arrow = make_row_source(arrow_path)
+    assert isinstance(arrow, ArrowRowSource) and arrow.shape == (1000, 4)
+    np.testing.assert_array_equal(arrow.read(250, 300), make_row_source(npy_path).read(250, 300))
+    np.testing.assert_array_equal(view.read(0, 10), np.asarray(mm[:10, :3]))
+    with pytest.raises(ValueError):
+        make_row_source(str(tmp_path / 'rows.csv'))
+
+def test_early_exit_stops_prefetch_thread(npy_path):
+    loader = PrefetchingBatchLoader(make_row_source(npy_path), batch_size=16, block_rows=50, prefetch=1)
+    before = threading.active_count()
+    for _ in loader:
+        break
+    assert threading.active_count() == before
+
+def test_read_errors_reach_the_training_loop(npy_path):
+    class Broken(ArrayRowSource):
+        def read(self, start, stop):
+            raise OSError('I/O error')
+    loader = PrefetchingBatchLoader(Broken(np.load(npy_path, mmap_mode='r')), batch_size=16)
+    with pytest.raises(OSError):
+        list(loader)
+
+def test_engine_trains_from_loader(npy_path):
+    torch.manual_seed(0)
+    generator = nn.Sequential(nn.Linear(8, 16), nn.ReLU(), nn.Linear(16, 4), nn.Sigmoid())
+    discriminator = nn.Sequential(nn.Linear(4, 16), nn.ReLU(), nn.Linear(16, 1), nn.Sigmoid())
+    engine = GANTrainingEngine(generator, discriminator, noise_dim=8, batch_size=64)
+    source = make_row_source(npy_path)
+    before = [p.detach().clone() for p in discriminator.parameters()]
+    result = engine.train_loader_epoch(PrefetchingBatchLoader(source, 64, block_rows=200), data_dim=4)
+    assert result['steps'] == 15 and result['d_loss'] > 0
+    assert any(not torch.equal(a, b) for a, b in zip(before, discriminator.parameters()))
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_out_of_core_throughput():
+    make_g = lambda n, d: nn.Sequential(nn.Linear(n, 128), nn.ReLU(), nn.Linear(128, 128), nn.ReLU(), nn.Linear(128, d), nn.Sigmoid())
+    make_d = lambda d: nn.Sequential(nn.Linear(d, 128), nn.ReLU(), nn.Linear(128, 1), nn.Sigmoid())
+    result = benchmark_out_of_core(make_g, make_d, n_rows=1_000_000)
+    assert result['throughput_ratio'] > 0.7, result
+    assert result['memmap_buffer_bytes'] < result['in_memory_dataset_bytes']
@@ -0,0 +1,95 @@
+import os
+import sys
+import subprocess
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import torch.nn as nn
+from src.data.tabular_io import read_tabular_file
+from src.training.streaming_preprocessing import fit_streaming_transform
+from src.training.streaming_generation import (
+    BatchDecoder, iter_generated_batches, generate_to_file, benchmark_streaming_generation
+)
+
+
+@pytest.fixture
+def transform(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 200
+    df = pd.DataFrame({
+        'mrn': [f'MRN{i:05d}' for i in range(n)],
+        'age': rng.integers(18, 90, n),
+        'sex': rng.choice(['F', 'M'], n),
+        'dx': rng.choice(['E11', 'I10', 'J45'], n),
+        'bmi': rng.normal(27, 5, n).round(1),
+    })
+    path = tmp_path / 'raw.csv'
+    df.to_csv(path, index=False)
+    return fit_streaming_transform(str(path), ['mrn'], ['sex', 'dx'], ['age', 'bmi'])
+
+class ShapeRecorder(nn.Module):
+    def __init__(self, noise_dim, data_dim):
+        super().__init__()
+        self.net = nn.Sequential(nn.Linear(noise_dim, data_dim), nn.Sigmoid())
+        self.rows_seen = []
+    def forward(self, z):
+        self.rows_seen.append(z.shape[0])
+        return self.net(z) * 2  # spans the category code range
+
+def test_batch_decoder_matches_inverse_frame(transform):
+    batch = np.random.default_rng(1).random((37, 4)).astype(np.float32) * 2
+    decoded = BatchDecoder(transform)(batch)
+    expected = transform.inverse_frame(batch)
+    assert list(decoded) == transform.feature_columns
+    for col in expected:
+        if col in transform.categories:
+            assert list(decoded[col]) == list(expected[col])
+        else:
+            np.testing.assert_allclose(decoded[col], expected[col])
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet', 'arrow'])
+def test_generate_to_file_streams_fixed_size_batches(transform, tmp_path, fmt):
+    torch.manual_seed(0)
+    generator = ShapeRecorder(8, 4)
+    path = str(tmp_path / f'synthetic.{fmt}')
+    stats = generate_to_file(generator, transform, path, num_samples=1000, noise_dim=8, batch_size=128, seed=3)
+    assert stats['rows'] == 1000 and stats['batches'] == 8 and stats['format'] == fmt
+    assert max(generator.rows_seen) == 128 and sum(generator.rows_seen) == 1000
+    out = read_tabular_file(path)
+    assert list(out.columns) == transform.feature_columns and len(out) == 1000
+    # Same seed: identical rows to decoding the whole draw at once
+    reference = np.concatenate(list(iter_generated_batches(generator, 1000, 8, batch_size=128, seed=3)))
+    expected = transform.inverse_frame(reference)
+    assert list(out['dx']) == list(expected['dx'])
+    np.testing.assert_allclose(out['age'], expected['age'], rtol=1e-6)
+    assert not os.path.exists(path + '.tmp')
+
+def test_failed_generation_leaves_no_output(transform, tmp_path):
+    class Failing(ShapeRecorder):
+        def forward(self, z):
+            if len(self.rows_seen) == 2:
+                raise RuntimeError('device lost')
+            return super().forward(z)
+    path = str(tmp_path / 'synthetic.csv')
+    with pytest.raises(RuntimeError):
+        generate_to_file(Failing(8, 4), transform, path, num_samples=500, noise_dim=8, batch_size=100)
+    assert not os.path.exists(path) and not os.path.exists(path + '.tmp')
+
+def test_zero_rows_writes_header(transform, tmp_path):
+    path = str(tmp_path / 'synthetic.parquet')
+    stats = generate_to_file(ShapeRecorder(8, 4), transform, path, num_samples=0, noise_dim=8)
+    assert stats['rows'] == 0
+    assert list(read_tabular_file(path).columns) == transform.feature_columns
+
+@pytest.mark.skipif(os.environ.get('RUN_PERF', '0') != '1', reason='perf test not requested')
+def test_streaming_generation_throughput(transform, tmp_path):
+    make_g = lambda n, d: nn.Sequential(nn.Linear(n, 128), nn.ReLU(), nn.Linear(128, d), nn.Sigmoid())
+    result = benchmark_streaming_generation(make_g, transform, str(tmp_path), num_samples=1_000_000)
+    assert result['streamed_array_bytes'] < result['one_shot_array_bytes'] / 10
+    assert result['speedup'] > 0.8, result
+
+def test_generation_does_not_import_the_vae_stack():
+    code = ('import sys, src.training.streaming_generation; '
+            'assert "src.models.synthetic_healthcare_data_pipeline" not in sys.modules; assert "opacus" not in sys.modules')
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
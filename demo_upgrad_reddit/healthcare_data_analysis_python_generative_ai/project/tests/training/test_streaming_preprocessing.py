@@ -0,0 +1,87 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from unittest import mock
+from sklearn.preprocessing import MinMaxScaler, LabelEncoder
+from src.training import streaming_preprocessing
+from src.training.streaming_preprocessing import TabularTransform, fit_streaming_transform, preprocess_streaming
+
+
+@pytest.fixture
+def raw_csv(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 257
+    df = pd.DataFrame({
+        'mrn': [f'MRN{i:05d}' for i in range(n)],
+        'age': rng.integers(18, 90, n),
+        'sex': rng.choice(['F', 'M'], n),
+        'dx': rng.choice(['E11', 'I10', 'J45', 'N18'], n),
+        'bmi': rng.normal(27, 5, n).round(1),
+        'readmit': rng.integers(0, 2, n),
+    })
+    path = tmp_path / 'raw.csv'
+    df.to_csv(path, index=False)
+    return str(path), df
+
+def test_chunked_fit_matches_in_memory_sklearn(raw_csv, tmp_path):
+    path, df = raw_csv
+    arr, transform = preprocess_streaming(
+        path, ['mrn'], ['sex', 'dx'], ['age', 'bmi'], str(tmp_path / 'pre.npy'), target_col='sex', chunksize=50
+    )
+    assert isinstance(arr, np.memmap) and arr.dtype == np.float32
+    assert transform.columns == ['age', 'dx', 'bmi', 'readmit', 'sex']
+    assert transform.feature_columns == ['age', 'dx', 'bmi', 'readmit']
+    expected = df.drop(columns=['mrn'])
+    for col in ('sex', 'dx'):
+        expected[col] = LabelEncoder().fit_transform(expected[col].astype(str))
+    expected[['age', 'bmi']] = MinMaxScaler().fit_transform(expected[['age', 'bmi']])
+    np.testing.assert_allclose(arr, expected[transform.columns].to_numpy(np.float32), rtol=1e-6, atol=1e-6)
+
+def test_inverse_frame_round_trips(raw_csv, tmp_path):
+    path, df = raw_csv
+    arr, transform = preprocess_streaming(path, ['mrn'], ['sex', 'dx'], ['age', 'bmi'], str(tmp_path / 'pre.npy'))
+    back = transform.inverse_frame(np.asarray(arr))
+    assert list(back['dx']) == list(df['dx'])
+    np.testing.assert_allclose(back['age'], df['age'], rtol=1e-5)
+    np.testing.assert_allclose(back['bmi'], df['bmi'], rtol=1e-5)
+    # Out-of-range generated codes clip to the valid classes
+    assert list(transform.decode_category('sex', np.array([-0.7, 0.4, 3.2]))) == ['F', 'F', 'M']
+
+def test_artifact_is_versioned_and_reused(raw_csv, tmp_path):
+    path, _ = raw_csv
+    out = str(tmp_path / 'pre.npy')
+    _, first = preprocess_streaming(path, ['mrn'], ['sex', 'dx'], ['age', 'bmi'], out)
+    with open(out + '.transform.json') as f:
+        saved = json.load(f)
+    assert saved['version'] == first.version and saved['n_rows'] == 257
+    # Neither pass re-reads the CSV
+    with mock.patch.object(streaming_preprocessing, '_read_chunks', side_effect=AssertionError('re-read')):
+        _, again = preprocess_streaming(path, ['mrn'], ['sex', 'dx'], ['age', 'bmi'], out)
+    assert again.version == first.version
+    loaded = TabularTransform.load(out + '.transform.json')
+    assert loaded.version == first.version
+    # Different column roles invalidate the cached transform
+    _, refit = preprocess_streaming(path, ['mrn'], ['sex', 'dx'], ['age', 'bmi'], out, target_col='readmit')
+    assert refit.version != first.version
+
+def test_tampered_artifact_is_rejected(raw_csv, tmp_path):
+    path, _ = raw_csv
+    out = str(tmp_path / 'pre.npy')
+    preprocess_streaming(path, ['mrn'], ['sex', 'dx'], ['age', 'bmi'], out)
+    with open(out + '.transform.json') as f:
+        saved = json.load(f)
+    saved['max']['age'] = 1000
+    with open(out + '.transform.json', 'w') as f:
+        json.dump(saved, f)
+    with pytest.raises(ValueError):
+        TabularTransform.load(out + '.transform.json')
+
+def test_unseen_category_raises(raw_csv):
+    path, df = raw_csv
+    transform = fit_streaming_transform(path, ['mrn'], ['sex', 'dx'], ['age', 'bmi'])
+    chunk = df.drop(columns=['mrn']).head(3).copy()
+    chunk.loc[0, 'dx'] = 'Z99'
+    with pytest.raises(ValueError, match='Z99'):
+        transform.transform_chunk(chunk)